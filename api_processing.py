@@ -7,28 +7,34 @@ This module manages calls to the OpenAI API, handles PDF content chunking, updat
 and integrates prompt management and summarization steps.
 """
 
-import os
 import json
 import requests
 import logging
 from logging.handlers import RotatingFileHandler  # Import RotatingFileHandler
 from os import getenv
 from dotenv import load_dotenv
-from flask import session
+from flask import session, has_request_context, copy_current_request_context
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Local imports
 from config import (
     OPENAI_API_KEY,
-    MAX_TOKENS_PER_CALL, 
     OPENAI_MODEL, 
+    OPENAI_MAX_OUTPUT_TOKENS,
     DEFAULT_project_type, 
-    ALLOWABLE_PROJECT_TYPES
+    ALLOWABLE_PROJECT_TYPES,
+    OPENAI_MAX_CONCURRENT_TABLE_GROUPS,
+    OPENAI_STREAM_RESPONSES
 )
-from pdf_processing import get_page_token_counts, get_pdf_content_by_page_indices
+from pdf_processing import load_pdf_document, PdfExtractionError
+from chunk_planner import plan_job, plan_report, format_plan_report
 from prompt_builder import PromptBuilder
-from file_manager import get_project_data_path, list_s3_directory_contents, write_file, list_project_data_files
+from file_manager import get_project_data_path, list_s3_directory_contents, write_file
 from upload_file_manager import count_tokens
+from openai_client import get_rate_limit_scheduler, iter_stream_events
+from structure_registry import get_structure_registry
+from prompt_audit import get_audit_sink
 
 #=============================================================
 # LOGGING CONFIGURATION
@@ -47,7 +53,7 @@ logging.getLogger("pdfplumber").setLevel(logging.WARNING)
 # FUNCTION DEFINITIONS
 #=============================================================
 
-def manage_api_calls(business_description, user_input, update_scope="all", file_name=None, prompt_manager=None, json_manager=None):
+def manage_api_calls(business_description, user_input, update_scope="all", file_name=None, prompt_manager=None, json_manager=None, on_text=None, on_progress=None, dry_run=False):
     NUMBER_OF_UPDATE_TABLES_PER_CALL = 2
     SEND_CONTEXT_TABLES_TO_OPENAI = False
     """
@@ -71,6 +77,13 @@ def manage_api_calls(business_description, user_input, update_scope="all", file_
         Required - manages prompts and tokens
     json_manager : JsonManager
         Required - handles JSON data
+    on_text : callable, optional
+        Called as on_text(text, group=n, tables=names) with each piece of response TEXT as it
+        streams in, where n is the 1-based table group and names its tables
+    on_progress : callable, optional
+        Called as on_progress(event_type, data) for job planning, per-group and per-chunk progress
+    dry_run : bool, optional
+        Plan the calls and return {"plan": report} (see chunk_planner.plan_report) without sending anything
 
     Returns
     -------
@@ -120,6 +133,9 @@ def manage_api_calls(business_description, user_input, update_scope="all", file_
     data_path = get_project_data_path()  # Error handling in initialize_and_check_external_utilities
     logging.debug(f"Retrieved data path: {data_path}")
 
+    # Every prompt and response of this job goes to one audit archive
+    prompt_manager.audit_archive = get_audit_sink().open_archive(data_path.rsplit('/', 1)[0])
+
     # Create the update and context tables data as a dictionary
     update_tables_data, context_tables_data = get_tables_data(data_path, json_manager, update_scope)
     logging.debug(f"Retrieved tables data - Update tables: {list(update_tables_data.keys())}")
@@ -128,38 +144,61 @@ def manage_api_calls(business_description, user_input, update_scope="all", file_
     logging.info(f"The update tables are: {list(update_tables_data.keys())}")
     logging.info(f"Here's the list of context tables: {list(context_tables_data.keys())}")
 
-    # Break the tables into groups of NUMBER_OF_UPDATE_TABLES_PER_CALL and find out the max token count for the group + the base prompt  + (optional) the context tables
-    max_table_group_token_count = get_table_group_token_list(update_tables_data, context_tables_data, business_description, NUMBER_OF_UPDATE_TABLES_PER_CALL, SEND_CONTEXT_TABLES_TO_OPENAI, prompt_manager)
-    logging.debug(f"Max table group token count: {max_table_group_token_count}")
-    
-    # Determine how many tokens remain for PDF content
-    available_tokens_for_pdf = MAX_TOKENS_PER_CALL - max_table_group_token_count
-    logging.debug(f"Available tokens for PDF content: {available_tokens_for_pdf}")
-    
-    if available_tokens_for_pdf <= 0:
-        logging.error("Not enough token space available for PDF content.")
-        return {"error": "Token limit exceeded without PDF content"}, 400
+    # Format and token-count every table once; each group and chunk reuses the blocks
+    prompt_manager.prepare_tables(update_tables_data, context_tables_data if SEND_CONTEXT_TABLES_TO_OPENAI else None)
 
-    chunk_list = process_pdf_into_chunks(file_name, available_tokens_for_pdf)
-    logging.debug(f"Generated chunk list with {len(chunk_list)} chunks")
-    logging.info(f"Chunk list: {chunk_list}")
+    # Download, extract and token-count the PDF once for the whole job
+    try:
+        pdf_document = load_pdf_document(file_name)
+    except PdfExtractionError as e:
+        return {"error": str(e)}, 500
+    if file_name and not pdf_document.pages:
+        logging.error(f"PDF {file_name} has no pages")
+        return {"error": f"PDF {file_name} has no pages"}, 400
+
+    # Pack the PDF pages separately for each group of NUMBER_OF_UPDATE_TABLES_PER_CALL tables,
+    # against what that group's own prompt leaves of the context window
+    table_groups = group_update_tables(list(update_tables_data.keys()), NUMBER_OF_UPDATE_TABLES_PER_CALL)
+    plans = plan_job(table_groups, pdf_document.chunk_token_counts, prompt_manager, include_context=SEND_CONTEXT_TABLES_TO_OPENAI)
+    report = plan_report(plans, pdf_document.chunk_token_counts)
+    logging.info(f"Call plan:\n{format_plan_report(report)}")
+
+    if dry_run:
+        return {"plan": report}, 200
+
+    if not report["fits"]:
+        oversized_pages = sorted({page_num + 1 for plan in plans for page_num in plan["oversized_pages"]})
+        if oversized_pages:
+            logging.error(f"PDF pages {oversized_pages} do not fit in a single call.")
+            return {"error": f"PDF pages {oversized_pages} are too large to send in a single call", "plan": report}, 400
+        logging.error("Not enough token space available for PDF content.")
+        return {"error": "Token limit exceeded without PDF content", "plan": report}, 400
 
-    # Example of logging dynamic data
-    page_groups = [{"start_page": chunk["start_page"], "end_page": chunk["end_page"], "token_count": chunk["token_count"]} for chunk in chunk_list]
-    logging.info(f"Here's the list of page groups and their associated counts: {page_groups}")
+    if on_progress:
+        on_progress("plan", {
+            "pages": len(pdf_document),
+            "chunks": report["calls"],
+            "tables": list(update_tables_data.keys()),
+            "tables_per_call": NUMBER_OF_UPDATE_TABLES_PER_CALL,
+            "groups": [{"tables": plan["tables"], "calls": plan["calls"]} for plan in plans]
+        })
 
     result, status_code = send_tables_and_chunks_to_openai(
-        chunk_list,
+        plans,
         update_tables_data,
         context_tables_data,
         business_description,
         prompt_manager,
         json_manager,
-        file_name,
-        NUMBER_OF_UPDATE_TABLES_PER_CALL,
-        SEND_CONTEXT_TABLES_TO_OPENAI
+        pdf_document,
+        SEND_CONTEXT_TABLES_TO_OPENAI,
+        on_text=on_text,
+        on_progress=on_progress
     )
     
+    # Fold this job's table updates into the project bundle (no-op for per-table files)
+    json_manager.compact_tables()
+
     # Add safety check before logging
     logging.debug(f"Final result status: {status_code}")
         
@@ -205,6 +244,9 @@ def initialize_and_check_external_utilities(prompt_manager, json_manager, projec
     return True
 
 def initialize_module_logging():
+    # Called on every run; with concurrent runs a handler per call would repeat every log line
+    if logging.getLogger(__name__).handlers:
+        return
     # Create a StreamHandler (logs to console)
     stream_handler = logging.StreamHandler()
     stream_handler.setLevel(logging.DEBUG)  # Set to DEBUG for more detailed logs
@@ -215,15 +257,13 @@ def initialize_module_logging():
 def get_tables_data(data_path, json_manager, update_scope="all"):
     logging.debug(f"Getting tables data from {data_path} with update_scope: {update_scope}")
     
-    # Use new function to get only data files
-    s3_files = list_project_data_files(data_path)
-    logging.debug(f"Retrieved data files: {s3_files}")
+    # Table names from the project's table store (data files or bundle)
+    all_tables = json_manager.list_tables(data_path)
+    logging.debug(f"Retrieved data tables: {all_tables}")
     
-    if not s3_files:
+    if not all_tables:
         logging.error("No table data files found.")
         return {"error": "No table data available"}
-        
-    all_tables = [os.path.splitext(os.path.basename(f))[0] for f in s3_files]
     
     # Determine which tables to update vs. use as context
     update_tables = all_tables if update_scope == "all" else [update_scope]
@@ -232,122 +272,33 @@ def get_tables_data(data_path, json_manager, update_scope="all"):
     logging.debug(f"Update tables: {update_tables}")
     logging.debug(f"Context tables: {context_tables}")
 
-    # Load JSON data for update and context tables
-    tables_data = {table: json_manager.load_json_data(table) for table in update_tables}
-    context_data = {table: json_manager.load_json_data(table) for table in context_tables}
+    # Load JSON data for update and context tables in one read
+    loaded_tables = json_manager.load_tables(update_tables + context_tables)
+    tables_data = {table: loaded_tables[table] for table in update_tables}
+    context_data = {table: loaded_tables[table] for table in context_tables}
     
     logging.debug(f"Loaded {len(tables_data)} update tables and {len(context_data)} context tables")
     return tables_data, context_data
 
-def get_table_group_token_list(update_tables_data, context_tables_data, business_description, NUMBER_OF_UPDATE_TABLES_PER_CALL, SEND_CONTEXT_TABLES_TO_OPENAI, prompt_builder):
-    """
-    Creates groups of table indices and their token counts based on update table limits.
-
-    Parameters
-    ----------
-    update_tables_data : dict
-        Dictionary of tables that need to be updated
-    context_tables_data : dict 
-        Dictionary of tables providing context
-    NUMBER_OF_UPDATE_TABLES_PER_CALL : int
-        Maximum number of tables to update per API call
-    SEND_CONTEXT_TABLES_TO_OPENAI : bool
-        Whether to include context tables in token count
-    prompt_builder : PromptBuilder
-        Instance of PromptBuilder to get static prompt tokens
-
-    Returns
-    -------
-    list
-        List of tuples containing (start_idx, end_idx, token_count) for each group
-    """
-    logging.debug("Starting get_table_group_token_list calculation")
-    
-    table_groups = []
-    update_tables = list(update_tables_data.keys())
-    logging.debug(f"Processing {len(update_tables)} update tables")
-    
-    # Calculate total token count from context tables
-    context_token_count = 0
-    for table_name, table_data in context_tables_data.items():
-        table_tokens = count_tokens(json.dumps(table_data))
-        context_token_count += table_tokens
-        logging.debug(f"Context table {table_name} token count: {table_tokens}")
-
-    # Get static prompt token count
-    static_prompt_tokens = count_tokens(prompt_builder.system_prompt) if prompt_builder.system_prompt else 0
-    user_prompt_tokens = count_tokens(prompt_builder.user_prompt) if prompt_builder.user_prompt else 0 
-    business_description_tokens = count_tokens(business_description) if business_description else 0
-    
-    logging.debug(f"Static prompt tokens: {static_prompt_tokens}")
-    logging.debug(f"User prompt tokens: {user_prompt_tokens}")
-    logging.debug(f"Business description tokens: {business_description_tokens}")
-
-    # Group update tables
-    for i in range(0, len(update_tables), NUMBER_OF_UPDATE_TABLES_PER_CALL):
-        end_idx = min(i + NUMBER_OF_UPDATE_TABLES_PER_CALL, len(update_tables))
-        group_token_count = static_prompt_tokens + user_prompt_tokens + business_description_tokens 
-        
-        # Add token count for tables in this group
-        for j in range(i, end_idx):
-            table_name = update_tables[j]
-            table_tokens = count_tokens(json.dumps(update_tables_data[table_name]))
-            group_token_count += table_tokens
-            logging.debug(f"Update table {table_name} token count: {table_tokens}")
-        
-        # Add context token count if enabled
-        if SEND_CONTEXT_TABLES_TO_OPENAI:
-            group_token_count += context_token_count
-            logging.debug(f"Added context token count: {context_token_count}")
-            
-        table_groups.append((i, end_idx - 1, group_token_count))
-        logging.debug(f"Created group {len(table_groups)}: {(i, end_idx - 1, group_token_count)}")
-        
-    logging.info(f"Table groups: {table_groups}")
-    max_tokens = max(group[2] for group in table_groups) if table_groups else 0
-    return max_tokens
-    
-def process_pdf_into_chunks(file_name, available_tokens_for_pdf):
-    logging.info(f"Processing PDF: {file_name}")
-    page_token_counts = get_page_token_counts(file_name) if file_name else []
-
-    logging.info(f"Processing PDF into chunks. Total pages: {len(page_token_counts)}")
-    # Chunk the PDF pages to fit into available token space
-    chunk_list = []
-    active_chunk = {"start_page": 0, "end_page": 0, "token_count": 0}
-    
-    chunk_summary = []
-    for page_num, token_count in enumerate(page_token_counts):
-        # If adding this page fits within the token budget for current chunk
-        if active_chunk['token_count'] + token_count < available_tokens_for_pdf:
-            active_chunk['end_page'] = page_num
-            active_chunk['token_count'] += token_count
-        else:
-            # Start a new chunk since adding this page would exceed the limit
-            chunk_list.append(active_chunk)
-            chunk_summary.append(f"Chunk {len(chunk_list)}: Pages {active_chunk['start_page']}-{active_chunk['end_page']} ({active_chunk['token_count']} tokens)")
-            active_chunk = {"start_page": page_num, "end_page": page_num, "token_count": token_count}
-
-        # If it's the final page, push the last chunk
-        if page_num == len(page_token_counts) - 1:
-            chunk_list.append(active_chunk)
-            chunk_summary.append(f"Chunk {len(chunk_list)}: Pages {active_chunk['start_page']}-{active_chunk['end_page']} ({active_chunk['token_count']} tokens)")
-    
-    logging.info("PDF chunk summary:\n" + "\n".join(chunk_summary))
-            
-    logging.info(f"Created {len(chunk_list)} chunks from PDF")
-    return chunk_list
+def group_update_tables(update_table_names, tables_per_call):
+    """Split the update tables into groups of at most tables_per_call, in order."""
+    return [
+        update_table_names[i : i + tables_per_call]
+        for i in range(0, len(update_table_names), tables_per_call)
+    ]
 
 def send_tables_and_chunks_to_openai(
-    chunk_list,
+    plans,
     update_tables_data,
     context_tables_data,
     business_description,
     prompt_manager,
     json_manager,
-    file_name=None,
-    number_tables_per_call=2,
-    send_context_tables=False
+    pdf_document=None,
+    send_context_tables=False,
+    max_concurrent_groups=OPENAI_MAX_CONCURRENT_TABLE_GROUPS,
+    on_text=None,
+    on_progress=None
 ):
     result = {
         "success": True,
@@ -356,69 +307,58 @@ def send_tables_and_chunks_to_openai(
         "errors": []
     }
 
-    logging.info(f"Starting OpenAI processing with {len(chunk_list)} chunks and {len(update_tables_data)} tables")
-    all_update_table_names = list(update_tables_data.keys())
-    
-    # Process table subsets
-    for i in range(0, len(all_update_table_names), number_tables_per_call):
-        subset_names = all_update_table_names[i : i + number_tables_per_call]
-        logging.info(f"Processing table subset {i//number_tables_per_call + 1}/{(len(all_update_table_names) + number_tables_per_call - 1)//number_tables_per_call}: {subset_names}")
-
-        try:
-            current_subset_data = {name: update_tables_data[name] for name in subset_names}
-            logging.debug(f"[send_tables_and_chunks_to_openai] Processing tables: {list(current_subset_data.keys())}")
-
-            # Reset and prepare prompt manager
-            prompt_manager.reset_prompts()
-            prompt_manager.load_static_prompt_file()
-            prompt_manager.update_system_prompt_info(
-                update_tables=current_subset_data,
-                context_tables=context_tables_data if send_context_tables else None,
-                business_description=business_description
-            )
-
-            # Process chunks for this table subset
-            chunk_success = False
-            for chunk_idx, chunk_dict in enumerate(chunk_list):
-                try:
-                    start_page = chunk_dict.get("start_page", None)
-                    end_page = chunk_dict.get("end_page", None)
-                    chunk_text = ""
-                    if file_name and start_page is not None and end_page is not None:
-                        chunk_text = get_pdf_content_by_page_indices(file_name, start_page, end_page)
-
-                    if chunk_text:
-                        prompt_manager.add_pdf_chunk(chunk_text)
-
-                    response, status_code = manage_call_for_payload(
-                        pdf_chunk=chunk_text,
-                        page_start=start_page,
-                        page_end=end_page,
-                        json_manager=json_manager,
-                        prompt_manager=prompt_manager
-                    )
-
-                    if status_code == 200:
-                        result["data"]["text"] += response.get("text", "")
-                        result["data"]["json_data"].update(response.get("JSONData", {}))
-                        chunk_success = True
-                        logging.debug(f"Successfully processed chunk {chunk_idx + 1} for tables {subset_names}")
-                    else:
-                        logging.error(f"API call failed for chunk {chunk_idx + 1} with status {status_code}")
-                        result["errors"].append(f"Failed to process chunk {chunk_idx + 1} for tables {subset_names}")
-                except Exception as e:
-                    logging.error(f"Error processing chunk {chunk_idx + 1} for tables {subset_names}: {str(e)}")
-                    result["errors"].append(f"Error in chunk {chunk_idx + 1} for tables {subset_names}: {str(e)}")
-                    continue
-
-            if not chunk_success:
-                logging.error(f"All chunks failed for table subset {subset_names}")
-                result["errors"].append(f"Failed to process any chunks for tables {subset_names}")
+    # One plan per table group (see chunk_planner.py), each with its own page chunks
+    table_groups = [plan["tables"] for plan in plans]
+    logging.info(f"Starting OpenAI processing with {sum(plan['calls'] for plan in plans)} calls and {len(update_tables_data)} tables")
+
+    def run_group(group_idx, subset_names):
+        # Each group gets its own PromptBuilder so concurrent groups never share prompt state
+        logging.info(f"Processing table subset {group_idx + 1}/{len(table_groups)}: {subset_names}")
+        if on_progress:
+            on_progress("group_started", {"group": group_idx + 1, "groups": len(table_groups), "tables": subset_names})
+        # Groups may stream side by side, so every piece of TEXT says which group it belongs to
+        group_on_text = (
+            (lambda text: on_text(text, group=group_idx + 1, tables=subset_names)) if on_text else None
+        )
+        group_result = process_table_group(
+            subset_names,
+            plans[group_idx]["chunks"],
+            update_tables_data,
+            context_tables_data if send_context_tables else None,
+            business_description,
+            prompt_manager.clone(),
+            json_manager,
+            pdf_document,
+            on_text=group_on_text,
+            on_progress=on_progress
+        )
+        if on_progress:
+            on_progress("group_completed", {
+                "group": group_idx + 1,
+                "groups": len(table_groups),
+                "tables": subset_names,
+                "errors": len(group_result["errors"])
+            })
+        return group_result
+
+    # Table groups don't depend on each other's output, so they can run side by side
+    if max_concurrent_groups > 1 and len(table_groups) > 1:
+        def group_task():
+            # A fresh copy of the request context for every group: a single copy pushed from several
+            # threads shares its context tokens, and popping them out of order raises ValueError
+            return copy_current_request_context(run_group) if has_request_context() else run_group
+
+        with ThreadPoolExecutor(max_workers=min(max_concurrent_groups, len(table_groups))) as executor:
+            futures = [executor.submit(group_task(), idx, names) for idx, names in enumerate(table_groups)]
+            group_results = [future.result() for future in futures]
+    else:
+        group_results = [run_group(idx, names) for idx, names in enumerate(table_groups)]
 
-        except Exception as e:
-            logging.error(f"Error processing table subset {subset_names}: {str(e)}")
-            result["errors"].append(f"Failed to process table subset {subset_names}: {str(e)}")
-            continue
+    # Merge in group order so the result matches the sequential path exactly
+    for group_result in group_results:
+        result["data"]["text"] += group_result["text"]
+        result["data"]["json_data"].update(group_result["json_data"])
+        result["errors"].extend(group_result["errors"])
 
     # Final processing
     if result["errors"]:
@@ -431,8 +371,95 @@ def send_tables_and_chunks_to_openai(
     return result, 200 if result["success"] else 500
 
 
+def process_table_group(
+    subset_names,
+    chunk_list,
+    update_tables_data,
+    context_tables_data,
+    business_description,
+    prompt_manager,
+    json_manager,
+    pdf_document=None,
+    on_text=None,
+    on_progress=None
+):
+    """
+    Send every PDF chunk to OpenAI for one group of update tables.
 
-def manage_call_for_payload(pdf_chunk, page_start, page_end, json_manager, prompt_manager, project_type=None):
+    Returns
+    -------
+    dict
+        {"text": str, "json_data": dict, "errors": list} for this group only.
+    """
+    group_result = {"text": "", "json_data": {}, "errors": []}
+
+    try:
+        logging.debug(f"[process_table_group] Processing tables: {subset_names}")
+
+        # The static prompt, business description and table blocks were built once for the
+        # job; only this group's table selection and each chunk change from here on
+        if prompt_manager.table_blocks is None:
+            prompt_manager.prepare_tables(update_tables_data, context_tables_data)
+        prompt_manager.set_table_group(subset_names, include_context=context_tables_data is not None)
+
+        # Process chunks for this table subset
+        chunk_success = False
+        for chunk_idx, chunk_dict in enumerate(chunk_list):
+            try:
+                start_page = chunk_dict.get("start_page", None)
+                end_page = chunk_dict.get("end_page", None)
+                chunk_text = ""
+                if pdf_document and start_page is not None and end_page is not None:
+                    # end_page is inclusive; get_content_by_page_indices takes an exclusive end
+                    chunk_text = pdf_document.get_content_by_page_indices(start_page, end_page + 1)
+
+                # Replaces the previous chunk rather than appending to it
+                prompt_manager.set_pdf_chunk(chunk_text)
+
+                response, status_code = manage_call_for_payload(
+                    pdf_chunk=chunk_text,
+                    page_start=start_page,
+                    page_end=end_page,
+                    json_manager=json_manager,
+                    prompt_manager=prompt_manager,
+                    on_text=on_text
+                )
+
+                if on_progress:
+                    on_progress("chunk_completed", {
+                        "tables": subset_names,
+                        "chunk": chunk_idx + 1,
+                        "chunks": len(chunk_list),
+                        "status": status_code,
+                        "usage": response.get("usage", {})
+                    })
+
+                if status_code == 200:
+                    group_result["text"] += response.get("text", "")
+                    group_result["json_data"].update(response.get("JSONData", {}))
+                    chunk_success = True
+                    logging.debug(f"Successfully processed chunk {chunk_idx + 1} for tables {subset_names}")
+                else:
+                    logging.error(f"API call failed for chunk {chunk_idx + 1} with status {status_code}")
+                    group_result["errors"].append(f"Failed to process chunk {chunk_idx + 1} for tables {subset_names}")
+            except Exception as e:
+                logging.error(f"Error processing chunk {chunk_idx + 1} for tables {subset_names}: {str(e)}")
+                group_result["errors"].append(f"Error in chunk {chunk_idx + 1} for tables {subset_names}: {str(e)}")
+                continue
+
+        if not chunk_success:
+            logging.error(f"All chunks failed for table subset {subset_names}")
+            group_result["errors"].append(f"Failed to process any chunks for tables {subset_names}")
+
+    except Exception as e:
+        logging.error(f"Error processing table subset {subset_names}: {str(e)}")
+        group_result["errors"].append(f"Failed to process table subset {subset_names}: {str(e)}")
+
+    return group_result
+
+
+
+def manage_call_for_payload(pdf_chunk, page_start, page_end, json_manager, prompt_manager, project_type=None, on_text=None):
     """
     Handles a single API call payload which may consist of multiple pages (a chunk).
 
@@ -450,6 +477,8 @@ def manage_call_for_payload(pdf_chunk, page_start, page_end, json_manager, promp
         Handles prompt construction and token counts.
     project_type : str, optional
         The project type, if needed.
+    on_text : callable, optional
+        Called with each piece of response TEXT as it streams in.
 
     Returns
     -------
@@ -466,15 +495,31 @@ def manage_call_for_payload(pdf_chunk, page_start, page_end, json_manager, promp
     system_prompt = prompt_manager.get_system_prompt()
     user_prompt = prompt_manager.get_user_prompt()
 
+    # Parse the JSON section as soon as it has streamed in, while the summary is still arriving
+    early_json = {}
+
+    def on_json(json_part_raw):
+        try:
+            early_json["data"] = process_json_section(json_part_raw, json_manager, prompt_manager.update_table_names)
+        except (json.JSONDecodeError, ValueError) as e:
+            logging.debug(f"Early JSON parse failed, deferring to full response: {e}")
+
     # Make the API call with the current prompts
-    raw_response, status_code = make_openai_api_call(system_prompt=system_prompt, user_prompt=user_prompt)
+    raw_response, status_code = make_openai_api_call(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        on_text=on_text,
+        on_json=on_json,
+        prompt_tokens=prompt_manager.get_token_count('system') + prompt_manager.get_token_count('user')
+    )
     
     if status_code != 200:
         logging.error(f"API call failed with status {status_code}: {raw_response}")
         return {"error": "API call failed"}, status_code
 
     # Process and handle the OpenAI response
-    processed_response, _ = handle_openai_response(raw_response, json_manager, prompt_manager)
+    processed_response, _ = handle_openai_response(raw_response, json_manager, prompt_manager, processed_json=early_json.get("data"))
+    processed_response["usage"] = raw_response.get("usage", {})
     json_data = processed_response.get("JSONData", {})
     
     json_manager.update_json_files(json_data)
@@ -483,7 +528,7 @@ def manage_call_for_payload(pdf_chunk, page_start, page_end, json_manager, promp
     return processed_response, status_code
 
 
-def make_openai_api_call(system_prompt, user_prompt):
+def make_openai_api_call(system_prompt, user_prompt, on_text=None, on_json=None, stream=OPENAI_STREAM_RESPONSES, prompt_tokens=None):
     """
     Makes an API call to OpenAI's chat completion endpoint.
 
@@ -493,11 +538,20 @@ def make_openai_api_call(system_prompt, user_prompt):
         The system-level prompt content.
     user_prompt : str
         The user's prompt content.
+    on_text : callable, optional
+        Streaming only. Called with each new piece of the TEXT section.
+    on_json : callable, optional
+        Streaming only. Called with the raw JSON section once its END marker arrives.
+    stream : bool, optional
+        Stream the completion and parse sections incrementally.
+    prompt_tokens : int, optional
+        Token count of both prompts, if already known. Counted here otherwise.
 
     Returns
     -------
     tuple (dict, int)
-        The OpenAI response JSON and HTTP status code.
+        The OpenAI response JSON and HTTP status code. Streamed responses are
+        reassembled into the same shape as a non-streamed completion.
     """
     logging.debug("Starting OpenAI API call")
     
@@ -511,13 +565,11 @@ def make_openai_api_call(system_prompt, user_prompt):
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ],
-        "max_tokens": 5000
-    }
-
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json'
+        "max_tokens": OPENAI_MAX_OUTPUT_TOKENS
     }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
 
     # If system prompt is missing, return an error
     if not system_prompt:
@@ -527,22 +579,163 @@ def make_openai_api_call(system_prompt, user_prompt):
     # Perform the API request
     try:
         logging.debug(f"[{datetime.now().strftime('%H:%M:%S')}] Sending request to OpenAI API")
-        response = requests.post('https://api.openai.com/v1/chat/completions', headers=headers, json=payload)
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(system_prompt) + count_tokens(user_prompt)
+        estimated_tokens = prompt_tokens + payload["max_tokens"]
+        response = get_rate_limit_scheduler().send(payload, estimated_tokens, stream=stream)
         logging.debug(f"[{datetime.now().strftime('%H:%M:%S')}] Received response with status code: {response.status_code}")
         
         if response.status_code == 200:
+            if stream:
+                return read_streamed_completion(response, ResponseSectionParser(on_text=on_text, on_json=on_json)), 200
             return response.json(), 200
         else:
             logging.error(f"OpenAI API call failed with status {response.status_code}: {response.text}")
             return {"error": "OpenAI API call failed", "details": response.text}, response.status_code
+    except requests.exceptions.Timeout as e:
+        logging.error(f"OpenAI API request timed out: {e}")
+        return {"error": "Request timed out", "details": str(e)}, 504
     except requests.exceptions.RequestException as e:
         logging.error(f"Error during API request: {e}")
         return {"error": "Request failed", "details": str(e)}, 500
 
 
-def handle_openai_response(response, json_manager, prompt_manager):
+def read_streamed_completion(response, parser):
+    """
+    Consume a streaming chat completion, feeding each content delta to the parser.
+
+    Returns
+    -------
+    dict
+        The completion in the non-streamed response shape, so handle_openai_response
+        works unchanged.
+    """
+    completion = {"choices": [{"index": 0, "message": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    try:
+        for event in iter_stream_events(response):
+            for key in ("id", "model", "created"):
+                if key in event:
+                    completion[key] = event[key]
+            if event.get("usage"):
+                completion["usage"] = event["usage"]
+            for choice in event.get("choices", []):
+                delta = choice.get("delta", {}).get("content")
+                if delta:
+                    parser.feed(delta)
+                if choice.get("finish_reason"):
+                    completion["choices"][0]["finish_reason"] = choice["finish_reason"]
+    finally:
+        response.close()
+
+    completion["choices"][0]["message"]["content"] = parser.content
+    return completion
+
+
+class ResponseSectionParser:
+    """
+    Incrementally splits a streamed AI response into its TEXT, JSON and SUMMARY sections.
+
+    TEXT is forwarded through on_text as it arrives. Characters that could be the
+    start of the TEXT END marker are held back until the next delta shows they aren't.
+    The raw JSON section is handed to on_json as soon as its END marker streams in.
+    """
+
+    TEXT_START = '### TEXT START ###'
+    TEXT_END = '### TEXT END ###'
+    JSON_START = '---JSON START---'
+    JSON_END = '---JSON END---'
+
+    def __init__(self, on_text=None, on_json=None):
+        self.on_text = on_text
+        self.on_json = on_json
+        self.content = ''
+        self._text_emitted = None  # Index into content up to which TEXT has been forwarded
+        self._text_started = False
+        self._text_done = False
+        self._json_done = False
+
+    def feed(self, delta):
+        self.content += delta
+        if self.on_text and not self._text_done:
+            self._forward_text()
+        if not self._json_done:
+            self._check_json()
+
+    def _forward_text(self):
+        if self._text_emitted is None:
+            start = self.content.find(self.TEXT_START)
+            if start == -1:
+                return
+            self._text_emitted = start + len(self.TEXT_START)
+
+        end = self.content.find(self.TEXT_END, self._text_emitted)
+        if end != -1:
+            self._text_done = True
+            safe_end = end
+        else:
+            safe_end = len(self.content) - (len(self.TEXT_END) - 1)
+
+        if safe_end > self._text_emitted:
+            text = self.content[self._text_emitted:safe_end]
+            self._text_emitted = safe_end
+            # Drop the whitespace between the START marker and the first text
+            if not self._text_started:
+                text = text.lstrip()
+                self._text_started = bool(text)
+            if text:
+                self.on_text(text)
+
+    def _check_json(self):
+        end = self.content.find(self.JSON_END)
+        if end == -1:
+            return
+        self._json_done = True
+        start = self.content.find(self.JSON_START)
+        if self.on_json and start != -1 and start < end:
+            self.on_json(self.content[start + len(self.JSON_START):end].strip())
+
+
+def process_json_section(json_part_raw, json_manager, table_names=None):
+    """
+    Parse the raw JSON section of an AI response and map any root_keys back to their table names.
+    When several tables share a root_key, the one in table_names (the tables being updated) wins.
+
+    Raises
+    ------
+    json.JSONDecodeError
+        If the section can't be parsed even after fixing missing brackets.
+    """
+    # Attempt to fix and parse JSON part
+    json_part = json_manager.fix_incomplete_json(json_part_raw)
+    parsed_data = json.loads(json_part)
+
+    # Restructure the data if needed based on structure files
+    structure_registry = get_structure_registry()
+    processed_data = {}
+    for key, value in parsed_data.items():
+        # Handle both cases: direct table name or root_key
+        try:
+            table_name = structure_registry.resolve_key(key, table_names)
+            if table_name == key:
+                # If key is a table name, use it directly
+                processed_data[key] = value
+            elif table_name:
+                # Found the table this root_key belongs to
+                processed_data[table_name] = {key: value}
+                logging.debug(f"Mapped root_key '{key}' to table '{table_name}'")
+            else:
+                logging.warning(f"Ignoring unknown key in AI response: {key}")
+        except Exception as e:
+            logging.error(f"Error processing structure for key {key}: {e}")
+            processed_data[key] = value  # Fall back to original key if error
+
+    return processed_data
+
+
+def handle_openai_response(response, json_manager, prompt_manager, processed_json=None):
     """
     Parses and processes the OpenAI API response. Extracts text, JSON data, and summary.
+    If the JSON section was already parsed while the response streamed in, pass it as processed_json.
     """
     logging.debug("Starting to handle OpenAI response")
     
@@ -553,7 +746,7 @@ def handle_openai_response(response, json_manager, prompt_manager):
         return {"error": "No usable content in response"}, 400
     
     # Save the unprocessed JSON data
-    json_manager.save_json_to_file(response)
+    json_manager.save_json_to_file(response, prompt_manager.audit_archive)
 
     try:
         # Extract TEXT, JSON, and SUMMARY parts from AI response
@@ -565,40 +758,10 @@ def handle_openai_response(response, json_manager, prompt_manager):
         prompt_manager.update_summary(running_summary)
         logging.debug("Updated running summary in prompt manager")
 
-        # Attempt to fix and parse JSON part
-        json_part = json_manager.fix_incomplete_json(json_part_raw)
-        parsed_data = json.loads(json_part)
-
-        
-
-        # Restructure the data if needed based on structure files
-        processed_data = {}
-        for key, value in parsed_data.items():
-            # Handle both cases: direct table name or root_key
-            try:
-                structure_file = f"static/json_structure_data/{key}_structure.json"
-                if os.path.exists(structure_file):
-                    # If key is a table name, use it directly
-                    processed_data[key] = value
-                else:
-                    # Check if this is a root_key, find corresponding table name
-                    for struct_file in os.listdir("static/json_structure_data"):
-                        if struct_file.endswith("_structure.json"):
-                            with open(f"static/json_structure_data/{struct_file}") as f:
-                                structure = json.load(f)
-                                table_name = next(iter(structure))
-                                if structure[table_name].get('root_key') == key:
-                                    # Found the table this root_key belongs to
-                                    processed_data[table_name] = {key: value}
-                                    logging.debug(f"Mapped root_key '{key}' to table '{table_name}'")
-                                    break
-            except Exception as e:
-                logging.error(f"Error processing structure for key {key}: {e}")
-                processed_data[key] = value  # Fall back to original key if error
-
-
+        if processed_json is None:
+            processed_json = process_json_section(json_part_raw, json_manager, prompt_manager.update_table_names)
 
-        return {"text": text_part, "JSONData": processed_data}, 200
+        return {"text": text_part, "JSONData": processed_json}, 200
     except (json.JSONDecodeError, IndexError, ValueError) as e:
         logging.error(f"Error parsing OpenAI response: {e}")
         return {"error": "Failed to parse JSON from AI response"}, 400
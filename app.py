@@ -4,27 +4,29 @@ import io
 import sys
 from dotenv import load_dotenv
 import json
+import queue
+import threading
 from datetime import datetime as dt
 from datetime import timedelta
-from flask import Flask, request, jsonify, render_template, send_file, g, session
+from flask import Flask, request, jsonify, render_template, send_file, g, session, Response, stream_with_context, copy_current_request_context
 from flask_session import Session
-import boto3
 import uuid
+import mimetypes
 # Internal module imports
 from user_management import *
 import api_processing
-from excel_generation.auto_financial_modeling import generate_excel_model
 from json_manager import JsonManager
 from file_manager import *
 from session_info_manager import SessionInfoManager
+from job_manager import JobManager, register_job_handler, job_to_dict, run_worker_pool, SUCCEEDED, FAILED
+from output_manager import (
+    generate_output, render_output, store_output_in_background, validate_output_request,
+    lookup_output, remember_output, OutputGenerationError
+)
 from prompt_builder import PromptBuilder
-from excel_generation.catalyst_partners_page import make_catalyst_summary
-from powerpoint_generation.ppt_financial import generate_ppt
-from powerpoint_generation.ppt_fund_analysis import generate_fund_analysis_ppt
-from powerpoint_generation.ppt_real_estate import generate_real_estate_ppt
+from project_bootstrap import bootstrap_project
 from config import (  
     DEVELOPMENT_ENVIRONMENT,
-    ALLOWABLE_PROJECT_TYPES, 
     OUTPUTS_FOR_PROJECT_TYPE,
     LOCAL_PORT,
     HOSTED_PORT
@@ -69,9 +71,12 @@ def create_app():
     app.config['user_management'] = user_management
 
     # Initialize core services
+    # JsonManager is stateless and shared. PromptBuilders hold one job's prompt state,
+    # so each /api/openai request or openai job builds its own (see new_prompt_builder).
     app.config['json_manager'] = JsonManager()
-    app.config['prompt_manager'] = PromptBuilder(app.config['json_manager'])
     app.config['session_info_manager'] = SessionInfoManager()
+    # Queues jobs only; the workers run in job_worker.py (or below, for `python app.py`)
+    app.config['job_manager'] = JobManager()
 
     Session(app)  # Initialize the extension
 
@@ -81,6 +86,52 @@ def create_app():
 
 app = create_app()
 
+
+def new_prompt_builder():
+    """
+    A PromptBuilder for one request or job. Read-only data it draws on (prompt
+    files through the object cache, the structure registry, token counts) is
+    cached process-wide, so a fresh builder costs no extra parsing.
+    """
+    return PromptBuilder(app.config['json_manager'])
+
+#=============================================================
+# BACKGROUND JOB HANDLERS
+#=============================================================
+# These run in the job worker processes, inside a request context rebuilt
+# from the session of the request that queued the job.
+@register_job_handler("openai")
+def run_openai_job(params, job):
+    """Run an OpenAI extraction, publishing progress and partial TEXT as job events."""
+    response_data, status_code = api_processing.manage_api_calls(
+        business_description=params.get('businessDescription'),
+        user_input=params.get('userPrompt'),
+        update_scope=params.get('updateScope'),
+        file_name=params.get('fileName'),
+        prompt_manager=new_prompt_builder(),
+        json_manager=app.config['json_manager'],
+        on_text=lambda text, group, tables: job.publish("text", {"text": text, "group": group, "tables": tables}),
+        on_progress=job.publish
+    )
+    if "error" in response_data:
+        raise RuntimeError(response_data["error"])
+    return {
+        "text": response_data.get("data", {}).get("text", ""),
+        "errors": response_data.get("errors", [])
+    }
+
+
+@register_job_handler("output")
+def run_output_job(params, job):
+    """Generate an Excel or PowerPoint output and return its S3 path."""
+    project_type = session['current_project']['type']
+    job.publish("progress", {"message": f"Generating {params['type']}"})
+    file_path = generate_output(params['type'], project_type)
+    if not file_path:
+        raise RuntimeError(f"No file was generated for {params['type']}")
+    return {"file_path": file_path}
+
+
 #=============================================================
 # SESSION MANAGEMENT
 #=============================================================
@@ -157,20 +208,158 @@ def call_openai():
     logging.info("\n\n\n----OpenAI Call----")
     """Handle requests to the OpenAI API."""
     data = request.json
-    prompt_manager = app.config['prompt_manager']
-    
-    response_data, status_code = api_processing.manage_api_calls(
-        business_description=data.get('businessDescription'),
-        user_input=data.get('userPrompt'),
-        update_scope=data.get('updateScope'),
-        file_name=data.get('fileName'),
-        prompt_manager=prompt_manager,
-        json_manager=app.config['json_manager']
-    )
+    # Per-request prompt state, so concurrent requests on threaded or async workers never share it
+    prompt_manager = new_prompt_builder()
+
+    def run_api_calls(on_text=None, on_progress=None, dry_run=False):
+        return api_processing.manage_api_calls(
+            business_description=data.get('businessDescription'),
+            user_input=data.get('userPrompt'),
+            update_scope=data.get('updateScope'),
+            file_name=data.get('fileName'),
+            prompt_manager=prompt_manager,
+            json_manager=app.config['json_manager'],
+            on_text=on_text,
+            on_progress=on_progress,
+            dry_run=dry_run
+        )
+
+    if data.get('dryRun'):
+        # Plan the calls and report their tokens and estimated cost without sending anything
+        response_data, status_code = run_api_calls(dry_run=True)
+        return jsonify(response_data), status_code
+
+    if data.get('background'):
+        # Queue the extraction as a job and follow it through /api/jobs/<job_id>/events
+        params = {key: data.get(key) for key in ('businessDescription', 'userPrompt', 'updateScope', 'fileName')}
+        job, _ = app.config['job_manager'].submit("openai", params)
+        return jsonify(job_response(job)), 202
+
+    if data.get('stream'):
+        # Forward the run to the caller as server-sent events, in the same format as job events:
+        # "text" events carry their table group, progress events follow the run, and the stream
+        # always ends with a "done" event holding the final status (preceded by "error" on failure)
+        event_queue = queue.Queue()
+
+        def publish(event_type, event_data=None):
+            event_queue.put((event_type, event_data or {}))
+
+        @copy_current_request_context
+        def worker():
+            response_data, status_code = {}, 500
+            try:
+                response_data, status_code = run_api_calls(
+                    on_text=lambda text, group, tables: publish("text", {"text": text, "group": group, "tables": tables}),
+                    on_progress=publish
+                )
+                if status_code != 200:
+                    publish("error", {
+                        "error": response_data.get("error") or response_data.get("message"),
+                        "status_code": status_code
+                    })
+            except Exception as e:
+                logging.error(f"[call_openai] Streaming run failed: {str(e)}", exc_info=True)
+                response_data = {"error": str(e)}
+                publish("error", {"error": str(e), "status_code": status_code})
+            finally:
+                publish("done", {
+                    "status": "succeeded" if status_code == 200 else "failed",
+                    "status_code": status_code,
+                    "error": response_data.get("error"),
+                    "errors": response_data.get("errors", [])
+                })
+
+        threading.Thread(target=worker, daemon=True).start()
+
+        def generate(heartbeat_seconds=15):
+            event_id = 0
+            while True:
+                try:
+                    event_type, event_data = event_queue.get(timeout=heartbeat_seconds)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id += 1
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(event_data)}\n\n"
+                if event_type == "done":
+                    return
+
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    response_data, status_code = run_api_calls()
 
     return jsonify({"text": response_data.get("text", "")}), status_code
 
 
+#=============================================================
+# ROUTES: BACKGROUND JOBS
+#=============================================================
+def job_response(job):
+    """Job status plus the URLs a client uses to follow it."""
+    response = job_to_dict(job)
+    response["status_url"] = f"/api/jobs/{job['id']}"
+    response["events_url"] = f"/api/jobs/{job['id']}/events"
+    response["result_url"] = f"/api/jobs/{job['id']}/result"
+    return response
+
+
+def get_owned_job(job_id):
+    """Return the job if it belongs to the current user, otherwise None."""
+    job = app.config['job_manager'].get(job_id)
+    if job is None or job['owner'] != session['user']['username']:
+        return None
+    return job
+
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Get the status of a background job."""
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job not found: {job_id}"}), 404
+    return jsonify(job_response(job)), 200
+
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Stream a background job's progress as server-sent events: status changes,
+    plan, per-group and per-chunk progress with token usage, partial TEXT and a
+    final done event. Reconnecting clients resume after the Last-Event-ID header.
+    """
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job not found: {job_id}"}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or 0
+    response = Response(app.config['job_manager'].iter_events(job_id, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    """
+    Get the result of a finished job. Output jobs return the generated file as a
+    download; other jobs return their JSON result.
+    """
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job not found: {job_id}"}), 404
+    if job['status'] == FAILED:
+        return jsonify({"error": job['error'], "job": job_to_dict(job)}), 500
+    if job['status'] != SUCCEEDED:
+        return jsonify(job_response(job)), 202
+
+    if job['kind'] == 'output':
+        return send_output_file(job['result']['file_path'], job['params']['type'])
+    return jsonify(job['result']), 200
+
+
 @app.route('/api/table_data/<table_identifier>', methods=['GET'])
 def get_table_data(table_identifier):
     """
@@ -203,9 +392,8 @@ def clear_all_data():
     logging.info("\n\n----Clear Data----\n\n")
     logging.debug(f"Call to clear all data. Missing an init and clear call that were in context_manager.py")
 
+    # Prompt state lives only as long as one request or job, so there is none to reset here
     initialize_session_files(app.config['json_manager'])
-    prompt_manager = app.config['prompt_manager']
-    prompt_manager.reset_prompts()
 
     return jsonify({"message": "All data cleared successfully!"}), 200
 
@@ -231,29 +419,23 @@ def upload_file():
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        # Save file temporarily
-        temp_path = os.path.join('temp', uploaded_file.filename)
-        os.makedirs('temp', exist_ok=True)
-        uploaded_file.save(temp_path)
-
-        try:
-            if destination == 'gallery':
-                success = upload_to_s3_gallery(temp_path, "main", uploaded_file.filename)
-            else:  # uploads
-                s3_path = f"users/{username}/projects/{current_project}/uploads/{uploaded_file.filename}"
-                success = upload_file_to_s3(temp_path, s3_path)
-
-            if success:
-                return jsonify({
-                    "message": f"File {uploaded_file.filename} uploaded successfully!",
-                    "destination": destination
-                }), 200
-            else:
-                return jsonify({"error": "Failed to upload file"}), 500
-
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        if destination == 'gallery':
+            s3_path = f"users/{username}/projects/{current_project}/gallery/{uploaded_file.filename}"
+        else:  # uploads
+            s3_path = f"users/{username}/projects/{current_project}/uploads/{uploaded_file.filename}"
+
+        # Stream the upload straight to storage in fixed-size parts, hashing as it goes
+        result = upload_stream_to_s3(uploaded_file.stream, s3_path, content_type=uploaded_file.mimetype)
+
+        if result:
+            return jsonify({
+                "message": f"File {uploaded_file.filename} uploaded successfully!",
+                "destination": destination,
+                "size": result['size'],
+                "sha256": result['sha256']
+            }), 200
+        else:
+            return jsonify({"error": "Failed to upload file"}), 500
 
     except Exception as e:
         logging.error(f"Error handling file upload: {str(e)}")
@@ -321,6 +503,11 @@ def get_context():
         logging.error(f"Error getting context data: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/storage/cache_stats')
+def get_storage_cache_stats():
+    """Hit/miss counters and occupancy of this process's object cache."""
+    return jsonify(object_cache.stats()), 200
+
 
 
 @app.route('/api/gallery')
@@ -362,12 +549,12 @@ def get_image(username, project, filename):
     try:
         s3_path = f"users/{username}/projects/{current_project}/gallery/{filename}"
         
-        # Get image from S3
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_path)
-        image_data = response['Body'].read()
+        # Get image from storage
+        image = storage.get_object(s3_path)
+        image_data = image['body']
         
         # Determine content type
-        content_type = response['ContentType']
+        content_type = image['content_type']
         
         return send_file(
             io.BytesIO(image_data),
@@ -393,8 +580,10 @@ def create_project():
         project_type = data.get('projectType')
         
         initialize_empty_project_context(project_name, project_type) # Initialize the project context in session
-        create_new_project(project_name) # Create the folder structure in S3    
-        initialize_session_files(app.config['json_manager']) # Copy the JSON structure files from static to S3
+        # Write the folder structure, structure files, tables, prompt and metadata in one parallel batch
+        username = session['user']['username']
+        if not bootstrap_project(app.config['json_manager'], username, project_name, project_type):
+            return jsonify({"error": "Failed to create project"}), 500
         
         return jsonify({"message": "Project created successfully"}), 200
 
@@ -414,6 +603,9 @@ def load_project():
             return jsonify({"error": "Project name is required"}), 400
 
         project_context = load_project_context(project_name)
+
+        # Loading a project is the repair point for its listing manifest
+        repair_project_manifest(project_name)
         return jsonify({
             "message": "Project loaded successfully",
             "projectName": project_context['name'],
@@ -456,6 +648,9 @@ def delete_project_endpoint():
         
         results = []
         errors = []
+        # (success message, failure message, keys, project name) per valid item.
+        # Every key is removed in one bulk delete once all items are validated.
+        planned = []
 
         for item in items:
             delete_type = item.get('type')
@@ -475,19 +670,19 @@ def delete_project_endpoint():
                         errors.append(f"Project does not exist: {item_name}")
                         continue
 
-                    # Delete the project directory and contents
-                    delete_result = delete_project(item_name)
+                    # Collect every object in the project directory
+                    project_keys = list_object_keys(f"users/{username}/projects/{item_name}/")
                     
-                    if not delete_result:
+                    if not project_keys:
                         errors.append(f"Failed to delete project: {item_name}")
                         continue
 
-                    # If deleting current project, clear project context
-                    if current_project == item_name:
-                        session.pop('current_project', None)
-                        session.pop('project_type', None)
-
-                    results.append(f"Project {item_name} deleted successfully")
+                    planned.append((
+                        f"Project {item_name} deleted successfully",
+                        f"Failed to delete project: {item_name}",
+                        project_keys,
+                        item_name
+                    ))
 
                 elif delete_type in ['file', 'gallery']:
                     # Project name required for file/gallery operations
@@ -501,14 +696,12 @@ def delete_project_endpoint():
                     else:  # gallery
                         s3_path = f"users/{username}/projects/{current_project}/gallery/{item_name}"
 
-                    # Delete from S3
-                    delete_result = delete_file_from_s3(s3_path)
-                    
-                    if not delete_result:
-                        errors.append(f"Failed to delete {delete_type}: {item_name}")
-                        continue
-
-                    results.append(f"{delete_type.capitalize()} {item_name} deleted successfully")
+                    planned.append((
+                        f"{delete_type.capitalize()} {item_name} deleted successfully",
+                        f"Failed to delete {delete_type}: {item_name}",
+                        [s3_path],
+                        None
+                    ))
 
                 else:
                     errors.append(f"Invalid delete type for item: {item}")
@@ -516,6 +709,29 @@ def delete_project_endpoint():
             except Exception as item_error:
                 errors.append(f"Error processing {delete_type} {item_name}: {str(item_error)}")
 
+        # Delete from S3 in one bulk call
+        summary = delete_objects(key for _, _, keys, _ in planned for key in keys)
+        failed_keys = {error['key'] for error in summary['errors']}
+        deleted_projects = []
+
+        for success_message, failure_message, keys, deleted_project in planned:
+            if failed_keys.intersection(keys):
+                errors.append(failure_message)
+                continue
+
+            if deleted_project is not None:
+                deleted_projects.append(deleted_project)
+
+            # If deleting current project, clear project context
+            if deleted_project is not None and current_project == deleted_project:
+                session.pop('current_project', None)
+                session.pop('project_type', None)
+
+            results.append(success_message)
+
+        if deleted_projects:
+            registry.remove_projects(username, deleted_projects)
+
         response = {
             "message": "Deletion operation completed",
             "successes": results
@@ -538,127 +754,85 @@ def delete_project_endpoint():
 def download_output():
     """
     Generate and download the requested output file (Excel or PowerPoint) for the current project.
+    With background=1 the output is generated by a job instead, and the response
+    is the job to follow through /api/jobs/<job_id>.
     """
     logging.info("\n\n\n-----Download Output Endpoint-----")
+    output_type = request.args.get('type')
     try:
         username = session.get('user')['username']
         current_project = session.get('current_project')
-        output_type = request.args.get('type')
         project_type = current_project.get('type')
-        
-        if not output_type:
-            logging.error(f"[/download_output] No output type found for user: {username}")
-            return jsonify({"error": "Output type is required"}), 400
-            
-        if not project_type:
-            logging.error(f"[/download_output] No project type found for user: {username}")
-            return jsonify({"error": "Project type is required"}), 400
 
-        if project_type not in ALLOWABLE_PROJECT_TYPES.values():
-            logging.error(f"[/download_output] Invalid project type: {project_type}")
-            return jsonify({"error": "Invalid project type"}), 400
+        try:
+            validate_output_request(output_type, project_type)
+        except OutputGenerationError as e:
+            logging.error(f"[/download_output] {str(e)}. Allowed types for {project_type}: {OUTPUTS_FOR_PROJECT_TYPE.get(project_type, [])}. User: {username}, Project: {current_project.get('name')}")
+            return jsonify({"error": str(e)}), e.status_code
 
-        # Validate output type is allowed for this project type
-        if output_type not in OUTPUTS_FOR_PROJECT_TYPE.get(project_type, []):
-            logging.error(f"[/download_output] Output type {output_type} not allowed for project type {project_type}. Allowed types for {project_type}: {OUTPUTS_FOR_PROJECT_TYPE.get(project_type, [])}. User: {username}, Project: {current_project.get('name')}")
-            return jsonify({"error": f"Output type {output_type} not available for {project_type} projects"}), 400
+        if request.args.get('background'):
+            job, _ = app.config['job_manager'].submit("output", {"type": output_type})
+            return jsonify(job_response(job)), 202
 
-        # Get the outputs directory for this user's project
-        outputs_path = get_project_outputs_path()
-        
-        if not outputs_path:
-            logging.error("[/download_output] Failed to get project outputs path")
-            return jsonify({"error": "Could not access project outputs directory"}), 500
-
-        # Generate the appropriate file based on output type and get the S3 path
-        logging.info(f"[/download_output] Starting file generation for output type: {output_type}")
-        if output_type in ['excel_model', 'excel_overview']:
-            if project_type == "financial":
-                logging.debug("[/download_output] Generating financial Excel model")
-                file_path = generate_excel_model()
-            elif project_type == "catalyst":
-                logging.debug("[/download_output] Generating catalyst Excel summary")
-                file_path = make_catalyst_summary()
-            else:
-                logging.error(f"[/download_output] Excel output not supported for project type: {project_type}")
-                return jsonify({"error": "Excel output not supported for this project type"}), 400
-        elif output_type == 'powerpoint_overview':
-            if project_type == "financial":
-                file_path = generate_ppt()
-            elif project_type == "real_estate":
-                from powerpoint_generation.ppt_real_estate import generate_ppt
-                file_name = generate_real_estate_ppt()
-                file_path = f"{outputs_path}/{file_name}"
-            elif project_type == "fund_analysis":
-                logging.info("[/download_output] Generating fund analysis PowerPoint")
-                from powerpoint_generation.ppt_fund_analysis import generate_fund_analysis_ppt
-                
-                # Generate PowerPoint and get the file object/bytes
-                ppt_bytes = generate_fund_analysis_ppt(debug=debug)
-                
-                # Generate a unique filename
-                timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"fund_analysis_{timestamp}.pptx"
-                s3_path = f"{outputs_path}/{filename}"
-                
-                # Upload bytes directly to S3
-                try:
-                    s3_client.put_object(
-                        Bucket=BUCKET_NAME,
-                        Key=s3_path,
-                        Body=ppt_bytes
-                    )
-                    file_path = s3_path
-                    logging.info(f"[/download_output] Successfully uploaded PowerPoint to S3: {s3_path}")
-                except Exception as e:
-                    logging.error(f"[/download_output] Failed to upload PowerPoint to S3: {str(e)}")
-                    return jsonify({"error": "Failed to save PowerPoint"}), 500
-            else:
-                logging.error(f"[/download_output] PowerPoint generation not supported for project type: {project_type}")
-                return jsonify({"error": "PowerPoint generation not supported for this project type"}), 400
-        else:
-            logging.error(f"[/download_output] Invalid output type: {output_type}")
-            return jsonify({"error": "Invalid output type"}), 400
-
-        # Download from S3 to temporary file
-        temp_dir = 'temp'
-        os.makedirs(temp_dir, exist_ok=True)
-        filename = os.path.basename(file_path)
-        temp_path = os.path.join(temp_dir, filename)
-        
-        if not download_file_from_s3(file_path, temp_path):
-            logging.error(f"[/download_output] Failed to download file from S3: {file_path}")
-            return jsonify({"error": f"Failed to retrieve {output_type} file"}), 500
-
-        logging.info(f"[/download_output] Successfully retrieved {output_type} file from S3: {file_path}")
+        # Reuse the last artifact if none of its inputs changed since it was generated
+        project_base, cache_key, cached_path = lookup_output(output_type, project_type)
+        if cached_path:
+            return send_output_file(cached_path, output_type)
 
+        # Generate the appropriate file in memory, with the S3 path it belongs at
         try:
-            response = send_file(temp_path, as_attachment=True)
-            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-            
-            # Instead of deleting immediately, schedule the file for deletion after the response
-            @response.call_on_close
-            def cleanup():
-                try:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                except Exception as e:
-                    logging.error(f"[/download_output] Failed to clean up temporary file: {e}")
-            
-            return response
-            
-        except Exception as e:
-            logging.error(f"[/download_output] Error preparing file for download: {str(e)}")
-            # Clean up if send_file fails
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            return jsonify({"error": "Failed to prepare file for download"}), 500
+            file_path, file_bytes = render_output(output_type, project_type)
+        except OutputGenerationError as e:
+            logging.error(f"[/download_output] {str(e)}")
+            return jsonify({"error": str(e)}), e.status_code
+
+        if file_bytes is None:
+            # The generator stored the file itself
+            remember_output(project_base, output_type, cache_key, file_path)
+            return send_output_file(file_path, output_type)
+
+        # Send the bytes now and store them in S3 while the client downloads
+        store_output_in_background(
+            file_path, file_bytes,
+            on_stored=lambda: remember_output(project_base, output_type, cache_key, file_path)
+        )
+        return send_output_bytes(file_bytes, os.path.basename(file_path))
 
     except Exception as e:
         logging.error(f"[/download_output] Error generating {output_type} file: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to generate {output_type} file: {str(e)}"}), 500
 
 
+def send_output_bytes(file_bytes, filename):
+    """Send an output built in memory to the client as an attachment."""
+    response = send_file(io.BytesIO(file_bytes), as_attachment=True, download_name=filename,
+                         mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+def send_output_file(file_path, output_type):
+    """Stream a generated output from S3 to the client as an attachment."""
+    filename = os.path.basename(file_path)
+    chunks = storage.stream(file_path)
+    try:
+        # Fetch the first chunk now so a missing file is reported before the response starts
+        first_chunk = next(chunks, b"")
+    except StorageError as e:
+        logging.error(f"[/download_output] Failed to retrieve file from S3: {file_path}: {str(e)}")
+        return jsonify({"error": f"Failed to retrieve {output_type} file"}), 500
+
+    logging.info(f"[/download_output] Streaming {output_type} file from S3: {file_path}")
+
+    def generate():
+        yield first_chunk
+        yield from chunks
+
+    response = Response(generate(), mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
 #=============================================================
 # MAIN ENTRY POINT
 #=============================================================
@@ -673,6 +847,11 @@ if __name__ == '__main__':
     else:
         port = int(HOSTED_PORT)
         debug = False
+
+    # Single-process development server: run the job workers alongside it. With the
+    # reloader on, only the process that serves requests starts them.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        threading.Thread(target=run_worker_pool, daemon=True, name="job-worker-pool").start()
     
     app.run(host='0.0.0.0', port=port, debug=debug)
 
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+chunk_planner.py
+
+Plans how the pages of a PDF are split into OpenAI calls for each table group.
+
+Every call of a table group sends the same prompt (static prompt, business
+description, user input, the group's tables and the header framing the PDF
+chunk) plus one chunk of pages. The pages a call can carry are whatever is left
+of the model's context window after that prompt, the completion tokens
+reserved with max_tokens and a small safety margin. Pages are counted as they
+appear in a chunk, boundary marker included (PdfDocument.chunk_token_counts).
+A page that does not fit in a call on its own cannot be sent, so a group with
+such a page does not fit and the job is refused rather than overflowing the
+context window. Groups with small tables therefore get larger chunks and need
+fewer calls than groups with large ones, rather than every group being packed
+against the budget of the largest.
+
+plan_job() returns one plan per table group. plan_report() adds up calls and
+tokens per plan, with the cost estimate of the whole job and of packing every
+group against the smallest budget, so a job can be inspected as a dry run
+before anything is sent.
+"""
+
+import logging
+
+from config import (
+    OPENAI_CONTEXT_WINDOW,
+    OPENAI_MAX_OUTPUT_TOKENS,
+    OPENAI_PROMPT_MARGIN_TOKENS,
+    OPENAI_MAX_PDF_TOKENS_PER_CALL,
+    OPENAI_COST_PER_INPUT_TOKEN,
+    OPENAI_COST_PER_OUTPUT_TOKEN
+)
+
+# The single call of a group when there are no PDF pages to send
+NO_PDF_CHUNK = {"start_page": None, "end_page": None, "token_count": 0}
+
+
+def pdf_token_budget(prompt_tokens, context_window=OPENAI_CONTEXT_WINDOW, output_tokens=OPENAI_MAX_OUTPUT_TOKENS,
+                     margin_tokens=OPENAI_PROMPT_MARGIN_TOKENS, max_pdf_tokens=OPENAI_MAX_PDF_TOKENS_PER_CALL):
+    """PDF tokens one call can carry next to a prompt of prompt_tokens. Zero or less if none fit."""
+    budget = context_window - output_tokens - margin_tokens - prompt_tokens
+    if max_pdf_tokens:
+        budget = min(budget, max_pdf_tokens)
+    return budget
+
+
+def pack_pages(page_token_counts, budget):
+    """
+    Pack consecutive pages into chunks of at most budget tokens.
+
+    Returns
+    -------
+    list of dict
+        {"start_page", "end_page", "token_count"} with end_page inclusive. A
+        page larger than the budget gets a chunk of its own. A document with
+        no pages gets a single chunk without pages.
+    """
+    chunks = []
+    current = None
+    for page_num, token_count in enumerate(page_token_counts):
+        if current is not None and current["token_count"] + token_count <= budget:
+            current["end_page"] = page_num
+            current["token_count"] += token_count
+        else:
+            current = {"start_page": page_num, "end_page": page_num, "token_count": token_count}
+            chunks.append(current)
+    return chunks or [dict(NO_PDF_CHUNK)]
+
+
+def plan_group(table_names, prompt_tokens, page_token_counts, **budget_kwargs):
+    """
+    Plan the calls of one table group.
+
+    Returns
+    -------
+    dict
+        {"tables", "prompt_tokens", "pdf_budget", "chunks", "calls",
+        "input_tokens", "output_tokens", "oversized_pages", "fits"}. fits is
+        False, and chunks is empty, if the prompt alone does not fit (pdf_budget
+        is zero or less) or a page exceeds pdf_budget (listed, 0-based, in
+        oversized_pages).
+    """
+    budget = pdf_token_budget(prompt_tokens, **budget_kwargs)
+    oversized = [page_num for page_num, token_count in enumerate(page_token_counts) if token_count > budget]
+    fits = budget > 0 and not oversized
+    chunks = pack_pages(page_token_counts, budget) if fits else []
+    if budget > 0 and oversized:
+        logging.error(f"[plan_group] Pages {[page_num + 1 for page_num in oversized]} exceed the "
+                      f"{budget}-token budget of {table_names} and cannot be sent")
+    return {
+        "tables": list(table_names),
+        "prompt_tokens": prompt_tokens,
+        "pdf_budget": budget,
+        "chunks": chunks,
+        "calls": len(chunks),
+        "input_tokens": len(chunks) * prompt_tokens + sum(chunk["token_count"] for chunk in chunks),
+        "output_tokens": len(chunks) * budget_kwargs.get("output_tokens", OPENAI_MAX_OUTPUT_TOKENS),
+        "oversized_pages": oversized if budget > 0 else [],
+        "fits": fits
+    }
+
+
+def plan_job(table_groups, page_token_counts, prompt_builder, include_context=False, **budget_kwargs):
+    """
+    Plan every table group of a job from its own prompt size.
+
+    Parameters
+    ----------
+    table_groups : list of list
+        Update table names of each group.
+    page_token_counts : list of int
+        Tokens each PDF page adds to a chunk (PdfDocument.chunk_token_counts).
+    prompt_builder : PromptBuilder
+        Builder whose tables were prepared with prepare_tables.
+    include_context : bool
+        Whether context tables are sent with every group.
+
+    Returns
+    -------
+    list of dict
+        One plan_group() result per group, in group order.
+    """
+    header_tokens = prompt_builder.pdf_chunk_header_token_count() if page_token_counts else 0
+    return [
+        plan_group(
+            table_names,
+            prompt_builder.table_group_token_count(table_names, include_context=include_context) + header_tokens,
+            page_token_counts,
+            **budget_kwargs
+        )
+        for table_names in table_groups
+    ]
+
+
+def plan_report(plans, page_token_counts):
+    """
+    Calls, tokens and estimated cost of a job's plans.
+
+    The baseline packs every group against the smallest budget of any group,
+    as a single page budget for the whole job would. Output tokens are the
+    reserved max_tokens, so costs are upper bounds.
+    """
+    def cost(input_tokens, output_tokens):
+        return round(input_tokens * OPENAI_COST_PER_INPUT_TOKEN + output_tokens * OPENAI_COST_PER_OUTPUT_TOKEN, 4)
+
+    groups = [
+        {key: plan[key] for key in ("tables", "prompt_tokens", "pdf_budget", "calls", "input_tokens", "output_tokens",
+                                    "oversized_pages", "fits")}
+        for plan in plans
+    ]
+    input_tokens = sum(plan["input_tokens"] for plan in plans)
+    output_tokens = sum(plan["output_tokens"] for plan in plans)
+    report = {
+        "pages": len(page_token_counts),
+        "pdf_tokens": sum(page_token_counts),
+        "groups": groups,
+        "calls": sum(plan["calls"] for plan in plans),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "estimated_cost_usd": cost(input_tokens, output_tokens),
+        "fits": all(plan["fits"] for plan in plans)
+    }
+
+    if plans and report["fits"]:
+        smallest_budget = min(plan["pdf_budget"] for plan in plans)
+        baseline_calls = len(pack_pages(page_token_counts, smallest_budget))
+        baseline_input = sum(baseline_calls * plan["prompt_tokens"] for plan in plans) + len(plans) * sum(page_token_counts)
+        baseline_output = len(plans) * baseline_calls * OPENAI_MAX_OUTPUT_TOKENS
+        report["baseline"] = {
+            "pdf_budget": smallest_budget,
+            "calls": len(plans) * baseline_calls,
+            "input_tokens": baseline_input,
+            "output_tokens": baseline_output,
+            "estimated_cost_usd": cost(baseline_input, baseline_output)
+        }
+    return report
+
+
+def format_plan_report(report):
+    """Human-readable lines of a plan_report() for logs and the command line."""
+    lines = [f"{report['pages']} pages, {report['pdf_tokens']} PDF tokens"]
+    for group in report["groups"]:
+        lines.append(
+            f"  {', '.join(group['tables'])}: prompt {group['prompt_tokens']}, budget {group['pdf_budget']}, "
+            f"{group['calls']} calls, {group['input_tokens']} input tokens"
+            + ("" if group["fits"] else " (does not fit)")
+        )
+    lines.append(f"  total: {report['calls']} calls, {report['input_tokens']} input tokens, "
+                 f"up to ${report['estimated_cost_usd']:.4f}")
+    if "baseline" in report:
+        baseline = report["baseline"]
+        lines.append(f"  one budget for all groups ({baseline['pdf_budget']}): {baseline['calls']} calls, "
+                     f"{baseline['input_tokens']} input tokens, up to ${baseline['estimated_cost_usd']:.4f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Example: a 300-page filing and four table groups of different prompt sizes
+    class FixedPrompts:
+        """Stands in for a prepared PromptBuilder with known group prompt sizes."""
+        sizes = {"revenue": 6000, "expenses": 9000, "capex": 20000, "FUND_ANALYSIS_deal_history": 60000}
+
+        def table_group_token_count(self, table_names, include_context=False):
+            return sum(self.sizes[table_name] for table_name in table_names)
+
+        def pdf_chunk_header_token_count(self):
+            return 15
+
+    page_token_counts = [700 + (page_num * 37) % 900 for page_num in range(300)]
+    table_groups = [["revenue"], ["expenses"], ["capex"], ["FUND_ANALYSIS_deal_history"]]
+    plans = plan_job(table_groups, page_token_counts, FixedPrompts())
+    print(format_plan_report(plan_report(plans, page_token_counts)))
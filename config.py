@@ -19,15 +19,52 @@ HOSTED_PORT = 8080
 #=============================================================
 #OpenAI Configuration
 #=============================================================
-MAX_TOKENS_PER_CALL = 14984
 OPENAI_MODEL = 'gpt-4o-mini'
+OPENAI_CONTEXT_WINDOW = 128000  # Tokens OPENAI_MODEL accepts per request, prompt and completion together
+OPENAI_MAX_OUTPUT_TOKENS = 5000  # Completion tokens reserved in every call (sent as max_tokens)
+OPENAI_PROMPT_MARGIN_TOKENS = 1000  # Headroom for token-count estimates, e.g. tokens merging where pages are joined
+OPENAI_MAX_PDF_TOKENS_PER_CALL = None  # Optional cap on the PDF tokens of one call; None uses the whole context window
 OPENAI_COST_PER_INPUT_TOKEN = 2.5/1000000
 OPENAI_COST_PER_OUTPUT_TOKEN = 10/1000000
+OPENAI_MAX_CONCURRENT_TABLE_GROUPS = 4  # Table groups sent to OpenAI at once. 1 runs them sequentially.
+OPENAI_API_URL = 'https://api.openai.com/v1/chat/completions'
+OPENAI_HTTP_POOL_SIZE = 16  # Keep-alive connections held open to the OpenAI endpoint
+OPENAI_CONNECT_TIMEOUT = 10  # Seconds to establish a connection
+OPENAI_READ_TIMEOUT = 180  # Seconds to wait between bytes of a response
+OPENAI_MAX_RETRIES = 5  # Retries for 429/5xx responses and connection errors
+OPENAI_BACKOFF_BASE_SECONDS = 1.0
+OPENAI_BACKOFF_MAX_SECONDS = 60.0
+OPENAI_TOKENS_PER_MINUTE = 200000  # Organisation token-per-minute limit, across every process on every host
+OPENAI_RATE_LIMIT_HOSTS = 1  # Hosts calling OpenAI; each gets an equal share of OPENAI_TOKENS_PER_MINUTE
+OPENAI_RATE_LIMIT_DB_PATH = os.path.join(os.getcwd(), "job_data", "openai_rate_limit.db")  # Token window shared by all processes on the host
+OPENAI_STREAM_RESPONSES = True  # Stream completions and parse the TEXT/JSON/SUMMARY sections as they arrive
+TOKEN_COUNT_MEMO_SIZE = 4096  # Recent text-hash -> token count results kept in memory
+TOKEN_COUNT_THREADS = 4  # Threads used by count_tokens_many for batched encoding
 if DEVELOPMENT_ENVIRONMENT == "DEBUG":
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY') #Works on local machine
 else:
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY') #Works on hosted server
 
+# Where prompts and raw responses are recorded (see prompt_audit.py): "off",
+# "sampled", "async" (written in the background) or "sync" (written before each call goes on)
+PROMPT_AUDIT_MODE = os.getenv('PROMPT_AUDIT_MODE', 'async')
+PROMPT_AUDIT_SAMPLE_RATE = 0.1  # Fraction of jobs recorded in "sampled" mode
+PROMPT_AUDIT_QUEUE_SIZE = 256  # Records waiting to be written; further records are dropped, never waited on
+PROMPT_AUDIT_BATCH_SIZE = 32  # Most records per compressed archive part
+PROMPT_AUDIT_FLUSH_SECONDS = 2  # Longest a record waits for its batch to fill
+
+#=============================================================
+#Background Job Configuration
+#=============================================================
+JOB_DB_PATH = os.path.join(os.getcwd(), "job_data", "jobs.db")  # SQLite job queue shared by all processes on the host
+JOB_WORKER_PROCESSES = 2  # Worker processes started by job_worker.py, and the most jobs the shared store lets run at once per host
+JOB_WORKER_RESTART_SECONDS = 5  # How often job_worker.py checks for exited workers and restarts them
+JOB_LEASE_SECONDS = 60  # A running job whose worker has not renewed it for this long is treated as abandoned
+JOB_HEARTBEAT_SECONDS = 15  # How often a worker renews the lease of the job it is running
+JOB_MAX_ATTEMPTS = 2  # Abandoned jobs are requeued until they have been started this many times, then failed
+JOB_POLL_SECONDS = 0.5  # How often workers and event streams poll the queue
+JOB_RETENTION_SECONDS = 3600  # How long finished jobs and their events are kept
+
 #=============================================================  
 #AWS Configuration
 #=============================================================
@@ -42,6 +79,35 @@ else:
     AWS_REGION = os.environ.get('AWS_REGION')
     BUCKET_NAME = os.environ.get('AWS_BUCKET_NAME')
 
+#=============================================================
+#Storage Configuration
+#=============================================================
+# "s3" stores user and project files in BUCKET_NAME. "local" stores them under
+# LOCAL_STORAGE_ROOT, for single-node deployments and offline benchmarking.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3')
+LOCAL_STORAGE_ROOT = os.getenv('LOCAL_STORAGE_ROOT', os.path.join(os.getcwd(), "local_storage"))
+STORAGE_STREAM_CHUNK_SIZE = 1024 * 1024  # Bytes per chunk when streaming an object
+STORAGE_UPLOAD_PART_SIZE = 8 * 1024 * 1024  # Bytes per multipart upload part (S3 minimum is 5 MB); bounds upload memory
+STORAGE_DELETE_BATCH_SIZE = 1000  # Keys per S3 DeleteObjects request (the S3 maximum)
+STORAGE_DELETE_WORKERS = 4  # DeleteObjects requests sent at once for bulk deletes
+STORAGE_MAX_POOL_CONNECTIONS = 32  # HTTP connections the S3 client keeps open for parallel requests
+PROJECT_BOOTSTRAP_WORKERS = 32  # Objects of a new project written at once
+OUTPUT_UPLOAD_WORKERS = 2  # Background threads storing outputs already sent to the client
+OUTPUT_CACHE_VERSION = 1  # Bump to invalidate every cached output, e.g. after a dependency upgrade
+
+# In-process cache of project JSON, prompts and metadata read from storage
+OBJECT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+OBJECT_CACHE_MAX_OBJECT_BYTES = 4 * 1024 * 1024  # Larger objects are never cached
+OBJECT_CACHE_TTL_SECONDS = 2  # Served without revalidating the ETag for this long
+
+MANIFEST_UPDATE_RETRIES = 5  # Conditional-write attempts before a project manifest is dropped for a rescan
+REGISTRY_UPDATE_RETRIES = 5  # Conditional-write attempts before a user's project registry is rebuilt
+
+# "files" stores each table as its own <table>.json. "bundle" stores all of a
+# project's tables in one object plus small delta objects (see table_store.py).
+TABLE_STORAGE_LAYOUT = os.getenv('TABLE_STORAGE_LAYOUT', 'files')
+TABLE_BUNDLE_COMPACT_AFTER = 8  # Pending deltas that trigger folding them into the bundle
+
 #=============================================================
 #Default Configuration
 #=============================================================
@@ -54,7 +120,16 @@ ALLOWED_GALLERY_EXTENSIONS = {'.pdf', '.txt', '.png', '.jpg', '.jpeg', '.gif', '
 
 RUNNING_SUMMARY_DIR = os.path.join(os.getcwd(), "temp_business_data")
 BASE_PROMPT_DIR = os.path.join(os.getcwd(), "static", "prompts")
+
+# Extracted PDF page text and token counts, keyed by the upload's content hash
+PDF_PAGE_CACHE_DIR = os.path.join(os.getcwd(), "uploads", ".cache")
+PDF_PAGE_CACHE_MAX_ENTRIES = 200
+
+# Parallel PDF text extraction. 1 worker extracts serially on the request thread.
+PDF_EXTRACTION_WORKERS = min(8, os.cpu_count() or 1)
+PDF_EXTRACTION_BATCH_SIZE = 25  # Pages handed to a worker at a time
 STRUCTURE_FILES_DIR = os.path.join(os.getcwd(), "static", "json_structure_data")
+STRUCTURE_REGISTRY_CHECK_SECONDS = 5  # How often the parsed structure files are checked for edits
 
 # Dictionary mapping table names to their structure files for financial project
 FINANCIALS_TABLE = [
@@ -126,6 +201,7 @@ DEFAULT_PROJECT_METADATA = {
     # Technical Details
     "file_count": 0,  # Updated when files added/removed
     "last_output_generated": None,  # Updated when outputs generated
+    "output_cache": {},  # Output type -> cache key and S3 path of the last artifact generated (see output_cache.py)
     
     # Access Control
     "collaborators": [],  # Initially set to owner only
@@ -1,29 +1,15 @@
 # context_manager.py
 # This module manages user context and project state throughout the application.
-# It provides functionality for managing user sessions, project data, and file access in S3.
+# It provides functionality for managing user sessions, project data, and file access in storage.
 
 from dataclasses import dataclass
 from flask import session
 from typing import Optional
 import logging
-import os
-import boto3
-from botocore.exceptions import ClientError
 from config import ALLOWABLE_PROJECT_TYPES, OUTPUTS_FOR_PROJECT_TYPE
 from file_manager import list_projects, get_project_metadata, get_available_structure_files, get_uploads_contents, get_gallery_contents, ensure_user_exists, get_user_path, create_new_user
 from datetime import datetime as dt
 
-# Configure S3 client for AWS access
-# Uses environment variables for secure credential management
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION'),
-)
-BUCKET_NAME = os.getenv('AWS_BUCKET_NAME')
-
-
 def initialize_session_context():
     """
     Initializes the context for the current user session.
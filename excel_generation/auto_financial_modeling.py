@@ -62,10 +62,12 @@ def generate_excel_model(debug_mode=False):
    
     #Close the workbook 
     workbook_manager1.close_workbook()
-    logging.info(f"Excel model created at {workbook_manager1.output_path}\n\n")
+    logging.info(f"Excel model created for {workbook_manager1.output_path}\n\n")
     
-    # Return the file path from the workbook manager
-    return workbook_manager1.output_path
+    # Return the file name and the workbook bytes from the workbook manager
+    return workbook_manager1.name, workbook_manager1.output_bytes
 
 if __name__ == "__main__":
-    generate_excel_model()
\ No newline at end of file
+    file_name, workbook_bytes = generate_excel_model()
+    with open(file_name, 'wb') as f:
+        f.write(workbook_bytes)
\ No newline at end of file
@@ -66,14 +66,18 @@ class BusinessEntity:
 
     def _load_project_data(self, project_type):
         """Load all JSON files for the specified project type with error handling."""
-        for attr_name, file_name in self.file_mappings[project_type].items():
-            try:
-                data = self.json_manager.load_json_data(file_name)
-                setattr(self, attr_name, data if data else [])
-                logging.debug(f"Loaded {file_name} data successfully")
-            except Exception as e:
-                logging.error(f"Failed to load {file_name}: {str(e)}")
-                setattr(self, attr_name, [])
+        file_mapping = self.file_mappings[project_type]
+        try:
+            # All tables in one call, a single read with the bundle table layout
+            tables = self.json_manager.load_tables(list(file_mapping.values()))
+        except Exception as e:
+            logging.error(f"Failed to load project tables: {str(e)}")
+            tables = {}
+
+        for attr_name, file_name in file_mapping.items():
+            data = tables.get(file_name)
+            setattr(self, attr_name, data if data else [])
+            logging.debug(f"Loaded {file_name} data successfully")
         
         # Set start year if historical financials exist
         if project_type == "financials":
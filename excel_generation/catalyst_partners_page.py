@@ -875,19 +875,16 @@ def make_catalyst_summary():
         # Close the workbook explicitly
         catalyst_workbook.close_workbook()
         
-        # Get the full path to the generated file
-        #file_path = os.path.join(os.getcwd(), catalyst_workbook.name)
-        file_path = catalyst_workbook.output_path
-        print(f"Excel file generated at: {file_path}")
-        
-        # Verify file exists and is not empty
-        if os.path.exists(file_path):
-            file_size = os.path.getsize(file_path)
-            print(f"File size: {file_size} bytes")
+        # The workbook is built in memory
+        print(f"Excel file generated for: {catalyst_workbook.output_path}")
+        
+        # Verify the workbook is not empty
+        if catalyst_workbook.output_bytes:
+            print(f"File size: {len(catalyst_workbook.output_bytes)} bytes")
         else:
-            print("Warning: File not found after generation!")
+            print("Warning: Workbook is empty after generation!")
             
-        return file_path
+        return catalyst_workbook.name, catalyst_workbook.output_bytes
         
     except Exception as e:
         print(f"Error generating Excel file: {str(e)}")
@@ -895,4 +892,6 @@ def make_catalyst_summary():
 
 
 if __name__ == "__main__":
-    make_catalyst_summary()
\ No newline at end of file
+    file_name, workbook_bytes = make_catalyst_summary()
+    with open(file_name, 'wb') as f:
+        f.write(workbook_bytes)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import io
 import os
 import xlsxwriter
 from datetime import datetime
@@ -9,7 +10,7 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from file_manager import upload_file_to_s3, get_project_outputs_path
+from file_manager import get_project_outputs_path
 from helper_functions import FormatManager, number_to_column_letter, get_cell_identifier
 
 #----Workbook Manager----#
@@ -32,22 +33,17 @@ class WorkbookManager:
         else:
             raise ValueError(f"Invalid project name: {project_type}")
         
-        # Create local temp directory for Excel generation
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        self.temp_dir = os.path.join(parent_dir, 'temp')
-        os.makedirs(self.temp_dir, exist_ok=True)
-
-        # Set temporary local path for workbook creation
-        self.local_path = os.path.join(self.temp_dir, self.name)
+        # Build the workbook in memory; the caller streams and stores the bytes
+        self.buffer = io.BytesIO()
+        self.output_bytes = None
         
         # Get S3 output path
         s3_outputs_path = get_project_outputs_path()
         self.s3_path = f"{s3_outputs_path}/{self.name}" if s3_outputs_path else None
         
         # Create workbook
-        print(f"Creating Excel file temporarily at: {self.local_path}")
-        self.workbook = xlsxwriter.Workbook(self.local_path)
+        print(f"Creating Excel file in memory: {self.name}")
+        self.workbook = xlsxwriter.Workbook(self.buffer, {'in_memory': True})
         
         self.num_forecasted_years=10
         self.cell_info={}
@@ -64,27 +60,14 @@ class WorkbookManager:
         return sheet
     
     def close_workbook(self):
-        # Save and close the workbook
+        # Save and close the workbook, keeping its bytes in output_bytes
         self.workbook.close()
-        
-        # Upload to S3 if path is available
-        if self.s3_path:
-            if upload_file_to_s3(self.local_path, self.s3_path):
-                print(f"Successfully uploaded workbook to S3: {self.s3_path}")
-                self.output_path = self.s3_path  # Use S3 path as output path
-            else:
-                print("Failed to upload to S3, using local path")
-                self.output_path = self.local_path
-        else:
-            print("No S3 path available, using local path")
-            self.output_path = self.local_path
+        self.output_bytes = self.buffer.getvalue()
+        self.buffer.close()
 
-        # Clean up temporary file
-        try:
-            os.remove(self.local_path)
-            print(f"Cleaned up temporary file: {self.local_path}")
-        except Exception as e:
-            print(f"Failed to clean up temporary file: {e}")
+        # Where the output belongs in S3 (the workbook name alone outside a project)
+        self.output_path = self.s3_path or self.name
+        print(f"Workbook {self.name} built in memory ({len(self.output_bytes)} bytes)")
         
     def validate_and_write(self, sheet, row, col, formula_string, format_name='plain', print_formula=False, url_display=None):
         """
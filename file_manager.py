@@ -5,8 +5,9 @@ file_manager.py
 This module provides helper functions for managing user directories, project
 structures, file I/O (read/write JSON and text files), and listing existing
 users/projects. It relies on user context information from `context_manager` and
-configuration values from `config`. Files are stored in Amazon S3, except for
-static files which are hosted locally.
+configuration values from `config`. Files are stored through the configured
+storage backend (Amazon S3 or a local directory, see `storage_backend`), except
+for static files which are hosted locally.
 
 Created on Wed Nov  6 12:09:12 2024
 @author: mikeg
@@ -17,14 +18,10 @@ import json
 import logging
 import datetime
 from flask import session
-import boto3
-from botocore.exceptions import ClientError
-from config import (
-    AWS_ACCESS_KEY_ID,
-    AWS_SECRET_ACCESS_KEY,
-    AWS_REGION,
-    BUCKET_NAME
-)
+from storage_backend import get_storage, StorageError, ObjectNotFound
+from object_cache import ObjectCache
+from project_manifest import ProjectManifests
+from user_registry import UserRegistry
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -50,15 +47,36 @@ logger.addHandler(file_handler)
 
 
 #==============================================================================
-# AWS S3
+# Object storage
 #==============================================================================
-# Setup S3 client with credentials from .env
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION,
-)
+# S3 or local-disk backend, selected by STORAGE_BACKEND in config.py
+storage = get_storage()
+
+# Read-through cache for small, frequently re-read objects (tables, structures, prompts, metadata)
+object_cache = ObjectCache(storage)
+
+# Per-project object index; listings inside a project read it instead of calling LIST
+manifests = ProjectManifests(storage, object_cache)
+
+# Users and their projects; there are no directory marker objects to check for
+registry = UserRegistry(storage, object_cache)
+
+def list_objects(prefix, delimiter=None):
+    """
+    List objects under prefix, in the {"objects", "prefixes"} shape of StorageBackend.list.
+    Prefixes inside a project are answered from the project manifest.
+    """
+    if manifests.project_prefix_for(prefix):
+        return manifests.list(prefix, delimiter=delimiter)
+    return storage.list(prefix, delimiter=delimiter)
+
+def put_object(s3_path, body, content_type=None):
+    """Write bytes to storage, keeping the object cache and project manifest current. Returns the ETag."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    etag = object_cache.put(s3_path, body, content_type=content_type)
+    manifests.record_put(s3_path, etag, len(body))
+    return etag
 
 def upload_file_to_s3(file_path, s3_path):
     """Upload a file to S3"""
@@ -73,23 +91,42 @@ def upload_file_to_s3(file_path, s3_path):
         logger.debug(f"File exists locally, size: {os.path.getsize(file_path)} bytes")
         
         # Attempt upload
-        s3_client.upload_file(file_path, BUCKET_NAME, s3_path)
+        object_cache.invalidate(s3_path)
+        storage.upload_file(file_path, s3_path)
         
         # Verify upload succeeded
         try:
-            s3_client.head_object(Bucket=BUCKET_NAME, Key=s3_path)
+            uploaded = storage.head(s3_path)
+            manifests.record_put(s3_path, uploaded['etag'], uploaded['size'], uploaded['last_modified'])
             logger.debug("Upload verified - file exists in S3")
-        except ClientError:
+        except ObjectNotFound:
             logger.error("Upload appeared to succeed but file not found in S3")
             return False
             
         return True
         
-    except ClientError as e:
+    except StorageError as e:
         logger.error(f"Error uploading file to S3: {str(e)}")
-        logger.debug(f"Full error details: {e.response['Error']}")
         return False
 
+def upload_stream_to_s3(stream, s3_path, content_type=None):
+    """
+    Upload everything read from a file-like stream (e.g. an incoming request
+    file) to S3 in fixed-size parts, without staging it on local disk.
+    Returns {"key", "etag", "size", "sha256"}, or None if the upload failed.
+    """
+    try:
+        object_cache.invalidate(s3_path)
+        result = storage.upload_stream(s3_path, stream, content_type=content_type)
+        # The upload response already carries the ETag and size, so no HEAD is needed to verify it
+        manifests.record_put(s3_path, result['etag'], result['size'])
+        logger.debug(f"Streamed {result['size']} bytes to {s3_path} (sha256 {result['sha256']})")
+        return result
+
+    except StorageError as e:
+        logger.error(f"Error streaming upload to S3: {str(e)}")
+        return None
+
 def upload_to_s3_gallery(local_file_path, gallery_name, file_name):
     """Upload a file to an S3 gallery folder."""
     logger = logging.getLogger(__name__)
@@ -119,79 +156,49 @@ def download_file_from_s3(s3_path, local_path):
     """Download a file from S3"""
     try:
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        s3_client.download_file(BUCKET_NAME, s3_path, local_path)
+        storage.download_file(s3_path, local_path)
         return True
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error downloading file from S3: {str(e)}")
         return False
 
 def delete_file_from_s3(s3_path):
-    """Delete a file from S3"""
+    """Delete a file from S3. Deleting a file that does not exist succeeds."""
     logger = logging.getLogger(__name__)
     
     try:
-        # First check if file exists
-        try:
-            s3_client.head_object(Bucket=BUCKET_NAME, Key=s3_path)
-        except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                logger.warning(f"File does not exist in S3: {s3_path}")
-                return False
-            raise e
-
-        # Delete the file
-        s3_client.delete_object(Bucket=BUCKET_NAME, Key=s3_path)
-        
-        # Verify deletion
-        try:
-            s3_client.head_object(Bucket=BUCKET_NAME, Key=s3_path)
-            logger.error("File still exists after deletion attempt")
-            return False
-        except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                logger.info(f"Successfully deleted file: {s3_path}")
-                return True
-            raise e
+        # One DELETE; storage reports failures, so no HEAD before or after
+        object_cache.invalidate(s3_path)
+        storage.delete(s3_path)
+        manifests.record_delete(s3_path)
+        logger.info(f"Successfully deleted file: {s3_path}")
+        return True
             
-    except ClientError as e:
+    except StorageError as e:
         logger.error(f"Error deleting file from S3: {str(e)}")
-        logger.debug(f"Full error response: {e.response['Error']}")
         return False
 
-def list_s3_directory_contents(prefix, create_if_missing=True):
+def list_s3_directory_contents(prefix):
     """
-    List files in an S3 directory. Optionally create directory if missing.
+    List files in an S3 directory. Directories are plain prefixes, so a
+    missing directory is simply empty.
     Returns:
         - List of filenames (without path prefix)
         - Empty list if directory is empty or on error
     """
     try:
-        # First check if directory exists
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=prefix,
-            MaxKeys=1
-        )
-        # If directory doesn't exist and we should create it
-        if 'Contents' not in response and create_if_missing:
-            try:
-                s3_client.put_object(Bucket=BUCKET_NAME, Key=prefix)
-                logging.info(f"Created directory: {prefix}")
-            except ClientError as e:
-                logging.error(f"Failed to create directory: {str(e)}")
-                return []
-        
         # Get all contents
-        response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
+        objects = list_objects(prefix)["objects"]
+
         files = [
-            obj['Key'].split('/')[-1] 
-            for obj in response.get('Contents', [])
-            if not obj['Key'].endswith('/')
+            obj['key'].split('/')[-1] 
+            for obj in objects
+            if not obj['key'].endswith('/')
         ]
         
         return files
         
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error accessing directory {prefix}: {str(e)}")
         return []
 
@@ -237,26 +244,24 @@ def read_file(s3_path, default=""):
     If the file does not exist, return the specified default value.
     """
     try:
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_path)
-        return response['Body'].read().decode('utf-8')
-    except ClientError:
+        return object_cache.get(s3_path).decode('utf-8')
+    except StorageError:
         return default
 
 def write_file(s3_path, content):
     """Write string content to a file in S3"""
     try:
-        s3_client.put_object(Bucket=BUCKET_NAME, Key=s3_path, Body=content.encode('utf-8'))
+        put_object(s3_path, content.encode('utf-8'))
         return True
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error writing file to S3: {str(e)}")
         return False
 
 def read_json(s3_path):
     """Read a JSON file from S3 and return its deserialized Python object"""
     try:
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_path)
-        return json.loads(response['Body'].read().decode('utf-8'))
-    except ClientError as e:
+        return json.loads(object_cache.get(s3_path).decode('utf-8'))
+    except StorageError as e:
         logging.error(f"Error reading JSON from S3: {str(e)}")
         raise
 
@@ -264,9 +269,9 @@ def write_json(s3_path, data):
     """Serialize a Python object to JSON and write it to S3"""
     try:
         json_str = json.dumps(data, indent=4)
-        s3_client.put_object(Bucket=BUCKET_NAME, Key=s3_path, Body=json_str.encode('utf-8'))
+        put_object(s3_path, json_str.encode('utf-8'))
         return True
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error writing JSON to S3: {str(e)}")
         return False
 
@@ -299,40 +304,23 @@ def create_new_user():
     user_info_prefix = f"{user_prefix}/user_info"
     projects_prefix = f"{user_prefix}/projects"
     
-    # Create empty marker objects to represent directories
-    try:
-        s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{user_prefix}/")
-        s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{user_info_prefix}/")
-        s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{projects_prefix}/")
-        
-        return {
-            'user_dir': user_prefix,
-            'user_info_dir': user_info_prefix,
-            'projects_dir': projects_prefix
-        }
-    except ClientError as e:
-        logging.error(f"Error creating user structure in S3: {str(e)}")
+    # Directories are implicit prefixes; the user exists once it has a registry
+    if not registry.create_user(username):
+        logging.error(f"Error creating user structure in S3 for {username}")
         return None
 
+    return {
+        'user_dir': user_prefix,
+        'user_info_dir': user_info_prefix,
+        'projects_dir': projects_prefix
+    }
+
 def create_new_project(project_name):
-    """Create new project structure in S3"""
+    """Register a new project. Its directories are prefixes that appear as files are written."""
     try:
         username = session['user']['username']
-        project_base = f"users/{username}/projects/{project_name}"
-        
-        # Define project directories as S3 prefixes
-        project_dirs = [
-            f"{project_base}/data/",
-            f"{project_base}/data/structures/",
-            f"{project_base}/data/ai_responses/",
-            f"{project_base}/uploads/",
-            f"{project_base}/gallery/",
-            f"{project_base}/outputs/"
-        ]
-
-        # Create empty objects to represent directories
-        for directory in project_dirs:
-            s3_client.put_object(Bucket=BUCKET_NAME, Key=directory)
+        project_type = (session.get('current_project') or {}).get('type')
+        registry.add_project(username, project_name, project_type)
         
         logging.info(f"Successfully created project structure for: {project_name}")
         return True
@@ -348,23 +336,18 @@ def create_new_project(project_name):
 def list_users():
     """List all users from S3"""
     try:
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix="users/",
-            Delimiter="/"
-        )
+        response = storage.list("users/", delimiter="/")
         
         users = []
-        if 'CommonPrefixes' in response:
-            for prefix in response['CommonPrefixes']:
-                # Extract username from prefix 'users/username/'
-                username = prefix['Prefix'].split('/')[1]
-                if username:
-                    users.append(username)
+        for prefix in response['prefixes']:
+            # Extract username from prefix 'users/username/'
+            username = prefix.split('/')[1]
+            if username:
+                users.append(username)
 
         return users
 
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error listing users: {str(e)}")
         return []
 
@@ -372,23 +355,9 @@ def list_projects():
     """List all projects for current user from S3"""
     try:
         username = session['user']['username']
-        prefix = f"users/{username}/projects/"
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=prefix,
-            Delimiter="/"
-        )
-        
-        projects = []
-        if 'CommonPrefixes' in response:
-            for prefix in response['CommonPrefixes']:
-                project = prefix['Prefix'].split('/')[-2]
-                if project:
-                    projects.append(project)
-                    
-        return projects
-
-    except ClientError as e:
+        return registry.list_projects(username)
+
+    except StorageError as e:
         logging.error(f"Error listing projects: {str(e)}")
         return []
     
@@ -405,14 +374,13 @@ def get_project_metadata():
         metadata_path = f"users/{username}/projects/{current_project}/project_metadata.json"
         
         try:
-            response = s3_client.get_object(Bucket=BUCKET_NAME, Key=metadata_path)
-            metadata = json.loads(response['Body'].read().decode('utf-8'))
+            metadata = json.loads(object_cache.get(metadata_path).decode('utf-8'))
             return metadata
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
-                logging.info(f"No metadata file found at {metadata_path}")
-            else:
-                logging.error(f"Error retrieving project metadata: {str(e)}")
+        except ObjectNotFound:
+            logging.info(f"No metadata file found at {metadata_path}")
+            return {}
+        except StorageError as e:
+            logging.error(f"Error retrieving project metadata: {str(e)}")
             return {}
         except json.JSONDecodeError as e:
             logging.error(f"Invalid JSON in project metadata file: {str(e)}")
@@ -433,12 +401,10 @@ def get_project_data_contents():
     prefix = f"users/{username}/projects/{current_project}/data/"
     
     try:
-        response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-        if 'Contents' in response:
-            return [obj['Key'].split('/')[-1] for obj in response['Contents'] 
-                   if not obj['Key'].endswith('/')]
-        return []
-    except ClientError as e:
+        objects = list_objects(prefix)['objects']
+        return [obj['key'].split('/')[-1] for obj in objects 
+               if not obj['key'].endswith('/')]
+    except StorageError as e:
         logging.error(f"Error reading data directory: {str(e)}")
         return []
     
@@ -480,6 +446,32 @@ def get_uploads_contents():
 # Delete Functions
 # =============================================================================
 
+def list_object_keys(prefix):
+    """Return every key under prefix from a full storage listing (not the manifest)."""
+    return [obj['key'] for obj in storage.list(prefix)['objects']]
+
+def delete_objects(keys):
+    """
+    Delete many keys with as few storage requests as possible.
+    Returns:
+        - Dict with "deleted" (keys removed) and "errors" ([{"key", "message"}] for keys that failed)
+    """
+    keys = list(keys)
+    if not keys:
+        return {"deleted": [], "errors": []}
+
+    for key in keys:
+        object_cache.invalidate(key)
+    summary = storage.delete_many(keys)
+    with manifests.batched_updates():
+        for key in summary['deleted']:
+            manifests.record_delete(key)
+
+    logging.info(f"[delete_objects] Deleted {len(summary['deleted'])} of {len(keys)} objects")
+    for error in summary['errors']:
+        logging.error(f"[delete_objects] Failed to delete {error['key']}: {error['message']}")
+    return summary
+
 def delete_project(project_name):
     """Delete a project and all its contents from S3"""
     if not project_name:
@@ -494,23 +486,35 @@ def delete_project(project_name):
     
     try:
         # List all objects in project
-        response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
+        keys = list_object_keys(prefix)
         
-        if 'Contents' not in response:
+        if not keys:
             logging.warning(f"Project path does not exist: {prefix}")
             return False
             
-        # Delete all objects
-        for obj in response['Contents']:
-            s3_client.delete_object(Bucket=BUCKET_NAME, Key=obj['Key'])
+        # Delete all objects in batched requests
+        summary = delete_objects(keys)
+        if summary['errors']:
+            logging.error(f"Failed to delete {len(summary['errors'])} objects from project: {project_name}")
+            return False
+        registry.remove_projects(username, [project_name])
             
         logging.info(f"Successfully deleted project: {project_name}")
         return True
         
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error deleting project {project_name}: {str(e)}")
         return False
 
+def repair_project_manifest(project_name):
+    """Rebuild a project's manifest from a full listing. Returns the number of objects indexed."""
+    username = session['user']['username']
+    try:
+        return len(manifests.rebuild(f"users/{username}/projects/{project_name}/"))
+    except StorageError as e:
+        logging.error(f"Error repairing manifest for project {project_name}: {str(e)}")
+        return 0
+
 # =============================================================================
 # Path Retrieval Functions
 # =============================================================================
@@ -584,6 +588,20 @@ def get_projects_path():
 # Prompt File Management
 # =============================================================================
 
+def prompt_file_for(project_type):
+    """Name of the prompt file in static/prompts for a project type, or None if the type is unknown."""
+    if project_type == "financial":
+        return "prompt.txt"
+    elif project_type == "catalyst":
+        return "catalyst_prompt.txt"
+    elif project_type == "real_estate":
+        return "real_estate_prompt.txt"
+    elif project_type == "ta_grading":
+        return "ta_grading_prompt.txt"
+    elif project_type == "fund_analysis":
+        return "fund_analysis_prompt.txt"
+    return None
+
 def copy_prompt_to_project():
     """Copy prompt file from local static folder to project's data directory in S3"""
     try:
@@ -591,17 +609,8 @@ def copy_prompt_to_project():
         current_project = session['current_project']['name']
         project_type = session['current_project']['type']
         # Determine the source prompt file based on project type
-        if project_type == "financial":
-            src_prompt = "prompt.txt"
-        elif project_type == "catalyst":
-            src_prompt = "catalyst_prompt.txt"
-        elif project_type == "real_estate":
-            src_prompt = "real_estate_prompt.txt"
-        elif project_type == "ta_grading":
-            src_prompt = "ta_grading_prompt.txt"
-        elif project_type == "fund_analysis":
-            src_prompt = "fund_analysis_prompt.txt"
-        else:
+        src_prompt = prompt_file_for(project_type)
+        if src_prompt is None:
             logging.error(f"Invalid project type: {project_type} - cannot copy prompt")
             return False
 
@@ -617,9 +626,9 @@ def copy_prompt_to_project():
         # Read local file and upload to S3
         with open(src_path, 'r', encoding='utf-8') as f:
             content = f.read()
-            s3_client.put_object(Bucket=BUCKET_NAME, Key=dest_key, Body=content.encode('utf-8'))
+            put_object(dest_key, content.encode('utf-8'))
             
-        logging.info(f"Successfully copied prompt file from static folder to s3://{BUCKET_NAME}/{dest_key}")
+        logging.info(f"Successfully copied prompt file from static folder to storage: {dest_key}")
         return True
 
     except Exception as e:
@@ -654,20 +663,18 @@ def ensure_user_exists(username):
     Returns True if the structure exists or was created successfully.
     """
     try:
-        user_prefix = f"users/{username}/"
-        
-        # Check if user folder exists
+        # Known users are answered from the cached registry without a round-trip
+        if registry.user_exists(username):
+            return True
+
+        # No registry yet: a new user, or one created before registries, whose projects are picked up here
+        logging.info(f"Creating registry for user {username}")
         try:
-            s3_client.head_object(Bucket=BUCKET_NAME, Key=user_prefix)
+            registry.rebuild(username)
             return True
-        except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                # User folder doesn't exist, create it
-                logging.info(f"Creating new user folder structure for {username}")
-                return create_new_user()
-            else:
-                logging.error(f"Error checking user folder: {str(e)}")
-                return False
+        except StorageError as e:
+            logging.error(f"Error checking user folder: {str(e)}")
+            return False
                 
     except Exception as e:
         logging.error(f"Error ensuring user exists: {str(e)}")
@@ -679,33 +686,27 @@ def list_project_data_files(data_path):
         # Normalize path - remove trailing slash if present
         normalized_path = data_path.rstrip('/') + '/'
         
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=normalized_path,
-            Delimiter="/"
-        )
+        response = list_objects(normalized_path, delimiter="/")
         
-        # Check both Contents and CommonPrefixes
-        files = []
-        if 'Contents' in response:
-            files = [
-                obj['Key'].split('/')[-1]
-                for obj in response['Contents']
-                if (
-                    obj['Key'].endswith('.json') 
-                    and not obj['Key'].endswith('_structure.json')
-                    and not obj['Key'].endswith('/') 
-                )
-            ]
+        # Check both objects and common prefixes
+        files = [
+            obj['key'].split('/')[-1]
+            for obj in response['objects']
+            if (
+                obj['key'].endswith('.json') 
+                and not obj['key'].endswith('_structure.json')
+                and not obj['key'].endswith('/') 
+            )
+        ]
             
         logging.debug(f"Found data files: {files}")
         if not files:
             logging.warning(f"No data files found at path: {normalized_path}")
-            logging.debug(f"Directory contents: {response.get('CommonPrefixes', [])}")
+            logging.debug(f"Directory contents: {response['prefixes']}")
             
         return files
         
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"AWS Error listing project data files: {str(e)}")
         return []
     except Exception as e:
@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+"""
+job_manager.py
+
+Runs heavy operations (OpenAI extraction, Excel and PowerPoint generation) as
+background jobs so request handlers return immediately with a job ID.
+
+Jobs and their progress events live in a SQLite database, so the queue needs
+no outside services and is shared by every web process on the host. Web
+processes only queue jobs. A fixed pool of worker processes, started once per
+host by job_worker.py, claims queued jobs one at a time. The store itself
+refuses a claim while JOB_WORKER_PROCESSES jobs are running, so the cap on
+CPU-heavy work per host holds even if more than one pool is started. Identical requests for the same project are
+deduplicated onto the job that is already queued or running.
+
+A claimed job is leased to its worker for JOB_LEASE_SECONDS and the worker
+renews the lease while the job runs. A running job whose lease has expired was
+abandoned by a worker that crashed or was restarted: it is requeued, or failed
+once it has been started JOB_MAX_ATTEMPTS times. Expired leases are swept when
+a worker pool starts and whenever a job is queued or claimed.
+
+Workers are started with the "spawn" method and are not daemonic: each worker
+imports the app fresh (never a half-imported copy forked from a web process)
+and may start its own process pools, e.g. for PDF extraction.
+
+Clients follow a job through /api/jobs/<job_id> (status),
+/api/jobs/<job_id>/events (server-sent events) and /api/jobs/<job_id>/result.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+import multiprocessing
+from contextlib import closing
+
+from flask import session
+
+from config import (
+    JOB_DB_PATH, JOB_WORKER_PROCESSES, JOB_POLL_SECONDS, JOB_RETENTION_SECONDS, JOB_WORKER_RESTART_SECONDS,
+    JOB_LEASE_SECONDS, JOB_HEARTBEAT_SECONDS, JOB_MAX_ATTEMPTS
+)
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# kind -> handler(params, job). Handlers are registered by the modules that own them (see app.py).
+JOB_HANDLERS = {}
+
+
+def register_job_handler(kind):
+    """Decorator registering the function that runs jobs of the given kind in a worker process."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+#=============================================================
+# SQLite job store
+#=============================================================
+class JobStore:
+    """Thin wrapper around the jobs database. Opens a connection per operation so it is safe across processes."""
+
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    dedup_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    lease_expires_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    claim_id TEXT
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+                CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status);
+                CREATE TABLE IF NOT EXISTS job_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id);
+            """)
+            self._add_lease_columns(conn)
+
+    @staticmethod
+    def _add_lease_columns(conn):
+        # Databases created before jobs were leased lack these columns
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, definition in (("lease_expires_at", "REAL"),
+                                 ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("claim_id", "TEXT")):
+            if name in columns:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+            except sqlite3.OperationalError as e:
+                # Another process added it first
+                if "duplicate column" not in str(e):
+                    raise
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("params", "context", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def create_or_get(self, kind, owner, params, context):
+        """
+        Queue a new job, or return the queued/running job with the same kind,
+        owner, project and parameters.
+
+        Returns
+        -------
+        tuple (dict, bool)
+            The job and whether it was newly created.
+        """
+        project = (context.get('current_project') or {}).get('name')
+        dedup_key = hashlib.sha256(
+            json.dumps([kind, owner, project, params], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # An abandoned run must not absorb new requests without ever finishing
+            self._requeue_stale(conn)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE dedup_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (dedup_key, QUEUED, RUNNING)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self._row_to_job(row), False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, owner, dedup_key, status, params, context, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, owner, dedup_key, QUEUED, json.dumps(params), json.dumps(context), time.time())
+            )
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+                (job_id, "status", json.dumps({"status": QUEUED}))
+            )
+            conn.execute("COMMIT")
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._row_to_job(row), True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim_next(self, max_running=JOB_WORKER_PROCESSES):
+        """
+        Atomically move the oldest queued job to running, leased to the caller
+        for JOB_LEASE_SECONDS, and return it. Returns None if there is no
+        queued job or max_running jobs are already running on this database.
+        The returned job's claim_id identifies the lease in heartbeat() and finish().
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._requeue_stale(conn)
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+            if running >= max_running:
+                conn.execute("COMMIT")
+                return None
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            claim_id = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                "claim_id = ? WHERE id = ?",
+                (RUNNING, now, now + JOB_LEASE_SECONDS, claim_id, row["id"])
+            )
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+                (row["id"], "status", json.dumps({"status": RUNNING, "attempt": row["attempts"] + 1}))
+            )
+            conn.execute("COMMIT")
+            job = self._row_to_job(row)
+            job.update(status=RUNNING, started_at=now, lease_expires_at=now + JOB_LEASE_SECONDS,
+                       attempts=row["attempts"] + 1, claim_id=claim_id)
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, claim_id):
+        """Renew the lease of a running job. Returns False if the lease was lost to a sweep."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND claim_id = ? AND status = ?",
+                (time.time() + JOB_LEASE_SECONDS, job_id, claim_id, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def requeue_stale(self):
+        """Requeue or fail running jobs whose lease has expired. Returns how many were found."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            count = self._requeue_stale(conn)
+            conn.execute("COMMIT")
+            return count
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _requeue_stale(self, conn):
+        """Sweep expired leases inside the caller's transaction."""
+        now = time.time()
+        rows = conn.execute(
+            "SELECT id, attempts FROM jobs WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+            (RUNNING, now)
+        ).fetchall()
+        for row in rows:
+            if row["attempts"] < JOB_MAX_ATTEMPTS:
+                logging.warning(f"[JobStore] Job {row['id']} was abandoned by its worker, requeueing")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = NULL, lease_expires_at = NULL, claim_id = NULL "
+                    "WHERE id = ?",
+                    (QUEUED, row["id"])
+                )
+                conn.execute(
+                    "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+                    (row["id"], "status", json.dumps({"status": QUEUED, "requeued": True}))
+                )
+            else:
+                error = f"Job was abandoned by its worker after {row['attempts']} attempts"
+                logging.error(f"[JobStore] {error}: {row['id']}")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL, "
+                    "claim_id = NULL WHERE id = ?",
+                    (FAILED, error, now, row["id"])
+                )
+                conn.execute(
+                    "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+                    (row["id"], "done", json.dumps({"status": FAILED, "result": None, "error": error}))
+                )
+        return len(rows)
+
+    def finish(self, job_id, status, result=None, error=None, claim_id=None):
+        """
+        Record the outcome of a job. With claim_id, only if the caller still
+        holds the job's lease; returns False if it does not.
+        """
+        with closing(self._connect()) as conn:
+            query = ("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires_at = NULL "
+                     "WHERE id = ?")
+            args = [status, json.dumps(result), error, time.time(), job_id]
+            if claim_id is not None:
+                query += " AND claim_id = ? AND status = ?"
+                args += [claim_id, RUNNING]
+            if conn.execute(query, args).rowcount != 1:
+                return False
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+                (job_id, "done", json.dumps({"status": status, "result": result, "error": error}))
+            )
+        return True
+
+    def add_event(self, job_id, event_type, data=None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+                (job_id, event_type, json.dumps(data or {}))
+            )
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            return self._row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def get_events(self, job_id, after_id=0):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id)
+            ).fetchall()
+        return [{"id": row["id"], "event": row["event"], "data": json.loads(row["data"])} for row in rows]
+
+    def prune(self, retention_seconds=JOB_RETENTION_SECONDS):
+        """Delete finished jobs, and their events, older than retention_seconds."""
+        cutoff = time.time() - retention_seconds
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+
+class JobHandle:
+    """Passed to job handlers so they can publish progress events."""
+
+    def __init__(self, store, job):
+        self.store = store
+        self.id = job["id"]
+        self.kind = job["kind"]
+
+    def publish(self, event_type, data=None):
+        self.store.add_event(self.id, event_type, data)
+
+
+#=============================================================
+# Job manager (web process side)
+#=============================================================
+class JobManager:
+    """
+    Queues jobs from request handlers and serves their status and events.
+    The workers that run the jobs are started separately, by job_worker.py
+    (see run_worker_pool).
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.store = JobStore(db_path)
+
+    def submit(self, kind, params):
+        """
+        Queue a job for the current session's user and project.
+
+        Returns
+        -------
+        tuple (dict, bool)
+            The job and whether it was newly created (False if deduplicated onto an existing run).
+        """
+        self.store.prune()
+        context = {
+            'user': session.get('user'),
+            'current_project': session.get('current_project')
+        }
+        job, created = self.store.create_or_get(kind, session['user']['username'], params, context)
+        if created:
+            logging.info(f"[JobManager] Queued {kind} job {job['id']}")
+        else:
+            logging.info(f"[JobManager] Reusing {job['status']} {kind} job {job['id']}")
+        return job, created
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def iter_events(self, job_id, last_event_id=0, heartbeat_seconds=15):
+        """
+        Yield job events after last_event_id as server-sent event strings until
+        the job finishes. A comment line is sent every heartbeat_seconds so idle
+        connections are not closed by the load balancer.
+        """
+        last_sent = time.monotonic()
+        while True:
+            events = self.store.get_events(job_id, last_event_id)
+            for event in events:
+                last_event_id = event["id"]
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["event"] == "done":
+                    return
+
+            if events:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= heartbeat_seconds:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(JOB_POLL_SECONDS)
+
+
+def job_to_dict(job):
+    """Public view of a job row for API responses."""
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "params": job["params"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "attempts": job["attempts"],
+        "error": job["error"]
+    }
+
+
+#=============================================================
+# Worker processes
+#=============================================================
+# Workers import the app, so they must never be forked from a process that is
+# still importing it. "spawn" starts each one from a fresh interpreter.
+_mp_context = multiprocessing.get_context("spawn")
+
+
+def start_worker(db_path=JOB_DB_PATH):
+    """Start one worker process. Not daemonic, so it may start process pools of its own."""
+    worker = _mp_context.Process(target=_worker_main, args=(db_path,), daemon=False, name="job-worker")
+    worker.start()
+    return worker
+
+
+def run_worker_pool(db_path=JOB_DB_PATH, worker_processes=JOB_WORKER_PROCESSES):
+    """
+    Run worker_processes workers until interrupted, restarting any that exit.
+    Run once per host (see job_worker.py).
+    """
+    # Jobs left running by a previous pool are requeued as soon as their leases run out
+    store = JobStore(db_path)
+    store.requeue_stale()
+    workers = [start_worker(db_path) for _ in range(worker_processes)]
+    logging.info(f"[JobManager] Started {len(workers)} job worker processes")
+    try:
+        while True:
+            time.sleep(JOB_WORKER_RESTART_SECONDS)
+            try:
+                store.requeue_stale()
+            except sqlite3.Error as e:
+                logging.error(f"[JobManager] Failed to sweep abandoned jobs: {e}")
+            for index, worker in enumerate(workers):
+                if not worker.is_alive():
+                    logging.error(f"[JobManager] Job worker {worker.pid} exited with code {worker.exitcode}, restarting")
+                    workers[index] = start_worker(db_path)
+    except KeyboardInterrupt:
+        logging.info("[JobManager] Stopping job workers")
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+def _worker_main(db_path):
+    """Claim and run queued jobs until the parent exits. Runs in a worker process."""
+    parent_pid = os.getppid()
+    try:
+        # Importing the app registers the job handlers and gives jobs a Flask context to run in
+        from app import app as flask_app
+    except Exception as e:
+        logging.critical(f"[job worker {os.getpid()}] Could not import the app, no jobs can run: {e}", exc_info=True)
+        raise SystemExit(1)
+
+    store = JobStore(db_path)
+    logging.info(f"[job worker {os.getpid()}] Waiting for jobs")
+    while True:
+        if os.getppid() != parent_pid:
+            logging.info(f"[job worker {os.getpid()}] Parent exited, stopping")
+            return
+        try:
+            job = store.claim_next()
+        except sqlite3.Error as e:
+            logging.error(f"[job worker {os.getpid()}] Failed to claim job: {e}")
+            job = None
+
+        if job is None:
+            time.sleep(JOB_POLL_SECONDS)
+            continue
+
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            store.finish(job["id"], FAILED, error=f"No handler for job kind: {job['kind']}", claim_id=job["claim_id"])
+            continue
+
+        logging.info(f"[job worker {os.getpid()}] Running {job['kind']} job {job['id']} (attempt {job['attempts']})")
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=_renew_lease, args=(store, job, stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            # Rebuild the submitting request's session so session-based project paths resolve
+            with flask_app.test_request_context():
+                session.update(job["context"])
+                result = handler(job["params"], JobHandle(store, job))
+            status, result, error = SUCCEEDED, result, None
+        except Exception as e:
+            logging.error(f"[job worker {os.getpid()}] Job {job['id']} failed: {str(e)}", exc_info=True)
+            status, result, error = FAILED, None, str(e)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        if not store.finish(job["id"], status, result=result, error=error, claim_id=job["claim_id"]):
+            logging.warning(f"[job worker {os.getpid()}] Lost the lease of job {job['id']}, discarding its outcome")
+
+
+def _renew_lease(store, job, stop):
+    """Renew a running job's lease every JOB_HEARTBEAT_SECONDS until stop is set."""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            if not store.heartbeat(job["id"], job["claim_id"]):
+                logging.warning(f"[job worker {os.getpid()}] Job {job['id']} lost its lease")
+                return
+        except sqlite3.Error as e:
+            logging.error(f"[job worker {os.getpid()}] Failed to renew the lease of job {job['id']}: {e}")
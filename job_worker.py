@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+job_worker.py
+
+Runs the background job workers of this host (see job_manager.py).
+
+Web processes only queue jobs, so under a multi-process server (gunicorn,
+flask run, ...) the workers run here instead, once per host, next to it:
+
+    gunicorn app:app
+    python job_worker.py
+
+Workers that exit are restarted. `python app.py` starts its own pool and needs
+no separate worker process.
+"""
+
+import logging
+
+from job_manager import run_worker_pool
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_worker_pool()
@@ -13,7 +13,7 @@ from file_manager import (
     get_project_data_path, get_project_structures_path,
     read_json, write_json, read_file, write_file, 
     upload_file_to_s3, download_file_from_s3,
-    s3_client, BUCKET_NAME
+    list_objects
 )
 from config import (
     STRUCTURE_FILES_DIR, 
@@ -21,6 +21,9 @@ from config import (
     OUTPUTS_FOR_PROJECT_TYPE, TA_GRADING_TABLE
 )
 from excel_generation.ingredients_code import Ingredient
+from table_store import get_table_store
+from structure_registry import get_structure_registry
+from prompt_audit import open_project_archive
 from flask import session
 
 
@@ -30,6 +33,8 @@ class JsonManager:
         logging.basicConfig(level=logging.DEBUG,
                           format='%(asctime)s - %(levelname)s - %(message)s - %(funcName)s',
                           handlers=[logging.StreamHandler()])
+        # Per-table files or a single bundle, per TABLE_STORAGE_LAYOUT
+        self.table_store = get_table_store()
         
     def initialize_json_files(self, data_path):
         """Initialize JSON structure and data files with default content based on project type."""
@@ -41,19 +46,18 @@ class JsonManager:
 
         try:
             # List structure files in S3
-            response = s3_client.list_objects_v2(
-                Bucket=BUCKET_NAME,
-                Prefix=f"{structures_path}/"
-            )
+            objects = list_objects(f"{structures_path}/")['objects']
             
-            if 'Contents' not in response:
+            if not objects:
                 logging.error("No structure files found in S3")
                 return False
 
             # Filter for structure files
-            structure_files = [obj['Key'] for obj in response['Contents'] 
-                             if obj['Key'].endswith('_structure.json')]
+            structure_files = [obj['key'] for obj in objects 
+                             if obj['key'].endswith('_structure.json')]
             
+            # Default content for every table, written together below
+            initial_tables = {}
             for structure_path in structure_files:
                 try:
                     logging.debug(f"Processing structure file: {structure_path}")
@@ -62,28 +66,24 @@ class JsonManager:
                     structure_data = read_json(structure_path)
                     logging.debug(f"Read structure data: {structure_data.keys()}")
                     
-                    # Get the table name from the first key in structure data
-                    table_key = next(iter(structure_data))
-                    file_info = structure_data[table_key]
-                    logging.debug(f"Table key: {table_key}, File info: {file_info.keys()}")
-                    
-                    # Create output S3 path by removing _structure from structure filename
-                    output_filename = structure_path.split('/')[-1].replace('_structure.json', '.json')
-                    output_path = f"{data_path}/{output_filename}"
-                    logging.debug(f"Output path: {output_path}")
+                    # Table name is the structure filename without _structure.json
+                    table_name = structure_path.split('/')[-1].replace('_structure.json', '')
+                    logging.debug(f"Table: {table_name}")
                     
                     # Get default content and root key from structure
-                    initial_data = {}
-                    initial_data[file_info["root_key"]] = file_info["default_content"][file_info["root_key"]]
-                    logging.debug(f"Initial data root key: {file_info['root_key']}")
-                    
-                    # Write directly to S3
-                    write_json(output_path, initial_data)
-                    logging.info(f"Created file with default content in S3: {output_path}")
+                    initial_tables[table_name] = self.initial_table_data(structure_data)
                     
                 except Exception as e:
                     logging.error(f"Failed to process structure file {structure_path}: {e}")
                     success = False
+
+            failed_tables = self.table_store.save_tables(data_path, initial_tables)
+            if failed_tables:
+                logging.error(f"Failed to write default content for tables: {failed_tables}")
+                success = False
+            else:
+                logging.info(f"Created {len(initial_tables)} tables with default content in {data_path}")
+            self.table_store.compact(data_path)
             
             # Create project metadata in S3
             project_path = '/'.join(data_path.split('/')[:-1])  # Get parent path in S3
@@ -106,23 +106,73 @@ class JsonManager:
         Returns:
             list: The loaded JSON data as a list of records
         """
+        return self.load_tables([table_identifier])[table_identifier]
+
+    def load_tables(self, table_identifiers):
+        """
+        Load JSON data for several tables of the current project at once. With
+        the bundle layout this is a single read however many tables are requested.
+        
+        Args:
+            table_identifiers (list): Names of the tables to load
+            
+        Returns:
+            dict: Table name -> list of records ([] for tables that could not be loaded)
+        """
         project_data_path = get_project_data_path()
-        file_path = f"{project_data_path}/{table_identifier}.json"
         
         try:
-            table_data = read_json(file_path)
-            
+            raw_tables = self.table_store.load_tables(project_data_path, table_identifiers)
+        except Exception as e:
+            logging.error(f"load_tables: Error loading tables from {project_data_path}: {e}")
+            return {table_identifier: [] for table_identifier in table_identifiers}
+
+        tables = {}
+        for table_identifier, table_data in raw_tables.items():
+            if table_data is None:
+                logging.error(f"load_tables: Could not load {project_data_path}/{table_identifier}")
+                tables[table_identifier] = []
             # If data is a dict with a single key containing a list, return the list
-            if isinstance(table_data, dict) and len(table_data) == 1:
-                return list(table_data.values())[0]
-            
+            elif isinstance(table_data, dict) and len(table_data) == 1:
+                tables[table_identifier] = list(table_data.values())[0]
             # Otherwise return the data as-is (should be a list)
-            return table_data
-                
-        except Exception as e:
-            logging.error(f"load_json_data: Error loading {file_path}: {e}")
-            return []
+            else:
+                tables[table_identifier] = table_data
+        return tables
+
+    def list_tables(self, data_path=None):
+        """Names of the data tables in the current project (structure files excluded)."""
+        return self.table_store.list_tables(data_path or get_project_data_path())
+
+    def compact_tables(self):
+        """Fold pending table updates into the bundle. A no-op with the per-table file layout."""
+        data_path = get_project_data_path()
+        if data_path:
+            self.table_store.compact(data_path)
     
+    @staticmethod
+    def structure_files_for(project_type):
+        """Structure file names in static/json_structure_data for a project type, or None if the type is unknown."""
+        if project_type == "catalyst":
+            return CATALYST_TABLE
+        elif project_type == "real_estate":
+            return REAL_ESTATE_TABLE
+        elif project_type == "financial":
+            return FINANCIALS_TABLE
+        elif project_type == "ta_grading":
+            return TA_GRADING_TABLE
+        elif project_type == "fund_analysis":
+            return FUND_ANALYSIS_TABLE
+        return None
+
+    @staticmethod
+    def initial_table_data(structure_data):
+        """Default content of the table described by a parsed structure file: {root_key: default rows}."""
+        # The table description is under the first key of the structure data
+        file_info = structure_data[next(iter(structure_data))]
+        root_key = file_info["root_key"]
+        return {root_key: file_info["default_content"][root_key]}
+
     def initialize_user_json_structures(self):
         """
         Copy JSON structure files from static folder to project structure folder in S3.
@@ -139,24 +189,11 @@ class JsonManager:
         logging.debug(f"[initialize_user_json_structures] User: {username}, Project: {current_project}, Type: {project_type}")
 
         # Get structure files list based on project type
-        if project_type == "catalyst":
-            structure_files = CATALYST_TABLE
-            logging.debug(f"Using CATALYST_TABLE with {len(CATALYST_TABLE)} files")
-        elif project_type == "real_estate":
-            structure_files = REAL_ESTATE_TABLE
-            logging.debug(f"Using REAL_ESTATE_TABLE with {len(REAL_ESTATE_TABLE)} files")
-        elif project_type == "financial":
-            structure_files = FINANCIALS_TABLE
-            logging.debug(f"Using FINANCIALS_TABLE with {len(FINANCIALS_TABLE)} files")
-        elif project_type == "ta_grading":
-            structure_files = TA_GRADING_TABLE
-            logging.debug(f"Using TA_GRADING_TABLE with {len(TA_GRADING_TABLE)} files")
-        elif project_type == "fund_analysis":
-            structure_files = FUND_ANALYSIS_TABLE
-            logging.debug(f"Using FUND_ANALYSIS_TABLE with {len(FUND_ANALYSIS_TABLE)} files")
-        else:
+        structure_files = self.structure_files_for(project_type)
+        if structure_files is None:
             logging.error(f"initialize_user_json_structures: Invalid project type: {project_type}")
             return False
+        logging.debug(f"Using {len(structure_files)} structure files for {project_type}")
 
         structures_path = get_project_structures_path()
         logging.debug(f"Structures path: {structures_path}")
@@ -207,22 +244,12 @@ class JsonManager:
         
         logging.debug(f"[update_json_files] Getting existing files for path: {project_data_path}")
         
-        # List existing files in S3 data directory
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=f"{project_data_path}/"
-        )
-        
-        existing_tables = []
-        if 'Contents' in response:
-            existing_tables = [
-                obj['Key'].split('/')[-1].replace('.json', '')
-                for obj in response['Contents']
-                if obj['Key'].endswith('.json')
-            ]
+        # List existing tables in the data directory
+        existing_tables = self.table_store.list_tables(project_data_path)
             
         logging.debug(f"[update_json_files] Found {len(existing_tables)} existing tables")
             
+        updated_tables = {}
         for table_name, new_data in json_data.items():
             logging.debug(f"[update_json_files] Processing table: {table_name}")
             
@@ -230,14 +257,15 @@ class JsonManager:
             if table_name not in existing_tables:
                 logging.warning(f"[update_json_files] Table {table_name} not found in project data directory")
                 continue
+            updated_tables[table_name] = new_data
 
-            # Write updated data to S3
-            file_path = f"{project_data_path}/{table_name}.json"
-            try:
-                write_json(file_path, new_data)
-                logging.info(f"[update_json_files] Successfully updated {table_name}.json for project {project_type}")
-            except Exception as e:
-                logging.error(f"[update_json_files] Failed to update {table_name}.json for project {project_type}: {e}")
+        # Write every updated table in one go (one delta with the bundle layout)
+        failed_tables = self.table_store.save_tables(project_data_path, updated_tables)
+        for table_name in updated_tables:
+            if table_name in failed_tables:
+                logging.error(f"[update_json_files] Failed to update {table_name} for project {project_type}")
+            else:
+                logging.info(f"[update_json_files] Successfully updated {table_name} for project {project_type}")
 
     def fix_incomplete_json(self, json_string):
         """Fix incomplete JSON by adding missing brackets"""
@@ -253,22 +281,17 @@ class JsonManager:
 
         return json_string
 
-    def save_json_to_file(self, json_data):
-        """Save JSON data to a timestamped file in S3"""
-        username = session.get('username')
-        current_project = session.get('current_project')
-        project_data_path = get_project_data_path()
-        save_directory = f"{project_data_path}/ai_responses"
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name = f"openai_response_{timestamp}.json"
-        file_path = f"{save_directory}/{file_name}"
-
-        try:
-            write_json(file_path, json_data)
-            logging.info(f"save_json_to_file: Saved JSON response to {file_path}")
-        except Exception as e:
-            logging.error(f"save_json_to_file: Failed to save JSON response: {e}")
+    def save_json_to_file(self, json_data, audit_archive=None):
+        """
+        Record a raw OpenAI response in the job's audit archive (see prompt_audit.py),
+        or in a new archive for the current project if none is given.
+        """
+        if audit_archive is None:
+            audit_archive = open_project_archive()
+            if audit_archive is None:
+                logging.error("save_json_to_file: No project selected, response not recorded")
+                return
+        audit_archive.record("response", json_data)
 
     def get_table_schema(self, table_name):
         """
@@ -282,6 +305,12 @@ class JsonManager:
             dict: The schema and display settings if found, None if not found
         """
         try:
+            # Parsed once from static/json_structure_data
+            schema = get_structure_registry().schema(table_name)
+            if schema:
+                return schema
+
+            # Tables with no local structure file: the project's own copy in S3
             structures_path = get_project_structures_path()
             structure_path = f"{structures_path}/{table_name}_structure.json"
             
@@ -308,6 +337,25 @@ class JsonManager:
             logging.error(f"[get_table_schema] Error retrieving schema for {table_name}: {str(e)}", exc_info=True)
             return None
 
+    @staticmethod
+    def build_project_metadata(project_type, username):
+        """Metadata for a new project: DEFAULT_PROJECT_METADATA with the dynamic fields filled in."""
+        current_time = datetime.now().isoformat()
+        
+        # Start with default metadata from config
+        metadata = DEFAULT_PROJECT_METADATA.copy()
+        
+        # Update dynamic fields
+        metadata["project_type"] = project_type
+        metadata["created_at"] = current_time 
+        metadata["last_modified_at"] = current_time
+        metadata["project_owner"] = username
+        metadata["collaborators"] = [username]
+        metadata["access_level"] = {
+            username: "admin"
+        }
+        return metadata
+
     def create_project_metadata(self, project_base, project_type):
         """
         Create a metadata JSON file for the project in S3 containing project information.
@@ -320,22 +368,7 @@ class JsonManager:
             bool: True if metadata was created successfully, False otherwise
         """
         try:
-            current_time = datetime.now().isoformat()
-            username = session.get('username')
-            
-            # Start with default metadata from config
-            metadata = DEFAULT_PROJECT_METADATA.copy()
-            
-            # Update dynamic fields
-            metadata["project_type"] = project_type
-            metadata["created_at"] = current_time 
-            metadata["last_modified_at"] = current_time
-            metadata["project_owner"] = username
-            metadata["collaborators"] = [username]
-            metadata["access_level"] = {
-                username: "admin"
-            }
-            
+            metadata = self.build_project_metadata(project_type, session.get('username'))
             metadata_path = f"{project_base}/project_metadata.json"
             write_json(metadata_path, metadata)
             logging.debug(f"Created project metadata at: {metadata_path}")
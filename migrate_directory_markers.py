@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+migrate_directory_markers.py
+
+One-off migration to the prefix-native storage layout.
+
+Earlier versions wrote an empty "prefix/" marker object for every user and
+project directory. Nothing reads them any more: users and projects come from
+user_registry.py and directories are plain prefixes. This tool deletes the
+markers in bulk, removes them from the project manifests, and builds a
+registry for every user that does not have one yet.
+
+Usage:
+    python migrate_directory_markers.py --dry-run
+    python migrate_directory_markers.py [--prefix users/<username>/]
+"""
+
+import argparse
+import logging
+
+from file_manager import storage, registry, delete_objects
+
+
+def find_markers(prefix="users/"):
+    """Keys of the empty directory marker objects under prefix."""
+    return [
+        obj["key"] for obj in storage.list(prefix)["objects"]
+        if obj["key"].endswith('/') and not obj["size"]
+    ]
+
+
+def migrate(prefix="users/", dry_run=False):
+    """
+    Remove directory markers under prefix and register every user found.
+
+    Returns
+    -------
+    dict
+        {"markers": marker count, "deleted": count, "errors": [...], "users": registries created}
+    """
+    markers = find_markers(prefix)
+    logging.info(f"[migrate] Found {len(markers)} directory markers under {prefix}")
+
+    users = [user_prefix.split('/')[1] for user_prefix in storage.list("users/", delimiter="/")["prefixes"]]
+    users = [username for username in users if f"users/{username}/".startswith(prefix) or prefix.startswith(f"users/{username}/")]
+    missing_users = [username for username in users if not registry.user_exists(username)]
+
+    if dry_run:
+        for key in markers:
+            print(f"would delete {key}")
+        for username in missing_users:
+            print(f"would create registry for {username}")
+        return {"markers": len(markers), "deleted": 0, "errors": [], "users": 0}
+
+    # Bulk delete; file_manager also drops the markers from the project manifests
+    summary = delete_objects(markers)
+    for error in summary["errors"]:
+        logging.error(f"[migrate] Failed to delete {error['key']}: {error['message']}")
+
+    for username in missing_users:
+        registry.rebuild(username)
+
+    return {
+        "markers": len(markers),
+        "deleted": len(summary["deleted"]),
+        "errors": summary["errors"],
+        "users": len(missing_users)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete directory marker objects and build user registries.")
+    parser.add_argument("--prefix", default="users/", help="Only migrate keys under this prefix (default: users/)")
+    parser.add_argument("--dry-run", action="store_true", help="List what would change without changing it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = migrate(args.prefix, dry_run=args.dry_run)
+    print(f"{result['markers']} markers found, {result['deleted']} deleted, "
+          f"{len(result['errors'])} errors, {result['users']} user registries created")
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+object_cache.py
+
+In-process read-through cache of object bytes keyed by storage key.
+
+Project tables, structure files, prompts and project metadata are read many
+times per request and again on the next request. Entries younger than the TTL
+are served from memory. Older entries are revalidated with a conditional GET
+on the stored ETag (If-None-Match), which costs a round-trip but no transfer
+when the object is unchanged. Writes made through file_manager update the
+cache, so a process always reads its own writes. Writes from other processes
+(job workers) become visible once the TTL lapses.
+
+The cache is bounded by total bytes and evicts least recently used entries.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from config import OBJECT_CACHE_MAX_BYTES, OBJECT_CACHE_MAX_OBJECT_BYTES, OBJECT_CACHE_TTL_SECONDS
+
+
+class ObjectCache:
+    """
+    LRU cache of {key: (body, etag, validated_at)} in front of a storage backend.
+
+    Parameters
+    ----------
+    storage : StorageBackend
+        Backend that misses and revalidations are read from.
+    max_bytes : int
+        Total size of cached bodies before least recently used entries are evicted.
+    ttl_seconds : float
+        How long an entry is served without revalidating its ETag.
+    max_object_bytes : int
+        Objects larger than this are read straight from storage and never cached.
+    """
+
+    def __init__(self, storage, max_bytes=OBJECT_CACHE_MAX_BYTES, ttl_seconds=OBJECT_CACHE_TTL_SECONDS,
+                 max_object_bytes=OBJECT_CACHE_MAX_OBJECT_BYTES):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_object_bytes = max_object_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "refreshed": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    def get(self, key):
+        """
+        Return the bytes stored under key, from memory when the cached copy is current.
+
+        Raises
+        ------
+        ObjectNotFound
+            If the key does not exist. A cached entry for it is dropped.
+        """
+        return self.get_with_etag(key)[0]
+
+    def get_with_etag(self, key):
+        """
+        Return (bytes, etag) for key, from memory when the cached copy is current.
+
+        Raises
+        ------
+        ObjectNotFound
+            If the key does not exist. A cached entry for it is dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if time.monotonic() - entry[2] < self.ttl_seconds:
+                    self._stats["hits"] += 1
+                    return entry[0], entry[1]
+
+        if entry is None:
+            obj = self.storage.get_object(key)
+            with self._lock:
+                self._stats["misses"] += 1
+            self._store(key, obj["body"], obj["etag"])
+            return obj["body"], obj["etag"]
+
+        try:
+            obj = self.storage.get_if_modified(key, entry[1])
+        except Exception:
+            self.invalidate(key)
+            raise
+
+        if obj is None:
+            with self._lock:
+                self._stats["revalidated"] += 1
+                if self._entries.get(key) is entry:
+                    self._entries[key] = (entry[0], entry[1], time.monotonic())
+            return entry[0], entry[1]
+
+        with self._lock:
+            self._stats["refreshed"] += 1
+        self._store(key, obj["body"], obj["etag"])
+        return obj["body"], obj["etag"]
+
+    def put(self, key, body, content_type=None, metadata=None, if_match=None):
+        """Write body through to storage and cache it under the ETag storage returns."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        # Drop the old entry first so a failed write never leaves it looking current
+        self.invalidate(key)
+        etag = self.storage.put(key, body, content_type=content_type, metadata=metadata, if_match=if_match)
+        if etag:
+            self._store(key, body, etag)
+        return etag
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry[0])
+                self._stats["invalidations"] += 1
+
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                entry = self._entries.pop(key)
+                self._size -= len(entry[0])
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Counters since startup plus current occupancy, for monitoring."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+            stats["max_bytes"] = self.max_bytes
+        lookups = stats["hits"] + stats["misses"] + stats["revalidated"] + stats["refreshed"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["revalidated"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _store(self, key, body, etag):
+        if len(body) > self.max_object_bytes:
+            self.invalidate(key)
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (body, etag, time.monotonic())
+            self._size += len(body)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+                self._stats["evictions"] += 1
+
+
+if __name__ == "__main__":
+    # Benchmark: repeated table reads against the local backend, cached vs uncached
+    import tempfile
+    import json
+    from storage_backend import LocalStorageBackend
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as root:
+        local = LocalStorageBackend(root)
+        keys = [f"users/bench/projects/p/data/table_{i}.json" for i in range(10)]
+        payload = json.dumps({"rows": [{"name": f"row {n}", "value": n} for n in range(500)]}, indent=4)
+        for key in keys:
+            local.put(key, payload)
+
+        rounds = 200
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                local.get(key)
+        uncached = time.perf_counter() - start
+
+        cache = ObjectCache(local, ttl_seconds=60)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                cache.get(key)
+        cached = time.perf_counter() - start
+
+        revalidating = ObjectCache(local, ttl_seconds=0)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                revalidating.get(key)
+        revalidated = time.perf_counter() - start
+
+        print(f"{rounds * len(keys)} reads of {len(payload)} byte tables")
+        print(f"  uncached:          {uncached * 1000:.1f} ms")
+        print(f"  cached (ttl 60s):  {cached * 1000:.1f} ms  {cache.stats()}")
+        print(f"  always revalidate: {revalidated * 1000:.1f} ms  {revalidating.stats()}")
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+openai_client.py
+
+Shared HTTP client for the OpenAI chat completions endpoint.
+
+A single module-level requests.Session holds a pool of keep-alive connections,
+so every call in a job (and every job in the process) reuses established
+TCP/TLS connections instead of paying a fresh handshake. Every request carries
+separate connect and read timeouts so a hung connection cannot block a worker.
+
+RateLimitScheduler keeps concurrent workers under the organisation's
+token-per-minute limit and retries 429/5xx responses with jittered
+exponential backoff, honouring the retry-after and x-ratelimit-* headers. The
+limit is organisation-wide, so its token window and pauses live in a SQLite
+database shared by every process on the host (web processes and job workers
+alike), and each of OPENAI_RATE_LIMIT_HOSTS hosts gets an equal share.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import time
+import random
+import logging
+import threading
+import requests
+from contextlib import closing
+from requests.adapters import HTTPAdapter
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_API_URL,
+    OPENAI_HTTP_POOL_SIZE,
+    OPENAI_CONNECT_TIMEOUT,
+    OPENAI_READ_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_BACKOFF_BASE_SECONDS,
+    OPENAI_BACKOFF_MAX_SECONDS,
+    OPENAI_TOKENS_PER_MINUTE,
+    OPENAI_RATE_LIMIT_HOSTS,
+    OPENAI_RATE_LIMIT_DB_PATH
+)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_openai_session():
+    """
+    Return the process-wide requests.Session for OpenAI, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are handled by the caller, so the adapter never retries on its own
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=OPENAI_HTTP_POOL_SIZE,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                logging.debug(f"[get_openai_session] Created OpenAI session with pool size {OPENAI_HTTP_POOL_SIZE}")
+    return _session
+
+
+def post_chat_completion(payload, api_url=OPENAI_API_URL, timeout=None, stream=False):
+    """
+    POST a chat completion payload over the pooled session.
+
+    Parameters
+    ----------
+    payload : dict
+        The request body.
+    api_url : str, optional
+        Endpoint URL. Defaults to OPENAI_API_URL.
+    timeout : tuple (float, float), optional
+        (connect, read) timeouts in seconds. Defaults to the configured values.
+    stream : bool, optional
+        Passed through to requests so the body can be consumed incrementally.
+
+    Returns
+    -------
+    requests.Response
+
+    Raises
+    ------
+    requests.exceptions.RequestException
+        On connection errors and timeouts.
+    """
+    headers = {
+        'Authorization': f'Bearer {OPENAI_API_KEY}',
+        'Content-Type': 'application/json'
+    }
+    if timeout is None:
+        timeout = (OPENAI_CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT)
+
+    return get_openai_session().post(api_url, headers=headers, json=payload, timeout=timeout, stream=stream)
+
+
+def iter_stream_events(response):
+    """
+    Yield each decoded server-sent event from a streaming chat completion response.
+    Nothing after the terminating "data: [DONE]" line is yielded, but the body is
+    read to its end so the connection goes back to the pool instead of being closed.
+    """
+    done = False
+    for line in response.iter_lines(decode_unicode=True):
+        if done or not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            done = True
+            continue
+        try:
+            yield json.loads(data)
+        except ValueError:
+            logging.warning(f"[iter_stream_events] Skipping undecodable stream line: {data[:200]}")
+
+
+def close_openai_session():
+    """Close all pooled connections. The next call creates a fresh session."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+#=============================================================
+# Rate limiting and retries
+#=============================================================
+def parse_reset_duration(value):
+    """
+    Parse an OpenAI reset duration such as "1s", "6m0s" or "250ms" into seconds.
+    Returns None if the value can't be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    matches = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not matches:
+        return None
+    units = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    return sum(float(amount) * units[unit] for amount, unit in matches)
+
+
+class RateLimitScheduler:
+    """
+    Coordinates OpenAI calls from every worker thread and process on the host.
+
+    Each call reserves its estimated tokens in a sliding one-minute window and
+    waits while the window is full, so concurrent table groups and jobs stay
+    under the token-per-minute limit instead of running into 429s. The window
+    is also paused whenever the server reports that its remaining token budget
+    is lower than the next call needs, or answers 429. Reservations and pauses
+    are kept in the SQLite database at db_path, so every process using the same
+    database shares one budget.
+    """
+
+    def __init__(self, tokens_per_minute=OPENAI_TOKENS_PER_MINUTE // OPENAI_RATE_LIMIT_HOSTS,
+                 db_path=OPENAI_RATE_LIMIT_DB_PATH, max_retries=OPENAI_MAX_RETRIES,
+                 backoff_base=OPENAI_BACKOFF_BASE_SECONDS, backoff_max=OPENAI_BACKOFF_MAX_SECONDS):
+        self.tokens_per_minute = tokens_per_minute
+        self.db_path = db_path
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS reservations (
+                    reserved_at REAL NOT NULL,
+                    tokens INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS reservations_time ON reservations (reserved_at);
+                CREATE TABLE IF NOT EXISTS pause (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    paused_until REAL NOT NULL
+                );
+                INSERT OR IGNORE INTO pause (id, paused_until) VALUES (0, 0);
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def try_reserve(self, estimated_tokens):
+        """
+        Reserve estimated_tokens if they fit in the current one-minute budget.
+
+        Returns
+        -------
+        tuple (float, int)
+            Seconds to wait before trying again (0 if the tokens were reserved)
+            and the tokens already reserved in the window.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Wall-clock time, since the window is shared between processes
+            now = time.time()
+            conn.execute("DELETE FROM reservations WHERE reserved_at <= ?", (now - 60,))
+            paused_until = conn.execute("SELECT paused_until FROM pause WHERE id = 0").fetchone()[0]
+            used, oldest = conn.execute("SELECT COALESCE(SUM(tokens), 0), MIN(reserved_at) FROM reservations").fetchone()
+            if now >= paused_until and used + estimated_tokens <= self.tokens_per_minute:
+                conn.execute("INSERT INTO reservations (reserved_at, tokens) VALUES (?, ?)", (now, estimated_tokens))
+                wait = 0.0
+            elif now < paused_until:
+                wait = paused_until - now
+            else:
+                wait = 60 - (now - oldest)
+            conn.execute("COMMIT")
+            return wait, used
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self, estimated_tokens):
+        """Block until estimated_tokens fit in the current one-minute budget, then reserve them."""
+        # A single call larger than the whole budget can only ever wait for an empty window
+        estimated_tokens = min(estimated_tokens, self.tokens_per_minute)
+        while True:
+            wait, used = self.try_reserve(estimated_tokens)
+            if wait <= 0:
+                return
+            logging.debug(f"[RateLimitScheduler] Waiting {wait:.2f}s for token budget ({used} used)")
+            time.sleep(max(wait, 0.01))
+
+    def paused_for(self):
+        """Seconds until a pause set by any process on the host ends, 0 if there is none."""
+        with closing(self._connect()) as conn:
+            paused_until = conn.execute("SELECT paused_until FROM pause WHERE id = 0").fetchone()[0]
+        return max(paused_until - time.time(), 0.0)
+
+    def pause(self, seconds):
+        """Hold back every worker on the host for the given number of seconds."""
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE pause SET paused_until = MAX(paused_until, ?) WHERE id = 0", (time.time() + seconds,))
+
+    def observe_headers(self, headers, next_call_tokens=0):
+        """Pause new calls when the server reports too few remaining tokens or requests."""
+        for kind in ('tokens', 'requests'):
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            if remaining is None or reset is None:
+                continue
+            try:
+                remaining = int(remaining)
+            except ValueError:
+                continue
+            needed = next_call_tokens if kind == 'tokens' else 1
+            if remaining < needed:
+                logging.info(f"[RateLimitScheduler] {remaining} {kind} remaining, pausing {reset:.2f}s")
+                self.pause(reset)
+
+    def backoff_delay(self, attempt, headers=None):
+        """
+        Seconds to wait before retry number `attempt` (0-based).
+        Uses retry-after when the server sends it, otherwise full-jitter exponential backoff.
+        """
+        headers = headers or {}
+        retry_after_ms = headers.get('retry-after-ms')
+        retry_after = headers.get('retry-after')
+        try:
+            if retry_after_ms is not None:
+                return float(retry_after_ms) / 1000
+            if retry_after is not None:
+                return float(retry_after)
+        except ValueError:
+            pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def send(self, payload, estimated_tokens, api_url=OPENAI_API_URL, timeout=None, stream=False):
+        """
+        Send a chat completion, waiting for budget and retrying 429/5xx responses and connection errors.
+
+        Returns
+        -------
+        requests.Response
+            The final response, which may still be an error once retries are exhausted.
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the last attempt fails at the connection level.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(estimated_tokens)
+            try:
+                response = post_chat_completion(payload, api_url=api_url, timeout=timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"[RateLimitScheduler] {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            self.observe_headers(response.headers, estimated_tokens)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                return response
+
+            delay = self.backoff_delay(attempt, response.headers)
+            response.close()
+            if response.status_code == 429:
+                # Everyone backs off, not just this worker
+                self.pause(delay)
+            logging.warning(f"[RateLimitScheduler] Status {response.status_code} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+        return response
+
+
+_scheduler = None
+
+
+def get_rate_limit_scheduler():
+    """Return the process-wide RateLimitScheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _session_lock:
+            if _scheduler is None:
+                _scheduler = RateLimitScheduler()
+    return _scheduler
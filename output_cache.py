@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+output_cache.py
+
+Content-addressed cache keys for generated outputs.
+
+An output is a pure function of what its generator reads: the project's data
+objects (tables, bundle and deltas, structures), its gallery, the generator's
+templates and format YAML, and the generator code itself. output_cache_key()
+hashes the ETags of the project objects (taken from the project manifest, so
+computing a key costs no storage round-trips) together with content hashes of
+the generator package and OUTPUT_CACHE_VERSION.
+
+The key of the last artifact generated for each output type is kept in the
+project metadata under "output_cache", next to "last_output_generated". When
+the current key matches and the artifact is still in outputs/, it is returned
+as-is instead of being regenerated.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from config import OUTPUT_CACHE_VERSION
+from file_manager import list_objects, read_json, write_json
+from storage_backend import StorageError
+
+# Local directories whose files (code, templates, format YAML) each output depends on
+OUTPUT_SOURCE_DIRS = {
+    "excel_model": ["excel_generation"],
+    "excel_overview": ["excel_generation"],
+    "powerpoint_overview": ["powerpoint_generation"]
+}
+
+# Project directories each output reads from storage
+OUTPUT_PROJECT_DIRS = ["data/", "gallery/"]
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (path, mtime_ns, size) -> sha256 of the file, so unchanged sources are hashed once per process
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def _file_hash(path, stat_result):
+    memo_key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+    with _file_hashes_lock:
+        digest = _file_hashes.get(memo_key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with _file_hashes_lock:
+            _file_hashes[memo_key] = digest
+    return digest
+
+
+def source_fingerprint(output_type):
+    """Hash of every code, template and format file the generator for output_type is built from."""
+    digest = hashlib.sha256()
+    source_dirs = OUTPUT_SOURCE_DIRS.get(output_type, [])
+    paths = [os.path.join(_BASE_DIR, "output_manager.py")]
+    for source_dir in source_dirs:
+        for dir_path, dir_names, file_names in os.walk(os.path.join(_BASE_DIR, source_dir)):
+            dir_names[:] = sorted(name for name in dir_names if name != "__pycache__")
+            paths.extend(os.path.join(dir_path, name) for name in sorted(file_names) if not name.endswith(".pyc"))
+    for path in paths:
+        digest.update(os.path.relpath(path, _BASE_DIR).encode('utf-8'))
+        digest.update(_file_hash(path, os.stat(path)).encode('ascii'))
+    return digest.hexdigest()
+
+
+def output_cache_key(project_base, output_type, project_type):
+    """
+    Cache key for generating output_type in the project at project_base
+    ("users/<username>/projects/<project>"). Changes whenever any input does.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{OUTPUT_CACHE_VERSION}\n{output_type}\n{project_type}\n".encode('utf-8'))
+    digest.update(source_fingerprint(output_type).encode('ascii'))
+    for project_dir in OUTPUT_PROJECT_DIRS:
+        for obj in sorted(list_objects(f"{project_base}/{project_dir}")["objects"], key=lambda obj: obj["key"]):
+            digest.update(f"{obj['key']}\0{obj['etag']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def find_cached_output(project_base, metadata, output_type, cache_key):
+    """
+    Return the S3 key of the artifact recorded for output_type if it was
+    generated from cache_key and still exists, else None.
+    """
+    entry = (metadata or {}).get("output_cache", {}).get(output_type)
+    if not entry or entry.get("cache_key") != cache_key:
+        return None
+    file_path = entry.get("file_path")
+    outputs = list_objects(f"{project_base}/outputs/")["objects"]
+    if not any(obj["key"] == file_path for obj in outputs):
+        return None
+    return file_path
+
+
+def record_output(project_base, output_type, cache_key, file_path):
+    """
+    Record in the project metadata that file_path was generated for
+    output_type from cache_key. Needs no request context, so it can run after
+    a background upload. Returns True on success.
+    """
+    metadata_path = f"{project_base}/project_metadata.json"
+    try:
+        metadata = read_json(metadata_path)
+    except (StorageError, ValueError) as e:
+        logging.error(f"[record_output] Could not read metadata {metadata_path}: {e}")
+        return False
+
+    timestamp = datetime.now().isoformat()
+    metadata["last_output_generated"] = {"timestamp": timestamp, "type": output_type, "cache_key": cache_key}
+    output_cache = dict(metadata.get("output_cache") or {})
+    output_cache[output_type] = {"cache_key": cache_key, "file_path": file_path, "generated_at": timestamp}
+    metadata["output_cache"] = output_cache
+    metadata["last_modified_at"] = timestamp
+    return write_json(metadata_path, metadata)
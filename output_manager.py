@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+output_manager.py
+
+Generates the downloadable outputs (Excel models and PowerPoint decks) for the
+current project and stores them in the project's outputs directory in S3.
+Shared by the /download_output endpoint and background output jobs.
+
+Generators build their files in memory. /download_output sends those bytes to
+the client straight away and stores them in S3 on a background thread, so a
+download never waits on an upload and a download back through a temp file.
+
+Before generating, the cache key of the output's inputs is computed (see
+output_cache.py). If the artifact last generated for that output type was
+built from the same inputs, it is returned instead of being regenerated.
+"""
+
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ALLOWABLE_PROJECT_TYPES, OUTPUTS_FOR_PROJECT_TYPE, OUTPUT_UPLOAD_WORKERS
+from file_manager import get_project_outputs_path, get_project_metadata, put_object
+from output_cache import output_cache_key, find_cached_output, record_output
+from excel_generation.auto_financial_modeling import generate_excel_model
+from excel_generation.catalyst_partners_page import make_catalyst_summary
+from powerpoint_generation.ppt_financial import generate_ppt
+from powerpoint_generation.ppt_fund_analysis import generate_fund_analysis_ppt
+from powerpoint_generation.ppt_real_estate import generate_real_estate_ppt
+
+
+class OutputGenerationError(Exception):
+    """Raised when an output can't be generated. status_code is the HTTP status to report."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def validate_output_request(output_type, project_type):
+    """
+    Check that output_type can be generated for project_type.
+
+    Raises
+    ------
+    OutputGenerationError
+        With status 400 if the combination isn't allowed.
+    """
+    if not output_type:
+        raise OutputGenerationError("Output type is required", 400)
+    if not project_type:
+        raise OutputGenerationError("Project type is required", 400)
+    if project_type not in ALLOWABLE_PROJECT_TYPES.values():
+        raise OutputGenerationError("Invalid project type", 400)
+    if output_type not in OUTPUTS_FOR_PROJECT_TYPE.get(project_type, []):
+        raise OutputGenerationError(f"Output type {output_type} not available for {project_type} projects", 400)
+
+
+# Stores outputs that were already sent to the client
+_upload_executor = ThreadPoolExecutor(max_workers=OUTPUT_UPLOAD_WORKERS, thread_name_prefix="output-upload")
+
+
+def store_output(s3_path, body):
+    """
+    Store generated output bytes in S3.
+
+    Raises
+    ------
+    OutputGenerationError
+        If the upload fails.
+    """
+    try:
+        put_object(s3_path, body)
+    except Exception as e:
+        logging.error(f"[store_output] Failed to upload {s3_path} to S3: {str(e)}")
+        raise OutputGenerationError("Failed to save output")
+    logging.info(f"[store_output] Successfully uploaded output to S3: {s3_path}")
+
+
+def store_output_in_background(s3_path, body, on_stored=None):
+    """Store output bytes in S3 on a background thread, then call on_stored(). Returns the Future."""
+    def upload():
+        try:
+            store_output(s3_path, body)
+        except OutputGenerationError:
+            # Already logged; the client has its copy and the next download regenerates it
+            return
+        if on_stored is not None:
+            on_stored()
+    return _upload_executor.submit(upload)
+
+
+def lookup_output(output_type, project_type):
+    """
+    Compute the cache key of the current project's inputs for output_type.
+
+    Returns
+    -------
+    tuple
+        (project base path, cache key, S3 key of a matching stored artifact or None).
+        The cache key is None if it could not be computed.
+    """
+    outputs_path = get_project_outputs_path()
+    if not outputs_path:
+        return None, None, None
+    project_base = outputs_path.rsplit('/', 1)[0]
+    try:
+        cache_key = output_cache_key(project_base, output_type, project_type)
+        cached_path = find_cached_output(project_base, get_project_metadata(), output_type, cache_key)
+    except Exception as e:
+        logging.warning(f"[lookup_output] Could not check the output cache: {str(e)}")
+        return project_base, None, None
+    if cached_path:
+        logging.info(f"[lookup_output] Inputs unchanged, reusing {cached_path}")
+    return project_base, cache_key, cached_path
+
+
+def remember_output(project_base, output_type, cache_key, s3_path):
+    """Record the stored artifact for output_type under its cache key in the project metadata."""
+    if project_base and cache_key and s3_path:
+        record_output(project_base, output_type, cache_key, s3_path)
+
+
+def generate_output(output_type, project_type):
+    """
+    Generate the requested output for the current project and store it in S3.
+
+    Parameters
+    ----------
+    output_type : str
+        One of the OUTPUTS_FOR_PROJECT_TYPE values, e.g. 'excel_model' or 'powerpoint_overview'.
+    project_type : str
+        The current project's type.
+
+    Returns
+    -------
+    str
+        The S3 key of the generated file.
+
+    Raises
+    ------
+    OutputGenerationError
+        If the output isn't supported or can't be saved.
+    """
+    validate_output_request(output_type, project_type)
+    project_base, cache_key, cached_path = lookup_output(output_type, project_type)
+    if cached_path:
+        return cached_path
+
+    s3_path, body = render_output(output_type, project_type)
+    if body is not None:
+        store_output(s3_path, body)
+    remember_output(project_base, output_type, cache_key, s3_path)
+    return s3_path
+
+
+def render_output(output_type, project_type):
+    """
+    Generate the requested output for the current project without storing it.
+
+    Returns
+    -------
+    tuple
+        (S3 key the output belongs at, bytes of the file). The bytes are None
+        for generators that store their file in S3 themselves.
+
+    Raises
+    ------
+    OutputGenerationError
+        If the output isn't supported.
+    """
+    validate_output_request(output_type, project_type)
+
+    outputs_path = get_project_outputs_path()
+    if not outputs_path:
+        raise OutputGenerationError("Could not access project outputs directory")
+
+    logging.info(f"[generate_output] Starting file generation for output type: {output_type}")
+    if output_type in ['excel_model', 'excel_overview']:
+        if project_type == "financial":
+            logging.debug("[generate_output] Generating financial Excel model")
+            file_name, workbook_bytes = generate_excel_model()
+            return f"{outputs_path}/{file_name}", workbook_bytes
+        if project_type == "catalyst":
+            logging.debug("[generate_output] Generating catalyst Excel summary")
+            file_name, workbook_bytes = make_catalyst_summary()
+            return f"{outputs_path}/{file_name}", workbook_bytes
+        raise OutputGenerationError("Excel output not supported for this project type", 400)
+
+    if output_type == 'powerpoint_overview':
+        if project_type == "financial":
+            return generate_ppt(), None
+        if project_type == "real_estate":
+            file_name = generate_real_estate_ppt()
+            return f"{outputs_path}/{file_name}", None
+        if project_type == "fund_analysis":
+            logging.info("[generate_output] Generating fund analysis PowerPoint")
+            ppt_bytes = generate_fund_analysis_ppt()
+
+            # Generate a unique filename for the bytes
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            return f"{outputs_path}/fund_analysis_{timestamp}.pptx", ppt_bytes
+        raise OutputGenerationError("PowerPoint generation not supported for this project type", 400)
+
+    raise OutputGenerationError("Invalid output type", 400)
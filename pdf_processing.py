@@ -1,22 +1,235 @@
 import os
+import json
+import time
+import hashlib
 import pdfplumber
 import tiktoken
 import logging
+import multiprocessing
 from typing import List
-from config import MAX_TOKENS_PER_CALL, OPENAI_MODEL, BUCKET_NAME
-from file_manager import get_project_uploads_path
-from upload_file_manager import count_tokens
-from boto3 import client
-from botocore.exceptions import ClientError
+from concurrent.futures import ProcessPoolExecutor
+from config import (
+    OPENAI_MODEL,
+    PDF_PAGE_CACHE_DIR, PDF_PAGE_CACHE_MAX_ENTRIES,
+    PDF_EXTRACTION_WORKERS, PDF_EXTRACTION_BATCH_SIZE
+)
+from file_manager import get_project_uploads_path, storage
+from storage_backend import StorageError
+from upload_file_manager import count_tokens_many
 import tempfile
 from flask import session
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-# Initialize S3 client
-s3_client = client('s3')
 
+class PdfExtractionError(Exception):
+    """Raised when an uploaded PDF can't be downloaded or its text can't be extracted."""
+
+
+def page_marker(page_index):
+    """Boundary marker put after a page's text in a chunk."""
+    return f"---END OF PAGE {page_index + 1}---"
+
+
+class PdfDocument:
+    """
+    A PDF that has been downloaded and parsed once for the lifetime of a job.
+
+    Page text and per-page token counts are computed up front, so every chunk
+    of every table group is sliced out of memory instead of going back to S3
+    and pdfplumber.
+    """
+
+    def __init__(self, file_name, pages=None, page_token_counts=None):
+        self.file_name = file_name
+        self.pages = pages or []
+        if page_token_counts is None:
+            page_token_counts = count_tokens_many(self.pages)
+        self.page_token_counts = page_token_counts
+        self._chunk_token_counts = None
+
+    def __len__(self):
+        return len(self.pages)
+
+    @property
+    def chunk_token_counts(self):
+        """
+        Tokens each page adds to a chunk from get_content_by_page_indices: its
+        text plus its boundary marker and the line breaks around it.
+        """
+        if self._chunk_token_counts is None:
+            marker_counts = count_tokens_many([f"\n{page_marker(page_index)}\n" for page_index in range(len(self.pages))])
+            self._chunk_token_counts = [
+                token_count + marker_count for token_count, marker_count in zip(self.page_token_counts, marker_counts)
+            ]
+        return self._chunk_token_counts
+
+    def get_content_by_page_indices(self, start_page: int, end_page: int) -> str:
+        """
+        Returns the content of the pages in [start_page, end_page) with page boundary markers.
+        """
+        selected_content = []
+        for page_index in range(start_page, min(end_page, len(self.pages))):
+            selected_content.append(self.pages[page_index])
+            # Append page boundary marker
+            selected_content.append(page_marker(page_index))
+
+        return "\n".join(selected_content)
+
+
+def load_pdf_document(file_name) -> PdfDocument:
+    """
+    Download and extract a PDF from the project's uploads once, returning a PdfDocument.
+    Page text and token counts are served from the page cache when the upload's
+    content hash has been seen before. An empty document is returned if no file is given.
+
+    Raises
+    ------
+    PdfExtractionError
+        If the file can't be downloaded or its pages can't be extracted.
+    """
+    if not file_name:
+        return PdfDocument(file_name)
+
+    content_hash = get_pdf_content_hash(file_name)
+    cached = read_page_cache(content_hash) if content_hash else None
+    if cached:
+        document = PdfDocument(file_name, cached["pages"], cached["page_token_counts"])
+        logging.info(f"Loaded PDF {file_name} from page cache: {len(document)} pages")
+        return document
+
+    document = PdfDocument(file_name, extract_pdf_pages(file_name))
+    if content_hash and document.pages:
+        write_page_cache(content_hash, document)
+    logging.info(f"Loaded PDF {file_name}: {len(document)} pages, {sum(document.page_token_counts)} tokens")
+    return document
+
+
+#=============================================================
+# Page cache
+#=============================================================
+def get_pdf_content_hash(file_name):
+    """
+    Returns a cache key for an uploaded PDF derived from its storage ETag and the tokenizer model.
+    Replacing the file through /api/upload_file changes the ETag, so stale entries are never hit.
+    """
+    uploads_dir = get_project_uploads_path()
+    if not uploads_dir:
+        return None
+
+    pdf_path = f"{uploads_dir}/{file_name}".replace('\\', '/')
+    try:
+        etag = storage.head(pdf_path)['etag']
+    except StorageError as e:
+        logging.error(f"Could not read ETag for {pdf_path}: {e}")
+        return None
+
+    if not etag:
+        return None
+    return hashlib.sha256(f"{etag}:{OPENAI_MODEL}".encode('utf-8')).hexdigest()
+
+
+def _page_cache_path(content_hash):
+    return os.path.join(PDF_PAGE_CACHE_DIR, f"{content_hash}.pages.json")
+
+
+def read_page_cache(content_hash):
+    """Return the cached {"pages", "page_token_counts"} entry for a content hash, or None."""
+    cache_path = _page_cache_path(content_hash)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        # Touch the entry so eviction drops the least recently used files first
+        os.utime(cache_path, None)
+        return entry
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable page cache entry {cache_path}: {e}")
+        return None
+
+
+def write_page_cache(content_hash, document):
+    """Persist a document's pages and token counts, then evict the oldest entries over the limit."""
+    try:
+        os.makedirs(PDF_PAGE_CACHE_DIR, exist_ok=True)
+        cache_path = _page_cache_path(content_hash)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "file_name": document.file_name,
+                "model": OPENAI_MODEL,
+                "pages": document.pages,
+                "page_token_counts": document.page_token_counts
+            }, f)
+        os.replace(temp_path, cache_path)
+        evict_page_cache()
+    except OSError as e:
+        logging.warning(f"Failed to write page cache for {document.file_name}: {e}")
+
+
+def evict_page_cache(max_entries=PDF_PAGE_CACHE_MAX_ENTRIES):
+    """Remove least recently used page cache entries beyond max_entries."""
+    try:
+        entries = [
+            os.path.join(PDF_PAGE_CACHE_DIR, name)
+            for name in os.listdir(PDF_PAGE_CACHE_DIR)
+            if name.endswith('.pages.json')
+        ]
+    except FileNotFoundError:
+        return
+
+    if len(entries) <= max_entries:
+        return
+
+    entries.sort(key=os.path.getmtime)
+    for stale_path in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(stale_path)
+            logging.debug(f"Evicted page cache entry {stale_path}")
+        except OSError:
+            pass
+
+
+def extract_local_pdf_pages(pdf_path, workers=PDF_EXTRACTION_WORKERS, batch_size=PDF_EXTRACTION_BATCH_SIZE) -> List[str]:
+    """
+    Extracts text from each page of a PDF file on local disk.
+
+    With more than one worker and more than one batch of pages, page ranges are
+    extracted in a process pool. Results are returned in page order and match
+    the serial output exactly.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+
+    # Daemonic processes can't have children, so extract serially inside one
+    if multiprocessing.current_process().daemon:
+        workers = 1
+
+    if workers <= 1 or page_count <= batch_size:
+        return _extract_page_range(pdf_path, 0, page_count)
+
+    page_ranges = [(start, min(start + batch_size, page_count)) for start in range(0, page_count, batch_size)]
+    logging.debug(f"Extracting {page_count} pages from {pdf_path} in {len(page_ranges)} batches across {workers} workers")
+
+    pages = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(page_ranges))) as executor:
+        futures = [executor.submit(_extract_page_range, pdf_path, start, end) for start, end in page_ranges]
+        # Collect in submission order so pages stay in document order
+        for future in futures:
+            pages.extend(future.result())
+    return pages
+
+
+def _extract_page_range(pdf_path, start_page, end_page) -> List[str]:
+    """Extract the text of pages [start_page, end_page). Runs in pool workers, so it must stay module-level."""
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages[start_page:end_page]:
+            page_text = page.extract_text() or ""
+            pages.append(page_text)
+    return pages
 
 
 # Function to extract text from a PDF, divided by pages
@@ -29,12 +242,16 @@ def extract_pdf_pages(file_name) -> List[str]:
     
     Returns:
     List[str]: A list of strings where each string is the text content of a page.
+
+    Raises:
+    PdfExtractionError: If the PDF can't be downloaded or extracted. Failing
+    loudly keeps a job from running on an empty document.
     """
     username = session.get('username')
     uploads_dir = get_project_uploads_path()
     if not uploads_dir:
         logging.error(f"Could not find uploads directory for user {username}")
-        return []
+        raise PdfExtractionError(f"No uploads directory for {file_name}")
         
     pdf_path = f"{uploads_dir}/{file_name}".replace('\\', '/')
     
@@ -42,103 +259,79 @@ def extract_pdf_pages(file_name) -> List[str]:
         # Create temp file that deletes itself when closed
         with tempfile.NamedTemporaryFile(suffix='.pdf', delete=True) as temp_file:
             # Download PDF from S3
-            s3_client.download_file(BUCKET_NAME, pdf_path, temp_file.name)
+            storage.download_file(pdf_path, temp_file.name)
             
             # Process PDF while temp file is still open
-            pages = []
-            with pdfplumber.open(temp_file.name) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text() or ""
-                    pages.append(page_text)
-            
-            return pages
+            return extract_local_pdf_pages(temp_file.name)
             
-    except ClientError as e:
+    except StorageError as e:
         logging.error(f"Error accessing PDF in S3: {e}")
-        return []
+        raise PdfExtractionError(f"Could not download {file_name}: {e}") from e
     except Exception as e:
-        logging.error(f"Error extracting text from PDF: {e}")
-        return []
+        logging.error(f"Error extracting text from PDF: {e}", exc_info=True)
+        raise PdfExtractionError(f"Could not extract text from {file_name}: {e}") from e
 
-#Function to get the token count for each pdf page
-def get_page_token_counts(file_name) -> List[int]:
-    """
-    Returns a list of token counts for each page in the PDF.
-    
-    Parameters:
-    file_name: The name of the PDF file
-    Returns:
-    List[int]: A list of integers where each integer is the token count for a page.
-    """
-    
-    username = session.get('username')
-    current_project = session.get('current_project')
-    # Get the full path to the PDF file
-    uploads_dir = get_project_uploads_path()
-    if not uploads_dir:
-        logging.error(f"Could not find uploads directory for user {username} and project {current_project}")
-        return []
-    
-    # Ensure consistent forward slashes for S3 paths
-    pdf_path = f"{uploads_dir}/{file_name}".replace('\\', '/')
-    
-    # Check if file exists in S3 instead of local filesystem
-    try:
-        s3_client.head_object(Bucket=BUCKET_NAME, Key=pdf_path)
-    except ClientError:
-        logging.error(f"PDF file not found in S3: {pdf_path}")
-        return []
-    
-    # Extract the text for each page in the PDF
-    pages = extract_pdf_pages(file_name)  # List of page texts
-    
-    page_token_counts = []
 
-    # Count tokens for each page and store in the list
-    for i, page in enumerate(pages):
-        token_count = count_tokens(page)  # Use your tokenizer to count tokens
-        page_token_counts.append(token_count)
+if __name__ == "__main__":
+    # Benchmarks for a local PDF:
+    # 1. The per-job PdfDocument versus re-parsing the PDF for every chunk of
+    #    every table group, both timed, for documents of several page counts
+    #    (the first N pages of the PDF). Token counting is left out of both.
+    # 2. Serial versus process-pool extraction throughput in pages per second.
+    # Usage: python pdf_processing.py <local_pdf> [table_groups] [chunks] [page_counts]
+    # e.g.   python pdf_processing.py uploads/12_Redacted.pdf 4 10 5,20,50
+    import sys
 
-    return page_token_counts
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("uploads", "12_Redacted.pdf")
+    table_groups = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    chunks = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    page_counts = [int(n) for n in sys.argv[4].split(",")] if len(sys.argv) > 4 else [5, 20, 50]
 
+    with pdfplumber.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
+    page_counts = sorted({min(n, total_pages) for n in page_counts})
+    print(f"{pdf_path}: {total_pages} pages, {table_groups} table groups, up to {chunks} chunks per group")
 
-def get_pdf_content_by_page_indices(file_name, start_page: int, end_page: int) -> str:
-    """
-    Returns the content of specified pages from a PDF file in S3.
-    
-    Parameters:
-    file_name: The name of the PDF file
-    start_page (int): Starting page index
-    end_page (int): Ending page index
-    
-    Returns:
-    str: Combined text content of the specified pages with page boundary markers
-    """
-    username = session.get('username')
-    current_project = session.get('current_project')
-    # Get the full path to the PDF file
-    uploads_dir = get_project_uploads_path()
-    if not uploads_dir:
-        logging.error(f"Could not find uploads directory for user {username} and project {current_project}")
-        return ""
-        
-    # Ensure consistent forward slashes for S3 paths
-    pdf_path = f"{uploads_dir}/{file_name}".replace('\\', '/')
-    
-    # Extract all pages from the PDF as a list of text strings
-    all_pages = extract_pdf_pages(file_name)
-    if not all_pages:
-        return ""
-    
-    # Collect text for specified pages only
-    selected_content = []
-    for page_index in range(start_page, end_page):
-        # Check if page index is within bounds
-        if page_index < len(all_pages):
-            page_text = all_pages[page_index]
-            selected_content.append(page_text)
-            # Append page boundary marker
-            selected_content.append(f"---END OF PAGE {page_index + 1}---")
-    
-    # Join the selected page content with boundaries
-    return "\n".join(selected_content)
+    def read_chunks(get_document, page_count):
+        """Read every chunk of every group, getting the document to slice from get_document()."""
+        pages_per_chunk = max(1, -(-page_count // chunks))
+        reads = 0
+        for _ in range(table_groups):
+            for chunk_start in range(0, page_count, pages_per_chunk):
+                get_document().get_content_by_page_indices(chunk_start, chunk_start + pages_per_chunk)
+                reads += 1
+        return reads
+
+    def parse(page_count):
+        pages = _extract_page_range(pdf_path, 0, page_count)
+        return PdfDocument(pdf_path, pages, page_token_counts=[0] * len(pages))
+
+    for page_count in page_counts:
+        # Parse once per job, then slice every chunk out of memory
+        start = time.perf_counter()
+        document = parse(page_count)
+        read_chunks(lambda: document, page_count)
+        per_job_seconds = time.perf_counter() - start
+
+        # Parse once to count page tokens, then parse again for every chunk, as before PdfDocument
+        start = time.perf_counter()
+        parse(page_count)
+        reads = read_chunks(lambda: parse(page_count), page_count)
+        per_chunk_seconds = time.perf_counter() - start
+
+        print(f"{page_count:>5} pages: per-job document {per_job_seconds:7.2f}s (1 parse), "
+              f"per-chunk parsing {per_chunk_seconds:7.2f}s ({reads + 1} parses), "
+              f"{per_chunk_seconds / per_job_seconds:.1f}x")
+
+    start = time.perf_counter()
+    serial_pages = extract_local_pdf_pages(pdf_path, workers=1)
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel_pages = extract_local_pdf_pages(pdf_path)
+    parallel_seconds = time.perf_counter() - start
+
+    print(f"Serial extraction:   {len(serial_pages) / serial_seconds:.1f} pages/s")
+    print(f"Parallel extraction: {len(parallel_pages) / parallel_seconds:.1f} pages/s "
+          f"({PDF_EXTRACTION_WORKERS} workers, batches of {PDF_EXTRACTION_BATCH_SIZE} pages)")
+    print(f"Outputs identical: {serial_pages == parallel_pages}")
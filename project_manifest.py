@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+project_manifest.py
+
+A per-project index of every object in the project, stored at
+users/<username>/projects/<project>/.manifest.json as
+{"objects": {key: {"size", "etag", "last_modified"}}}.
+
+file_manager records each write and delete it makes in the manifest. Directory
+listings inside a project are answered from the manifest, which is read
+through the object cache, instead of from a storage LIST call. A full
+paginated LIST of the project runs only to repair the index: when the manifest
+is missing or unreadable, when a project is loaded, or when an update keeps
+losing races with other processes.
+
+Updates are conditional writes on the manifest's ETag, so concurrent writers
+in the web and job worker processes never overwrite each other's entries.
+Updates made inside batched_updates() are merged and written once per project
+when the block exits.
+"""
+
+import re
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from config import MANIFEST_UPDATE_RETRIES
+from storage_backend import ObjectNotFound, PreconditionFailed, StorageError
+
+MANIFEST_NAME = ".manifest.json"
+
+_PROJECT_PREFIX = re.compile(r"^(users/[^/]+/projects/[^/]+/)")
+
+
+def project_prefix_for(key):
+    """Return "users/<username>/projects/<project>/" for a key inside a project, else None."""
+    match = _PROJECT_PREFIX.match(key)
+    return match.group(1) if match else None
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value or datetime.now(timezone.utc).isoformat()
+
+
+class ProjectManifests:
+    """
+    Reads and maintains the manifests of every project in a storage backend.
+
+    Parameters
+    ----------
+    storage : StorageBackend
+        Backend the projects live in. Used for repair scans.
+    object_cache : ObjectCache
+        Cache the manifests are read and written through.
+    """
+
+    project_prefix_for = staticmethod(project_prefix_for)
+
+    def __init__(self, storage, object_cache):
+        self.storage = storage
+        self.object_cache = object_cache
+        self._batch = threading.local()
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+
+    def load(self, project_prefix):
+        """Return the {key: entry} index of a project, rebuilding it if it is missing or unreadable."""
+        try:
+            body, _ = self.object_cache.get_with_etag(project_prefix + MANIFEST_NAME)
+            return json.loads(body.decode('utf-8'))["objects"]
+        except ObjectNotFound:
+            logging.info(f"[ProjectManifests] No manifest for {project_prefix}, rebuilding")
+        except (ValueError, KeyError) as e:
+            logging.warning(f"[ProjectManifests] Unreadable manifest for {project_prefix}, rebuilding: {e}")
+        return self.rebuild(project_prefix)
+
+    def list(self, prefix, delimiter=None):
+        """
+        List objects under a prefix inside a project from its manifest.
+
+        Returns the same {"objects", "prefixes"} shape as StorageBackend.list.
+        """
+        project_prefix = project_prefix_for(prefix)
+        if project_prefix is None:
+            raise ValueError(f"Prefix is not inside a project: {prefix}")
+
+        objects = []
+        prefixes = set()
+        for key, entry in sorted(self.load(project_prefix).items()):
+            if not key.startswith(prefix):
+                continue
+            if delimiter:
+                cut = key.find(delimiter, len(prefix))
+                if cut != -1 and cut != len(key) - 1:
+                    prefixes.add(key[:cut + 1])
+                    continue
+                if cut == len(key) - 1 and key != prefix:
+                    # A marker for a subdirectory is reported as a common prefix, as S3 does
+                    prefixes.add(key)
+                    continue
+            objects.append({
+                "key": key,
+                "size": entry.get("size", 0),
+                "etag": entry.get("etag", ""),
+                "last_modified": entry.get("last_modified"),
+                "content_type": None,
+                "metadata": {}
+            })
+        return {"objects": objects, "prefixes": sorted(prefixes)}
+
+    # -------------------------------------------------------------------------
+    # Repair
+    # -------------------------------------------------------------------------
+
+    def rebuild(self, project_prefix):
+        """Rebuild a project's manifest from a full paginated listing and return its entries."""
+        manifest_key = project_prefix + MANIFEST_NAME
+        objects = {
+            obj["key"]: {
+                "size": obj["size"],
+                "etag": obj["etag"],
+                "last_modified": _timestamp(obj["last_modified"])
+            }
+            for obj in self.storage.list(project_prefix)["objects"]
+            if obj["key"] != manifest_key
+        }
+        if objects:
+            try:
+                self.object_cache.put(manifest_key, self._serialize(objects), content_type='application/json')
+            except StorageError as e:
+                logging.error(f"[ProjectManifests] Failed to write manifest for {project_prefix}: {e}")
+        logging.info(f"[ProjectManifests] Rebuilt manifest for {project_prefix} with {len(objects)} objects")
+        return objects
+
+    def seed(self, project_prefix, entries):
+        """
+        Write the manifest of a project that was just created, from the
+        {key: {"size", "etag", "last_modified"}} entries of the objects written,
+        without listing it. Returns True on success.
+        """
+        try:
+            self.object_cache.put(project_prefix + MANIFEST_NAME, self._serialize(entries),
+                                  content_type='application/json')
+            return True
+        except StorageError as e:
+            logging.error(f"[ProjectManifests] Failed to seed manifest for {project_prefix}: {e}")
+            return False
+
+    # -------------------------------------------------------------------------
+    # Updates
+    # -------------------------------------------------------------------------
+
+    def record_put(self, key, etag, size, last_modified=None):
+        """Record that key was written."""
+        self._record(key, {"size": size, "etag": etag, "last_modified": _timestamp(last_modified)})
+
+    def record_delete(self, key):
+        """Record that key was deleted."""
+        self._record(key, None)
+
+    @contextmanager
+    def batched_updates(self):
+        """Merge the updates made inside the block into one manifest write per project."""
+        pending = getattr(self._batch, "pending", None)
+        if pending is not None:
+            # Nested batch: the outermost block applies everything
+            yield
+            return
+        self._batch.pending = {}
+        try:
+            yield
+        finally:
+            pending, self._batch.pending = self._batch.pending, None
+            for project_prefix, changes in pending.items():
+                self._apply(project_prefix, changes)
+
+    def _record(self, key, entry):
+        project_prefix = project_prefix_for(key)
+        if project_prefix is None or key == project_prefix + MANIFEST_NAME:
+            return
+        pending = getattr(self._batch, "pending", None)
+        if pending is not None:
+            pending.setdefault(project_prefix, {})[key] = entry
+        else:
+            self._apply(project_prefix, {key: entry})
+
+    def _apply(self, project_prefix, changes):
+        """
+        Merge {key: entry or None} into the manifest with a conditional write,
+        re-reading and retrying when another process updated it first.
+        """
+        manifest_key = project_prefix + MANIFEST_NAME
+        for attempt in range(MANIFEST_UPDATE_RETRIES):
+            try:
+                body, etag = self.object_cache.get_with_etag(manifest_key)
+                objects = json.loads(body.decode('utf-8'))["objects"]
+            except ObjectNotFound:
+                # No manifest yet (or the project was just deleted): the next listing builds it
+                return
+            except (ValueError, KeyError, StorageError) as e:
+                logging.warning(f"[ProjectManifests] Could not read manifest for {project_prefix}: {e}")
+                break
+
+            for key, entry in changes.items():
+                if entry is None:
+                    objects.pop(key, None)
+                else:
+                    objects[key] = entry
+
+            try:
+                self.object_cache.put(manifest_key, self._serialize(objects),
+                                      content_type='application/json', if_match=etag)
+                return
+            except PreconditionFailed:
+                logging.debug(f"[ProjectManifests] Manifest for {project_prefix} changed, retry {attempt + 1}")
+                self.object_cache.invalidate(manifest_key)
+            except ObjectNotFound:
+                return
+            except StorageError as e:
+                logging.warning(f"[ProjectManifests] Could not update manifest for {project_prefix}: {e}")
+                break
+
+        # Give up on the incremental update; drop the manifest so the next listing rescans
+        logging.warning(f"[ProjectManifests] Dropping manifest for {project_prefix} for repair")
+        self.object_cache.invalidate(manifest_key)
+        try:
+            self.storage.delete(manifest_key)
+        except StorageError as e:
+            logging.error(f"[ProjectManifests] Failed to drop manifest for {project_prefix}: {e}")
+
+    @staticmethod
+    def _serialize(objects):
+        return json.dumps({"objects": objects}, separators=(',', ':')).encode('utf-8')
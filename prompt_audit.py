@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+prompt_audit.py
+
+Audit trail of the prompts sent to OpenAI and the raw responses received.
+
+Every call used to write complete_prompt.txt and a timestamped response file
+to the project synchronously, putting two large S3 PUTs on the critical path
+of each call. Prompts and responses now go to an audit sink instead, chosen
+with PROMPT_AUDIT_MODE:
+
+- "off": nothing is recorded.
+- "sampled": a PROMPT_AUDIT_SAMPLE_RATE fraction of jobs is recorded, in full.
+- "async": every job is recorded.
+- "sync": every record is written before the call goes on (the old behaviour).
+
+In the sampled and async modes records are queued and a background thread
+writes them in batches. The queue is bounded; when it is full, records are
+dropped rather than holding up a call. Each job has its own archive under
+users/<username>/projects/<project>/audit/<job>/, written as gzip-compressed
+JSON Lines parts (part-00000.jsonl.gz, part-00001.jsonl.gz, ...) since objects
+cannot be appended to.
+
+get_audit_sink() returns the process-wide sink.
+"""
+
+import gzip
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+
+from config import (
+    PROMPT_AUDIT_MODE,
+    PROMPT_AUDIT_SAMPLE_RATE,
+    PROMPT_AUDIT_QUEUE_SIZE,
+    PROMPT_AUDIT_BATCH_SIZE,
+    PROMPT_AUDIT_FLUSH_SECONDS
+)
+from file_manager import storage, manifests, get_project_data_path
+from storage_backend import StorageError
+
+AUDIT_MODES = ("off", "sampled", "async", "sync")
+
+
+class AuditArchive:
+    """
+    Records of one job. Archives that were not sampled drop everything.
+
+    Parameters
+    ----------
+    sink : AuditSink
+        Sink the records are handed to.
+    prefix : str
+        Storage prefix the archive's parts are written under.
+    enabled : bool
+        False if records should be dropped.
+    """
+
+    def __init__(self, sink, prefix, enabled=True):
+        self.sink = sink
+        self.prefix = prefix
+        self.enabled = enabled
+        self._next_part = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind, data):
+        """Record data ("prompt", "response", ...) in the archive."""
+        if not self.enabled:
+            return
+        self.sink.submit(self, {
+            "kind": kind,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "data": data
+        })
+
+    def next_part_key(self):
+        with self._lock:
+            part = self._next_part
+            self._next_part += 1
+        return f"{self.prefix}/part-{part:05d}.jsonl.gz"
+
+
+class AuditSink:
+    """
+    Writes audit records to storage according to the audit mode.
+
+    Parameters
+    ----------
+    mode : str
+        One of AUDIT_MODES.
+    sample_rate : float
+        Fraction of archives recorded in "sampled" mode.
+    queue_size : int
+        Records that may wait for the writer thread before new ones are dropped.
+    batch_size : int
+        Most records written in one batch.
+    flush_seconds : float
+        Longest the writer waits for a batch to fill.
+    storage : StorageBackend, optional
+        Backend the archives are written to. Defaults to file_manager's.
+    """
+
+    def __init__(self, mode=PROMPT_AUDIT_MODE, sample_rate=PROMPT_AUDIT_SAMPLE_RATE,
+                 queue_size=PROMPT_AUDIT_QUEUE_SIZE, batch_size=PROMPT_AUDIT_BATCH_SIZE,
+                 flush_seconds=PROMPT_AUDIT_FLUSH_SECONDS, storage=None):
+        if mode not in AUDIT_MODES:
+            logging.warning(f"[AuditSink] Unknown audit mode {mode!r}, auditing is off")
+            mode = "off"
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.storage = storage
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def open_archive(self, project_base):
+        """
+        Start the archive of one job in the project at project_base
+        ("users/<username>/projects/<project>").
+        """
+        enabled = self.mode != "off" and (self.mode != "sampled" or random.random() < self.sample_rate)
+        job_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        return AuditArchive(self, f"{project_base}/audit/{job_name}", enabled)
+
+    def submit(self, archive, record):
+        """Write a record now ("sync") or queue it for the writer thread."""
+        if self.mode == "sync":
+            self._write(archive, [record])
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((archive, record))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"[AuditSink] Queue full, dropped {record['kind']} record for {archive.prefix}")
+
+    def flush(self, timeout=None):
+        """Wait until every queued record is written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    # -------------------------------------------------------------------------
+    # Writer
+    # -------------------------------------------------------------------------
+
+    def _ensure_writer(self):
+        # Started lazily so each job worker process gets its own thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="prompt-audit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            by_archive = {}
+            for archive, record in batch:
+                by_archive.setdefault(archive, []).append(record)
+            for archive, records in by_archive.items():
+                self._write(archive, records)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, archive, records):
+        """Write records as the next compressed part of the archive. Failures are logged, never raised."""
+        key = archive.next_part_key()
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        body = gzip.compress(lines.encode('utf-8'))
+        try:
+            etag = (self.storage or storage).put(key, body, content_type='application/gzip')
+            if self.storage is None:
+                manifests.record_put(key, etag, len(body))
+        except StorageError as e:
+            logging.error(f"[AuditSink] Failed to write {key}: {e}")
+
+
+_audit_sink = None
+_audit_sink_lock = threading.Lock()
+
+
+def get_audit_sink():
+    """Return the process-wide audit sink."""
+    global _audit_sink
+    with _audit_sink_lock:
+        if _audit_sink is None:
+            _audit_sink = AuditSink()
+            # Give queued records a chance to be written when the process exits
+            atexit.register(_audit_sink.flush, PROMPT_AUDIT_FLUSH_SECONDS * 2)
+    return _audit_sink
+
+
+def open_project_archive():
+    """Open an archive in the current session's project, or None if no project is selected."""
+    data_path = get_project_data_path()
+    if data_path is None:
+        return None
+    return get_audit_sink().open_archive(data_path.rsplit('/', 1)[0])
+
+
+if __name__ == "__main__":
+    # Benchmark: time added to each call by synchronous vs queued audit writes
+    import tempfile
+    from storage_backend import LocalStorageBackend
+
+    class SlowBackend(LocalStorageBackend):
+        """Local backend that sleeps like an S3 round-trip on every request."""
+        latency = 0.05
+
+        def put(self, *args, **kwargs):
+            time.sleep(self.latency)
+            return super().put(*args, **kwargs)
+
+    prompt = "Extract the revenue table from this filing. " * 2000
+    response = {"choices": [{"message": {"content": "### TEXT START ### ok ### TEXT END ###" * 200}}]}
+    calls = 20
+
+    with tempfile.TemporaryDirectory() as root:
+        slow = SlowBackend(root)
+        for mode in ("sync", "async"):
+            sink = AuditSink(mode=mode, storage=slow)
+            archive = sink.open_archive("users/bench/projects/p")
+            start = time.perf_counter()
+            for _ in range(calls):
+                archive.record("prompt", {"system_prompt": prompt})
+                archive.record("response", response)
+            on_path = time.perf_counter() - start
+            sink.flush()
+            total = time.perf_counter() - start
+            parts = len(slow.list(f"{archive.prefix}/")["objects"])
+            print(f"{mode:>5}: {on_path * 1000 / calls:7.2f} ms per call on the critical path, "
+                  f"{total * 1000:7.1f} ms until written, {parts} parts")
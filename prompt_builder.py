@@ -8,9 +8,11 @@ prompt_builder.py
 
 This module defines the PromptBuilder class, which is responsible for:
 - Loading and assembling system and user prompts from various sources (project type, tables, PDFs, etc.).
+  Prompts are kept as named segments, each with a memoised token count, so only the
+  segments that change between calls (the PDF chunk, the running summary) are rebuilt.
 - Managing running summaries and table data updates.
 - Counting tokens and calculating cost estimates for OpenAI API calls.
-- Writing prompts and summaries to the project data directory.
+- Writing summaries to the project data directory and recording prompts in the audit archive.
 """
 
 import os
@@ -27,15 +29,54 @@ from file_manager import (
     read_json
 )
 from config import OPENAI_COST_PER_INPUT_TOKEN, OPENAI_COST_PER_OUTPUT_TOKEN, BASE_PROMPT_DIR
-from pdf_processing import count_tokens
+from upload_file_manager import count_tokens, count_tokens_many
+from structure_registry import get_structure_registry, build_ai_instructions
+from prompt_audit import open_project_archive
 from flask import session
 
+# Segments of the system and user prompts, in the order they are joined
+SYSTEM_PROMPT_SEGMENTS = ("static", "business_description", "tables", "summary", "chunk_info")
+USER_PROMPT_SEGMENTS = ("user_input", "pdf_chunk")
+
+NO_SUMMARY_TEXT = "This is the first call for this project and there is no running summary."
+
+# Put in front of the PDF chunk in the user prompt
+PDF_CHUNK_HEADER = "Here is a part of the attached PDF\n\n\n--- PDF Chunk ---\n"
+
+
+class TableBlocks:
+    """
+    Prompt blocks of a job's tables and their token counts.
+
+    Each table is formatted (structure information plus its data as indented
+    JSON) and token-counted once per job. Every table group and PDF chunk of the
+    job reuses the blocks, and clones of a PromptBuilder share them.
+
+    Parameters
+    ----------
+    update_blocks : dict
+        {table_name: block text} for the tables being updated.
+    context_blocks : dict
+        {table_name: block text} for the tables sent as context.
+    """
+
+    def __init__(self, update_blocks, context_blocks):
+        self.update_blocks = update_blocks
+        self.context_blocks = context_blocks
+        counts = count_tokens_many(list(update_blocks.values()) + list(context_blocks.values()))
+        self.update_tokens = dict(zip(update_blocks, counts[:len(update_blocks)]))
+        self.context_text = "".join(context_blocks.values())
+        self.context_tokens = sum(counts[len(update_blocks):])
+
 
 class PromptBuilder:
     """
     PromptBuilder handles the construction and management of system and user prompts
     for an OpenAI-powered application. It integrates project context, table data,
     business descriptions, PDF content chunks, and running summaries into coherent prompts.
+
+    A PromptBuilder holds the prompt state of one job and is not shared between
+    requests. Table groups of a job that run concurrently each work on a clone().
     """
 
     def __init__(self, json_manager):
@@ -51,16 +92,43 @@ class PromptBuilder:
         self.static_prompt_text = ''
         self.system_prompt = ''
         self.project_type = None
-        self.table_data = ''
-        self.summary = ''
-        self.pdf_chunk = ''
-        self.chunk_num_text = ''
-        self.business_description = ''
+        self.segments = {}  # segment name -> text
+        self.segment_tokens = {}  # segment name -> token count, kept until the text changes
+        self.table_blocks = None  # TableBlocks of the current job
+        self.update_table_names = []
         self.user_input = ''
         self.user_prompt = ''
         self.running_summary = ''
+        self.audit_archive = None  # Job's prompt_audit archive; set by manage_api_calls
         #Do not load the static prompt file on init. Causes circular import.
 
+    def clone(self):
+        """
+        Create an independent PromptBuilder for one table group of a job.
+
+        The project type, the job-level segments (static prompt, business
+        description, user input) with their token counts and the job's table
+        blocks are carried over. The per-call segments start empty so
+        concurrent groups never share them.
+
+        Returns
+        -------
+        PromptBuilder
+            A new builder sharing the JsonManager and the job's table blocks.
+        """
+        builder = PromptBuilder(self.json_manager)
+        builder.project_type = self.project_type
+        builder.static_prompt_text = self.static_prompt_text
+        builder.user_input = self.user_input
+        builder.table_blocks = self.table_blocks
+        builder.audit_archive = self.audit_archive
+        for name in ("static", "business_description", "user_input"):
+            if name in self.segments:
+                builder.segments[name] = self.segments[name]
+            if name in self.segment_tokens:
+                builder.segment_tokens[name] = self.segment_tokens[name]
+        return builder
+
     # -------------------------------------------------------------------------
     # Initialization and Prompt File Loading
     # -------------------------------------------------------------------------
@@ -105,14 +173,11 @@ class PromptBuilder:
             if not success:
                 logging.error(f"Failed to copy prompt file for project type: {self.project_type}, initializing base system prompt.")
                 self.initialize_base_system_prompt()
-                return
-        else:
-            self.static_prompt_text = prompt_content.strip()
-            return
+            # Read the copied prompt file back
+            prompt_content = read_file(s3_prompt_path)
 
-        # Read the prompt file content
-        with open(prompt_content, 'r') as file:
-            self.static_prompt_text = file.read().strip()
+        self.static_prompt_text = prompt_content.strip()
+        self.set_segment("static", self.static_prompt_text + "\n\n")
 
     def initialize_base_system_prompt(self):
         """
@@ -169,22 +234,29 @@ class PromptBuilder:
 
     def reset_prompts(self):
         """
-        Reset all prompt components to their default empty values.
-        """
-        self.table_data = ''
-        self.summary = ''
-        self.pdf_chunk = ''
-        self.chunk_num_text = ''
-        self.business_description = ''
-        self.user_input = ''
+        Reset all prompt components to their default empty values. The loaded
+        static prompt is kept.
+        """
+        static_text = self.segments.get("static")
+        static_tokens = self.segment_tokens.get("static")
+        self.segments = {}
+        self.segment_tokens = {}
+        if static_text is not None:
+            self.segments["static"] = static_text
+            if static_tokens is not None:
+                self.segment_tokens["static"] = static_tokens
+        self.table_blocks = None
+        self.update_table_names = []
+        self.system_prompt = ''
         self.user_prompt = ''
-        self.running_summary = "This is the first call for this project and there is no running summary."
+        self.update_user_input('')
+        self.running_summary = NO_SUMMARY_TEXT
 
     def reset_system_prompt(self):
+        """Clear the per-call segments: the table group, running summary and PDF chunk."""
         self.system_prompt = ''
-        self.table_data = ''
-        self.pdf_chunk = ''
-        self.chunk_num_text = ''
+        for name in ("tables", "summary", "chunk_info", "pdf_chunk"):
+            self.set_segment(name, '')
 
     def get_summary(self):
         """
@@ -199,7 +271,7 @@ class PromptBuilder:
             data_path = get_project_data_path()
             if data_path is None:
                 logging.error("Could not get project data path.")
-                return "This is the first call for this project and there is no running summary."
+                return NO_SUMMARY_TEXT
 
             summary_file = f"{data_path}/running_summary.txt"
             
@@ -208,14 +280,13 @@ class PromptBuilder:
                 # Read summary from S3
                 self.running_summary = read_file(summary_file)
             else:
-                initial_summary = "This is the first call for this project and there is no running summary."
-                self.update_summary(initial_summary)
+                self.update_summary(NO_SUMMARY_TEXT)
 
             return self.running_summary
 
         except Exception as e:
             logging.error(f"Error getting summary: {e}")
-            return "This is the first call for this project and there is no running summary."
+            return NO_SUMMARY_TEXT
 
     def update_summary(self, new_content):
         """
@@ -240,6 +311,26 @@ class PromptBuilder:
         except Exception as e:
             logging.error(f"Error updating summary: {e}")
 
+    # -------------------------------------------------------------------------
+    # Prompt Segments
+    # -------------------------------------------------------------------------
+
+    def set_segment(self, name, text):
+        """
+        Set the text of a prompt segment. Its token count is only recounted if
+        the text changed.
+        """
+        if self.segments.get(name) != text:
+            self.segments[name] = text
+            self.segment_tokens.pop(name, None)
+
+    def segment_token_count(self, name):
+        """Token count of a segment, counted once per distinct text."""
+        if name not in self.segment_tokens:
+            text = self.segments.get(name, '')
+            self.segment_tokens[name] = count_tokens(text) if text else 0
+        return self.segment_tokens[name]
+
     # -------------------------------------------------------------------------
     # User Input and Data Assembly
     # -------------------------------------------------------------------------
@@ -254,85 +345,124 @@ class PromptBuilder:
             The instructions or query provided by the user.
         """
         self.user_input = user_input
+        if user_input:
+            self.set_segment("user_input", 'Here are the specific instructions provided by the user:\n' + user_input + "\n")
+        else:
+            self.set_segment("user_input", "No specific instructions provided by the user.\n")
 
-    def add_table_data(self, update_tables, context_tables):
+    def format_table_block(self, table_name, data, context=False):
         """
-        Add table data and structure information to the system prompt.
+        Format one table for the system prompt: its structure information
+        (with the root key, for update tables) followed by its data.
+        """
+        structure_info = self.table_ai_instructions(table_name)
+        formatted_table_data = json.dumps(data, indent=2)
+        if context:
+            return (
+                f"\n\n--- Context for {table_name} ---\n{structure_info}"
+                f"\n\n--- Context {table_name} Data ---\n{formatted_table_data}"
+            )
+
+        # Add root key information from structure file
+        root_key = get_structure_registry().root_key(table_name)
+        if root_key:
+            structure_info = f"Root Key: {root_key}\n{structure_info}"
+        return (
+            f"\n\n--- {table_name} Structure Information ---\n{structure_info}"
+            f"\n\n--- Current {table_name} Data ---\n{formatted_table_data}"
+        )
+
+    def prepare_tables(self, update_tables, context_tables=None):
+        """
+        Format and token-count every table of a job once.
 
         Parameters
         ----------
         update_tables : dict
             Dictionary of table_name: table_data for tables that will be updated.
-        context_tables : dict
-            Dictionary of table_name: table_data for tables used as context only.
+        context_tables : dict, optional
+            Dictionary of table_name: table_data for tables sent as context only.
         """
-        # Step 1: Identify update vs. context tables
-        update_table_names = ', '.join(update_tables.keys())
-        context_table_names = ', '.join(context_tables.keys()) if context_tables else "None"
-        self.table_data = (
-            f"\n\n### Update Only These Tables: {update_table_names} ###"
-            f"\n\nThe other tables are provided solely for context: {context_table_names}."
+        self.table_blocks = TableBlocks(
+            {table_name: self.format_table_block(table_name, data) for table_name, data in update_tables.items()},
+            {table_name: self.format_table_block(table_name, data, context=True)
+             for table_name, data in (context_tables or {}).items()}
         )
 
-        # Step 2: Add structure info and data for update tables
-        for table_name, data in update_tables.items():
-            structure_info = self.load_ai_instructions_from_structure(table_name)
-            # Add root key information from structure file
-            try:
-                with open(f"static/json_structure_data/{table_name}_structure.json") as f:
-                    structure = json.load(f)
-                    root_key = structure[table_name].get('root_key')
-                    if root_key:
-                        structure_info = f"Root Key: {root_key}\n{structure_info}"
-            except Exception as e:
-                logging.error(f"Error loading root key for {table_name}: {e}")
-
-            formatted_table_data = json.dumps(data, indent=2)
-            
-            self.table_data += (
-                f"\n\n--- {table_name} Structure Information ---\n{structure_info}"
-                f"\n\n--- Current {table_name} Data ---\n{formatted_table_data}"
-            )
+    def _table_group_header(self, table_names, include_context):
+        context_names = self.table_blocks.context_blocks.keys() if include_context else []
+        return (
+            f"\n\n### Update Only These Tables: {', '.join(table_names)} ###"
+            f"\n\nThe other tables are provided solely for context: {', '.join(context_names) or 'None'}."
+        )
 
-        # Step 3: Add context tables if present
-        if context_tables:
-            for table_name, data in context_tables.items():
-                structure_info = self.json_manager.load_ai_instructions_from_structure(table_name)
-                formatted_table_data = json.dumps(data, indent=2)
-                self.table_data += (
-                    f"\n\n--- Context for {table_name} ---\n{structure_info}"
-                    f"\n\n--- Context {table_name} Data ---\n{formatted_table_data}"
-                )
-
-    def add_running_summary(self, summary):
-        
-        if summary:
-            self.summary += f"\n\nRunning Summary of Processed PDF:\n{summary}"
+    def set_table_group(self, table_names, include_context=False):
+        """
+        Put one group of the job's update tables (and optionally its context
+        tables) in the system prompt. Uses the blocks from prepare_tables, so
+        nothing is re-formatted or re-tokenised.
+        """
+        header = self._table_group_header(table_names, include_context)
+        blocks = [self.table_blocks.update_blocks[table_name] for table_name in table_names]
+        if include_context:
+            blocks.append(self.table_blocks.context_text)
 
+        self.update_table_names = list(table_names)
+        self.segments["tables"] = header + "".join(blocks)
+        self.segment_tokens["tables"] = self._table_group_tokens(header, table_names, include_context)
 
-    def add_business_description(self, business_description):
+    def _table_group_tokens(self, header, table_names, include_context):
+        tokens = count_tokens(header)
+        tokens += sum(self.table_blocks.update_tokens[table_name] for table_name in table_names)
+        if include_context:
+            tokens += self.table_blocks.context_tokens
+        return tokens
 
-        if business_description:
-            self.business_description += f"\n\nBusiness Description:\n{business_description}"
-        else:
-            self.business_description += "\n\nNo business description is given. Please use the PDF information."
+    def add_table_data(self, update_tables, context_tables):
+        """
+        Add table data and structure information to the system prompt.
 
+        Parameters
+        ----------
+        update_tables : dict
+            Dictionary of table_name: table_data for tables that will be updated.
+        context_tables : dict
+            Dictionary of table_name: table_data for tables used as context only.
+        """
+        self.prepare_tables(update_tables, context_tables)
+        self.set_table_group(list(update_tables.keys()), include_context=bool(context_tables))
 
-    def add_pdf_chunk(self, pdf_chunk):
+    def set_running_summary(self, summary):
+        if summary:
+            self.set_segment("summary", f"\n\nRunning Summary of Processed PDF:\n{summary}")
+        else:
+            self.set_segment("summary", '')
 
-        if pdf_chunk:
-            self.pdf_chunk += f"\n\n--- PDF Chunk ---\n{pdf_chunk}"
+    def set_business_description(self, business_description):
+        if business_description:
+            self.set_segment("business_description", f"\n\nBusiness Description:\n{business_description}")
+        else:
+            self.set_segment("business_description", "\n\nNo business description is given. Please use the PDF information.")
 
-    def add_chunk_info(self, chunk_num):
+    def set_pdf_chunk(self, pdf_chunk, chunk_num=None):
         """
-        Add information about the current PDF chunk number being processed.
-        
+        Put a PDF chunk in the user prompt, replacing the previous one.
+
         Parameters
         ----------
-        chunk_num : int
-            The chunk number of the PDF currently being processed.
+        pdf_chunk : str
+            Extracted text of the chunk.
+        chunk_num : int, optional
+            The chunk number of the PDF currently being processed, noted in the system prompt.
         """
-        self.chunk_num_text += f"\n\n### PDF Processing ###\nCurrently processing chunk {chunk_num} of the PDF."
+        if pdf_chunk:
+            self.set_segment("pdf_chunk", f"{PDF_CHUNK_HEADER}{pdf_chunk}")
+        else:
+            self.set_segment("pdf_chunk", '')
+        if pdf_chunk and chunk_num is not None:
+            self.set_segment("chunk_info", f"\n\n### PDF Processing ###\nCurrently processing chunk {chunk_num} of the PDF.")
+        else:
+            self.set_segment("chunk_info", '')
 
     # -------------------------------------------------------------------------
     # Prompt Assembly
@@ -340,7 +470,8 @@ class PromptBuilder:
 
     def update_system_prompt_info(self, update_tables=None, context_tables=None, summary=None, business_description=None, pdf_chunk=None, chunk_num=None):
         """
-        Update the system prompt information with tables, summaries, business descriptions, and PDF content.
+        Set the prompt segments for the given tables, summary, business description and PDF content.
+        Segments that are not given keep their current text and token count.
 
         Parameters
         ----------
@@ -351,46 +482,35 @@ class PromptBuilder:
         pdf_chunk : str, optional
         chunk_num : int, optional
         """
-        self.reset_prompts()
         if update_tables:
             self.add_table_data(update_tables, context_tables)
         if summary:
-            self.add_running_summary(summary)
+            self.set_running_summary(summary)
         if business_description:
-            self.add_business_description(business_description)
+            self.set_business_description(business_description)
         if pdf_chunk:
-            self.add_pdf_chunk(pdf_chunk)
-            self.add_chunk_info(chunk_num)
+            self.set_pdf_chunk(pdf_chunk, chunk_num)
 
     def assemble_system_prompt(self):
         """
-        Assemble the complete system prompt by concatenating the base prompt and all appended data.
+        Assemble the complete system prompt by joining its segments.
         """
-        if not self.static_prompt_text:
-            self.load_prompt_file()
+        if "static" not in self.segments:
+            self.load_static_prompt_file()
 
-        complete_prompt = (
-            self.static_prompt_text + "\n\n" +
-            self.business_description +
-            self.table_data +
-            self.summary +
-            self.chunk_num_text +
-            self.user_prompt
-        )
-
-        self.system_prompt = complete_prompt
+        self.system_prompt = "".join(self.segments.get(name, '') for name in SYSTEM_PROMPT_SEGMENTS)
 
     def write_system_prompt(self):
         """
-        Write the current system prompt to a file in the project's data directory in S3.
+        Record the current system prompt in the job's audit archive. Whether and
+        when it is written to storage depends on PROMPT_AUDIT_MODE.
         """
-        data_path = get_project_data_path()
-        if data_path is None:
-            logging.error("Could not get project data path for writing system prompt")
-            return
-            
-        s3_path = f"{data_path}/complete_prompt.txt"
-        write_file(s3_path, self.system_prompt)
+        if self.audit_archive is None:
+            self.audit_archive = open_project_archive()
+            if self.audit_archive is None:
+                logging.error("Could not get project data path for recording system prompt")
+                return
+        self.audit_archive.record("prompt", {"system_prompt": self.system_prompt})
 
     def get_system_prompt(self):
         """
@@ -414,14 +534,9 @@ class PromptBuilder:
         str
             The user prompt content.
         """
-        if self.user_input:
-            self.user_prompt += 'Here are the specific instructions provided by the user:\n' + self.user_input
-        else:
-            self.user_prompt += "No specific instructions provided by the user.\n"
-
-        if self.pdf_chunk:
-            self.user_prompt += "Here is a part of the attached PDF\n" + self.pdf_chunk
-
+        if "user_input" not in self.segments:
+            self.update_user_input(self.user_input)
+        self.user_prompt = "".join(self.segments.get(name, '') for name in USER_PROMPT_SEGMENTS)
         return self.user_prompt
 
     # -------------------------------------------------------------------------
@@ -430,7 +545,8 @@ class PromptBuilder:
 
     def get_token_count(self, component):
         """
-        Calculate the total token count for a given component of the prompt.
+        Calculate the total token count for a given component of the prompt
+        by adding the memoised counts of its segments.
 
         Parameters
         ----------
@@ -442,16 +558,22 @@ class PromptBuilder:
         int
             The total token count for the specified component.
         """
-        total_tokens = 0
-        if component == 'system':
-            total_tokens += count_tokens(self.system_prompt)
-            total_tokens += count_tokens(self.business_description)
-            total_tokens += count_tokens(self.table_data)
-            total_tokens += count_tokens(self.summary)
-        elif component == 'user':
-            total_tokens += count_tokens(self.user_prompt)
+        segment_names = SYSTEM_PROMPT_SEGMENTS if component == 'system' else USER_PROMPT_SEGMENTS
+        return sum(self.segment_token_count(name) for name in segment_names)
+
+    def table_group_token_count(self, table_names, include_context=False):
+        """
+        Tokens of the prompt for one table group before any PDF chunk or running
+        summary is added: the static prompt, business description and user input
+        plus the group's tables. Added up from cached counts.
+        """
+        tokens = sum(self.segment_token_count(name) for name in ("static", "business_description", "user_input"))
+        header = self._table_group_header(table_names, include_context)
+        return tokens + self._table_group_tokens(header, table_names, include_context)
 
-        return total_tokens
+    def pdf_chunk_header_token_count(self):
+        """Tokens that framing a PDF chunk adds to the user prompt, on top of the chunk itself."""
+        return count_tokens(PDF_CHUNK_HEADER)
 
     def display_tokens_and_cost(self, response):
         """
@@ -476,6 +598,16 @@ class PromptBuilder:
     # Structure and Description Info Loading
     # -------------------------------------------------------------------------
 
+    def table_ai_instructions(self, table_name):
+        """
+        AI instructions for a table from the structure registry, falling back to
+        the project's own copy in S3 for tables with no local structure file.
+        """
+        ai_instructions = get_structure_registry().ai_instructions(table_name)
+        if ai_instructions is None:
+            ai_instructions = self.load_ai_instructions_from_structure(table_name)
+        return ai_instructions
+
     def load_ai_instructions_from_structure(self, table_name):
         """
         Load only the AI instructions from a table's structure JSON file.
@@ -504,22 +636,8 @@ class PromptBuilder:
                 return ""
                 
             root_key = next(iter(structure_data))
-            table_info = structure_data[root_key]
             # Extract only the AI instructions
-            ai_instructions = []
-            
-            # Add table-level AI instructions if they exist
-            if 'ai_instructions' in table_info:
-                ai_instructions.append(f"Table Purpose: {table_info['ai_instructions']}")
-            # Extract field-level AI instructions from the structure
-            if 'structure' in table_info:
-                root_struct_key = next(iter(table_info['structure']))
-                properties = table_info['structure'][root_struct_key]['items']['properties']
-                
-                for field_name, field_info in properties.items():
-                    if 'ai_instructions' in field_info:
-                        ai_instructions.append(f"{field_name}: {field_info['ai_instructions']}")
-            return "\n".join(ai_instructions)
+            return build_ai_instructions(structure_data[root_key])
         except Exception as e:
             logging.error(f"Error loading structure info for table {table_name}: {e}")
             return ""
\ No newline at end of file
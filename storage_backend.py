@@ -0,0 +1,698 @@
+# -*- coding: utf-8 -*-
+"""
+storage_backend.py
+
+Object storage used for every user, project, upload and output file. Keys are
+S3-style paths ("users/<username>/projects/<project>/data/revenue.json").
+
+Two backends implement the same interface:
+- S3StorageBackend stores objects in the configured bucket.
+- LocalStorageBackend stores objects as files under a local directory. It needs
+  no network, so it suits single-node deployments and offline benchmarking.
+
+STORAGE_BACKEND in config.py selects the backend; get_storage() returns the
+process-wide instance.
+"""
+
+import os
+import json
+import hashlib
+import shutil
+import logging
+import tempfile
+import mimetypes
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    STORAGE_BACKEND, LOCAL_STORAGE_ROOT, STORAGE_STREAM_CHUNK_SIZE, STORAGE_UPLOAD_PART_SIZE,
+    STORAGE_DELETE_BATCH_SIZE, STORAGE_DELETE_WORKERS, STORAGE_MAX_POOL_CONNECTIONS,
+    AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION, BUCKET_NAME
+)
+
+
+class StorageError(Exception):
+    """Raised when a storage operation fails."""
+
+
+class ObjectNotFound(StorageError):
+    """Raised when the requested key does not exist."""
+
+
+class PreconditionFailed(StorageError):
+    """Raised when a conditional write finds the object's ETag has changed."""
+
+
+def _read_part(stream, size):
+    """Read up to size bytes from a file-like stream, across short reads. Returns b"" at the end."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class StorageBackend:
+    """
+    Interface shared by the storage backends.
+
+    Object descriptions returned by head() and list() are dicts with the keys
+    key, size, etag, last_modified, content_type and metadata. Keys ending in
+    "/" are directory markers.
+    """
+
+    def get_object(self, key):
+        """Return the object description for key with its bytes under "body"."""
+        raise NotImplementedError
+
+    def put(self, key, body, content_type=None, metadata=None, if_match=None):
+        """
+        Store body (bytes or str) under key and return the new ETag.
+
+        With if_match, the write only happens if the stored object's ETag still
+        equals it; otherwise PreconditionFailed is raised.
+        """
+        raise NotImplementedError
+
+    def head(self, key):
+        """Return the object description for key without its body."""
+        raise NotImplementedError
+
+    def list(self, prefix, delimiter=None):
+        """
+        List the objects whose keys start with prefix.
+
+        Returns
+        -------
+        dict
+            "objects": object descriptions, and "prefixes": the common prefixes
+            up to the next delimiter when one is given.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Delete key. Deleting a missing key is not an error."""
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """
+        Delete several keys. Failures are reported per key instead of raised.
+
+        Returns
+        -------
+        dict
+            "deleted": the keys deleted, and "errors": [{"key", "message"}] for the rest.
+        """
+        deleted = []
+        errors = []
+        for key in keys:
+            try:
+                self.delete(key)
+                deleted.append(key)
+            except StorageError as e:
+                errors.append({"key": key, "message": str(e)})
+        return {"deleted": deleted, "errors": errors}
+
+    def stream(self, key, chunk_size=STORAGE_STREAM_CHUNK_SIZE):
+        """Yield the bytes stored under key in chunks of up to chunk_size."""
+        raise NotImplementedError
+
+    def upload_file(self, local_path, key):
+        """Store the contents of a local file under key."""
+        raise NotImplementedError
+
+    def download_file(self, key, local_path):
+        """Write the object stored under key to a local file."""
+        raise NotImplementedError
+
+    def upload_stream(self, key, stream, content_type=None, part_size=STORAGE_UPLOAD_PART_SIZE):
+        """
+        Store everything read from a file-like stream under key, holding at
+        most one part_size part in memory and hashing the bytes as they pass.
+
+        Returns
+        -------
+        dict
+            {"key", "etag", "size", "sha256"} of the stored object.
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """Return the bytes stored under key."""
+        return self.get_object(key)["body"]
+
+    def get_if_modified(self, key, etag):
+        """
+        Return the object description for key with its body, or None if its
+        ETag still equals etag. Backends override this with a conditional read.
+        """
+        obj = self.get_object(key)
+        return None if obj["etag"] == etag else obj
+
+    def exists(self, key):
+        try:
+            self.head(key)
+            return True
+        except ObjectNotFound:
+            return False
+
+
+#=============================================================
+# Amazon S3
+#=============================================================
+class S3StorageBackend(StorageBackend):
+    """Stores objects in an S3 bucket."""
+
+    NOT_FOUND_CODES = {"404", "NoSuchKey", "NotFound"}
+    PRECONDITION_CODES = {"412", "PreconditionFailed", "ConditionalRequestConflict"}
+
+    def __init__(self, bucket_name=BUCKET_NAME):
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self.bucket_name = bucket_name
+        self.client_error = ClientError
+        self.s3_client = boto3.client(
+            's3',
+            aws_access_key_id=AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+            region_name=AWS_REGION,
+            config=Config(max_pool_connections=STORAGE_MAX_POOL_CONNECTIONS),
+        )
+
+    def _translate(self, error, key):
+        """Convert a botocore ClientError to ObjectNotFound or StorageError."""
+        code = str(error.response.get('Error', {}).get('Code', ''))
+        if code in self.NOT_FOUND_CODES:
+            return ObjectNotFound(f"Object not found: {key}")
+        if code in self.PRECONDITION_CODES:
+            return PreconditionFailed(f"Object changed since it was read: {key}")
+        return StorageError(f"S3 error for {key}: {error}")
+
+    @staticmethod
+    def _describe(key, response):
+        return {
+            "key": key,
+            "size": response.get('ContentLength', 0),
+            "etag": response.get('ETag', '').strip('"'),
+            "last_modified": response.get('LastModified'),
+            "content_type": response.get('ContentType'),
+            "metadata": response.get('Metadata', {})
+        }
+
+    def get_object(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            description = self._describe(key, response)
+            description["body"] = response['Body'].read()
+            return description
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+    def get_if_modified(self, key, etag):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, IfNoneMatch=f'"{etag}"')
+        except self.client_error as e:
+            if str(e.response.get('Error', {}).get('Code', '')) in ("304", "NotModified"):
+                return None
+            raise self._translate(e, key) from e
+        description = self._describe(key, response)
+        description["body"] = response['Body'].read()
+        return description
+
+    def put(self, key, body, content_type=None, metadata=None, if_match=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        kwargs = {"Bucket": self.bucket_name, "Key": key, "Body": body}
+        if content_type:
+            kwargs["ContentType"] = content_type
+        if metadata:
+            kwargs["Metadata"] = metadata
+        if if_match:
+            kwargs["IfMatch"] = f'"{if_match}"'
+        try:
+            response = self.s3_client.put_object(**kwargs)
+            return response.get('ETag', '').strip('"')
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+    def head(self, key):
+        try:
+            return self._describe(key, self.s3_client.head_object(Bucket=self.bucket_name, Key=key))
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+    def list(self, prefix, delimiter=None):
+        # list_objects_v2 returns at most 1,000 keys per call, so follow every page
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if delimiter:
+            kwargs["Delimiter"] = delimiter
+        objects = []
+        prefixes = []
+        try:
+            for page in self.s3_client.get_paginator('list_objects_v2').paginate(**kwargs):
+                objects.extend(
+                    {
+                        "key": obj['Key'],
+                        "size": obj.get('Size', 0),
+                        "etag": obj.get('ETag', '').strip('"'),
+                        "last_modified": obj.get('LastModified'),
+                        "content_type": None,
+                        "metadata": {}
+                    }
+                    for obj in page.get('Contents', [])
+                )
+                prefixes.extend(common['Prefix'] for common in page.get('CommonPrefixes', []))
+        except self.client_error as e:
+            raise self._translate(e, prefix) from e
+        return {"objects": objects, "prefixes": prefixes}
+
+    def delete(self, key):
+        try:
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+    def _delete_batch(self, keys):
+        try:
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+        except self.client_error as e:
+            return [{"key": key, "message": str(e)} for key in keys]
+        # Quiet mode only reports the keys that failed
+        return [
+            {"key": error.get('Key'), "message": f"{error.get('Code')}: {error.get('Message')}"}
+            for error in response.get('Errors', [])
+        ]
+
+    def delete_many(self, keys):
+        """Delete keys with DeleteObjects, STORAGE_DELETE_BATCH_SIZE keys per request, batches in parallel."""
+        keys = list(dict.fromkeys(keys))
+        batches = [keys[i:i + STORAGE_DELETE_BATCH_SIZE] for i in range(0, len(keys), STORAGE_DELETE_BATCH_SIZE)]
+        errors = []
+        if len(batches) == 1:
+            errors = self._delete_batch(batches[0])
+        elif batches:
+            with ThreadPoolExecutor(max_workers=min(STORAGE_DELETE_WORKERS, len(batches))) as executor:
+                for batch_errors in executor.map(self._delete_batch, batches):
+                    errors.extend(batch_errors)
+        failed = {error["key"] for error in errors}
+        return {"deleted": [key for key in keys if key not in failed], "errors": errors}
+
+    def stream(self, key, chunk_size=STORAGE_STREAM_CHUNK_SIZE):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+        body = response['Body']
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def upload_file(self, local_path, key):
+        try:
+            self.s3_client.upload_file(local_path, self.bucket_name, key)
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+    def download_file(self, key, local_path):
+        try:
+            self.s3_client.download_file(self.bucket_name, key, local_path)
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+    def upload_stream(self, key, stream, content_type=None, part_size=STORAGE_UPLOAD_PART_SIZE):
+        """Upload a stream with S3 multipart upload, one part in memory at a time. Small streams use one PUT."""
+        digest = hashlib.sha256()
+        part = _read_part(stream, part_size)
+        digest.update(part)
+        extra = {"ContentType": content_type} if content_type else {}
+
+        next_part = _read_part(stream, part_size) if len(part) == part_size else b""
+        if not next_part:
+            # Fits in a single part: a plain PUT is one request instead of three
+            try:
+                response = self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=part, **extra)
+            except self.client_error as e:
+                raise self._translate(e, key) from e
+            return {"key": key, "etag": response.get('ETag', '').strip('"'),
+                    "size": len(part), "sha256": digest.hexdigest()}
+
+        try:
+            upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=key, **extra)['UploadId']
+        except self.client_error as e:
+            raise self._translate(e, key) from e
+
+        size = 0
+        parts = []
+        try:
+            while part:
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                    PartNumber=len(parts) + 1, Body=part
+                )
+                parts.append({"PartNumber": len(parts) + 1, "ETag": response['ETag']})
+                size += len(part)
+                part, next_part = next_part, (_read_part(stream, part_size) if next_part else b"")
+                digest.update(part)
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except BaseException as e:
+            # Abort so the parts already uploaded are not stored (and billed) indefinitely
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+            except self.client_error as abort_error:
+                logging.warning(f"[S3StorageBackend] Failed to abort multipart upload of {key}: {abort_error}")
+            if isinstance(e, self.client_error):
+                raise self._translate(e, key) from e
+            raise
+        return {"key": key, "etag": response.get('ETag', '').strip('"'), "size": size, "sha256": digest.hexdigest()}
+
+
+#=============================================================
+# Local filesystem
+#=============================================================
+def _markers_last(key):
+    """Sort key that orders a directory marker after every key inside it."""
+    return key + '\uffff' if key.endswith('/') else key
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Stores each object as a file under root_dir, at the path given by its key.
+
+    Directories are implicit, like S3 prefixes: they are created by writes,
+    removed when their last object is deleted, and never listed as objects.
+    A legacy directory marker key maps to its directory. Content type and user
+    metadata are kept in JSON sidecar files under root_dir/.storage_meta.
+    Files are written to a temporary name and renamed into place, so readers
+    in other processes never see a partial object.
+    """
+
+    METADATA_DIR = ".storage_meta"
+
+    def __init__(self, root_dir=LOCAL_STORAGE_ROOT):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, key):
+        """Map a key to a path under root_dir, rejecting keys that would escape it."""
+        parts = [part for part in key.replace('\\', '/').split('/') if part]
+        if any(part in ('.', '..') for part in parts) or (parts and parts[0] == self.METADATA_DIR):
+            raise StorageError(f"Invalid storage key: {key}")
+        return os.path.join(self.root_dir, *parts)
+
+    def _metadata_path(self, key):
+        return os.path.join(self.root_dir, self.METADATA_DIR, *key.strip('/').split('/')) + ".json"
+
+    def _key_for(self, path):
+        return os.path.relpath(path, self.root_dir).replace(os.sep, '/')
+
+    @staticmethod
+    def _etag(stat_result):
+        # Changes whenever the file is rewritten, which is all the caches keyed on ETags rely on
+        return f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+
+    def _describe(self, key, path, stat_result=None):
+        stat_result = stat_result or os.stat(path)
+        sidecar = {}
+        if not key.endswith('/'):
+            try:
+                with open(self._metadata_path(key), 'r', encoding='utf-8') as f:
+                    sidecar = json.load(f)
+            except (OSError, ValueError):
+                sidecar = {}
+        return {
+            "key": key,
+            "size": 0 if key.endswith('/') else stat_result.st_size,
+            "etag": self._etag(stat_result),
+            "last_modified": datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc),
+            "content_type": sidecar.get("content_type") or mimetypes.guess_type(key)[0],
+            "metadata": sidecar.get("metadata", {})
+        }
+
+    def _write_atomic(self, path, write):
+        for attempt in range(3):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                break
+            except FileNotFoundError:
+                # A delete pruned the directory between makedirs and mkstemp
+                if attempt == 2:
+                    raise
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _write_metadata(self, key, content_type, metadata):
+        metadata_path = self._metadata_path(key)
+        if not content_type and not metadata:
+            if os.path.exists(metadata_path):
+                os.remove(metadata_path)
+            return
+        sidecar = json.dumps({"content_type": content_type, "metadata": metadata or {}}).encode('utf-8')
+        self._write_atomic(metadata_path, lambda f: f.write(sidecar))
+
+    def get_object(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                description = self._describe(key, path, os.fstat(f.fileno()))
+                description["body"] = f.read()
+            return description
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as e:
+            raise ObjectNotFound(f"Object not found: {key}") from e
+        except OSError as e:
+            raise StorageError(f"Error reading {key}: {e}") from e
+
+    def get_if_modified(self, key, etag):
+        path = self._path(key)
+        try:
+            if self._etag(os.stat(path)) == etag:
+                return None
+        except FileNotFoundError as e:
+            raise ObjectNotFound(f"Object not found: {key}") from e
+        return self.get_object(key)
+
+    def put(self, key, body, content_type=None, metadata=None, if_match=None):
+        path = self._path(key)
+        try:
+            if key.endswith('/'):
+                os.makedirs(path, exist_ok=True)
+                return self._etag(os.stat(path))
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            if if_match:
+                with self._write_lock(path):
+                    try:
+                        current_etag = self._etag(os.stat(path))
+                    except FileNotFoundError as e:
+                        raise ObjectNotFound(f"Object not found: {key}") from e
+                    if current_etag != if_match:
+                        raise PreconditionFailed(f"Object changed since it was read: {key}")
+                    self._write_atomic(path, lambda f: f.write(body))
+            else:
+                self._write_atomic(path, lambda f: f.write(body or b''))
+            self._write_metadata(key, content_type, metadata)
+            return self._etag(os.stat(path))
+        except OSError as e:
+            raise StorageError(f"Error writing {key}: {e}") from e
+
+    @contextmanager
+    def _write_lock(self, path, timeout=10, stale_after=30):
+        """
+        Hold an exclusive lock file next to path while a conditional write
+        compares and replaces it. Works across processes and on every OS.
+        """
+        lock_path = f"{os.path.dirname(path)}{os.sep}.tmp-{os.path.basename(path)}.lock"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    # A lock left behind by a crashed process is broken once it is stale
+                    if time.time() - os.path.getmtime(lock_path) > stale_after:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise StorageError(f"Timed out waiting for lock on {path}")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.remove(lock_path)
+
+    def head(self, key):
+        path = self._path(key)
+        if key.endswith('/') != os.path.isdir(path) or not os.path.exists(path):
+            raise ObjectNotFound(f"Object not found: {key}")
+        try:
+            return self._describe(key, path)
+        except FileNotFoundError as e:
+            raise ObjectNotFound(f"Object not found: {key}") from e
+
+    def list(self, prefix, delimiter=None):
+        # Walk the deepest directory the prefix fully names, then filter on the full prefix
+        base_key = prefix[:prefix.rfind('/') + 1] if '/' in prefix else ''
+        base_path = self._path(base_key) if base_key else self.root_dir
+        objects = []
+        prefixes = []
+        if not os.path.isdir(base_path):
+            return {"objects": objects, "prefixes": prefixes}
+
+        if delimiter == '/':
+            for entry in os.scandir(base_path):
+                if entry.name.startswith('.tmp-') or (not base_key and entry.name == self.METADATA_DIR):
+                    continue
+                key = base_key + entry.name
+                if not key.startswith(prefix):
+                    continue
+                if entry.is_dir():
+                    prefixes.append(key + '/')
+                else:
+                    objects.append(self._describe(key, entry.path))
+        else:
+            for dir_path, dir_names, file_names in os.walk(base_path):
+                if dir_path == self.root_dir and self.METADATA_DIR in dir_names:
+                    dir_names.remove(self.METADATA_DIR)
+                dir_key = self._key_for(dir_path) + '/' if dir_path != self.root_dir else ''
+                for file_name in file_names:
+                    key = dir_key + file_name
+                    if key.startswith(prefix) and not file_name.startswith('.tmp-'):
+                        objects.append(self._describe(key, os.path.join(dir_path, file_name)))
+
+        objects.sort(key=lambda obj: obj["key"])
+        prefixes.sort()
+        return {"objects": objects, "prefixes": prefixes}
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            if key.endswith('/'):
+                if os.path.isdir(path) and not os.listdir(path):
+                    os.rmdir(path)
+                return
+            if os.path.isfile(path):
+                os.remove(path)
+                self._prune(os.path.dirname(path))
+            metadata_path = self._metadata_path(key)
+            if os.path.exists(metadata_path):
+                os.remove(metadata_path)
+        except OSError as e:
+            raise StorageError(f"Error deleting {key}: {e}") from e
+
+    def _prune(self, dir_path):
+        """Remove dir_path and its parents while they are empty, as a prefix disappears with its last object."""
+        while dir_path != self.root_dir and dir_path.startswith(self.root_dir):
+            try:
+                os.rmdir(dir_path)
+            except OSError:
+                # Not empty, or already gone
+                return
+            dir_path = os.path.dirname(dir_path)
+
+    def delete_many(self, keys):
+        # Remove files before the directory markers that contain them
+        return super().delete_many(sorted(set(keys), key=_markers_last))
+
+    def stream(self, key, chunk_size=STORAGE_STREAM_CHUNK_SIZE):
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as e:
+            raise ObjectNotFound(f"Object not found: {key}") from e
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def upload_file(self, local_path, key):
+        path = self._path(key)
+        try:
+            with open(local_path, 'rb') as src:
+                self._write_atomic(path, lambda f: shutil.copyfileobj(src, f))
+        except FileNotFoundError as e:
+            raise StorageError(f"Local file does not exist: {local_path}") from e
+        except OSError as e:
+            raise StorageError(f"Error writing {key}: {e}") from e
+
+    def download_file(self, key, local_path):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(f"Object not found: {key}")
+        try:
+            shutil.copyfile(path, local_path)
+        except OSError as e:
+            raise StorageError(f"Error downloading {key}: {e}") from e
+
+    def upload_stream(self, key, stream, content_type=None, part_size=STORAGE_UPLOAD_PART_SIZE):
+        """Copy a stream into place part by part through a temporary file in the object's directory."""
+        path = self._path(key)
+        digest = hashlib.sha256()
+
+        def write(f):
+            while True:
+                part = _read_part(stream, part_size)
+                if not part:
+                    break
+                digest.update(part)
+                f.write(part)
+
+        try:
+            self._write_atomic(path, write)
+            self._write_metadata(key, content_type, None)
+            stat_result = os.stat(path)
+        except OSError as e:
+            raise StorageError(f"Error writing {key}: {e}") from e
+        return {"key": key, "etag": self._etag(stat_result), "size": stat_result.st_size, "sha256": digest.hexdigest()}
+
+
+#=============================================================
+# Backend selection
+#=============================================================
+STORAGE_BACKENDS = {
+    "s3": S3StorageBackend,
+    "local": LocalStorageBackend
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return the process-wide storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND not in STORAGE_BACKENDS:
+                    raise ValueError(f"Invalid storage backend: {STORAGE_BACKEND}")
+                _storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+                logging.info(f"[get_storage] Using {STORAGE_BACKEND} storage backend")
+    return _storage
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+structure_registry.py
+
+Parsed structure files from static/json_structure_data, loaded once.
+
+Every *_structure.json file is parsed a single time and indexed by table name.
+The registry also precomputes what the request path needs from each file:
+its root_key, the reverse root_key -> table name map used to remap AI
+responses, the AI-instruction text used in prompts, and the schema shown by
+the table view. Files are re-parsed only when their mtime or size changes,
+and the directory is checked for changes at most every
+STRUCTURE_REGISTRY_CHECK_SECONDS.
+
+get_structure_registry() returns the process-wide instance.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from config import STRUCTURE_FILES_DIR, STRUCTURE_REGISTRY_CHECK_SECONDS
+
+STRUCTURE_SUFFIX = "_structure.json"
+
+
+def build_ai_instructions(table_info):
+    """Table-level and field-level AI instructions of a structure, one per line."""
+    ai_instructions = []
+
+    # Add table-level AI instructions if they exist
+    if 'ai_instructions' in table_info:
+        ai_instructions.append(f"Table Purpose: {table_info['ai_instructions']}")
+    # Extract field-level AI instructions from the structure
+    if 'structure' in table_info:
+        root_struct_key = next(iter(table_info['structure']))
+        properties = table_info['structure'][root_struct_key]['items']['properties']
+
+        for field_name, field_info in properties.items():
+            if 'ai_instructions' in field_info:
+                ai_instructions.append(f"{field_name}: {field_info['ai_instructions']}")
+    return "\n".join(ai_instructions)
+
+
+class StructureRegistry:
+    """
+    Index of the structure files in a directory.
+
+    Parameters
+    ----------
+    structure_dir : str
+        Directory holding the *_structure.json files.
+    check_seconds : float
+        Minimum time between checks of the directory for changed files.
+    """
+
+    def __init__(self, structure_dir=STRUCTURE_FILES_DIR, check_seconds=STRUCTURE_REGISTRY_CHECK_SECONDS):
+        self.structure_dir = structure_dir
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._signatures = {}  # file name -> (mtime_ns, size)
+        self._entries = {}  # file name -> entry
+        self._by_table = {}
+        self._by_root_key = {}
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+
+    def _parse(self, file_name):
+        """Parse one structure file into its registry entry."""
+        with open(os.path.join(self.structure_dir, file_name), 'r', encoding='utf-8') as f:
+            structure_data = json.load(f)
+        # The table description is under the first key of the structure data
+        table_key = next(iter(structure_data))
+        table_info = structure_data[table_key]
+        return {
+            "table_name": file_name[:-len(STRUCTURE_SUFFIX)],
+            "file_name": file_name,
+            "root_key": table_info.get('root_key'),
+            "ai_instructions": build_ai_instructions(table_info),
+            "schema": {
+                "structure": table_info.get('structure'),
+                "display": table_info.get('display')
+            },
+            "data": structure_data
+        }
+
+    def refresh(self, force=False):
+        """Re-parse structure files added or changed since the last check."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < self.check_seconds:
+                return
+            self._checked_at = now
+
+            try:
+                signatures = {
+                    entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+                    for entry in os.scandir(self.structure_dir)
+                    if entry.is_file() and entry.name.endswith(STRUCTURE_SUFFIX)
+                }
+            except OSError as e:
+                logging.error(f"[StructureRegistry] Cannot read {self.structure_dir}: {e}")
+                return
+            if signatures == self._signatures:
+                return
+
+            entries = {}
+            for file_name, signature in signatures.items():
+                if self._signatures.get(file_name) == signature and file_name in self._entries:
+                    entries[file_name] = self._entries[file_name]
+                    continue
+                try:
+                    entries[file_name] = self._parse(file_name)
+                except (OSError, ValueError, KeyError, StopIteration, TypeError) as e:
+                    logging.error(f"[StructureRegistry] Skipping unreadable structure file {file_name}: {e}")
+
+            by_root_key = {}
+            for file_name in sorted(entries):
+                entry = entries[file_name]
+                if entry["root_key"]:
+                    by_root_key.setdefault(entry["root_key"], []).append(entry["table_name"])
+
+            self._signatures = signatures
+            self._entries = entries
+            self._by_table = {entry["table_name"]: entry for entry in entries.values()}
+            self._by_root_key = {root_key: tuple(names) for root_key, names in by_root_key.items()}
+            logging.info(f"[StructureRegistry] Loaded {len(entries)} structure files from {self.structure_dir}")
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def get(self, table_name):
+        """The registry entry of a table, or None if no structure file defines it."""
+        self.refresh()
+        return self._by_table.get(table_name)
+
+    def table_names(self):
+        self.refresh()
+        return sorted(self._by_table)
+
+    def root_key(self, table_name):
+        entry = self.get(table_name)
+        return entry["root_key"] if entry else None
+
+    def ai_instructions(self, table_name):
+        """AI-instruction text for a table, or None if no structure file defines it."""
+        entry = self.get(table_name)
+        return entry["ai_instructions"] if entry else None
+
+    def schema(self, table_name):
+        """{"structure", "display"} for a table, or None if it has no structure."""
+        entry = self.get(table_name)
+        return entry["schema"] if entry and entry["schema"]["structure"] else None
+
+    def resolve_key(self, key, table_names=None):
+        """
+        Table name for a key of an AI response: the key itself if it is a table
+        name, else the table whose root_key it is. Several tables share some
+        root_keys ("deals", "expenses", ...); a table in table_names, when
+        given, wins. Returns None if the key matches nothing.
+        """
+        self.refresh()
+        if key in self._by_table:
+            return key
+        candidates = self._by_root_key.get(key)
+        if not candidates:
+            return None
+        if table_names:
+            for table_name in candidates:
+                if table_name in table_names:
+                    return table_name
+        return candidates[0]
+
+
+_structure_registry = None
+_structure_registry_lock = threading.Lock()
+
+
+def get_structure_registry():
+    """Return the process-wide structure registry."""
+    global _structure_registry
+    with _structure_registry_lock:
+        if _structure_registry is None:
+            _structure_registry = StructureRegistry()
+    return _structure_registry
+
+
+if __name__ == "__main__":
+    # Benchmark: remapping the root_keys of a response by directory scan vs registry lookup
+    registry = StructureRegistry()
+    registry.refresh(force=True)
+    root_keys = [entry["root_key"] for entry in registry._entries.values() if entry["root_key"]]
+
+    def scan(key):
+        for struct_file in os.listdir(STRUCTURE_FILES_DIR):
+            if struct_file.endswith(STRUCTURE_SUFFIX):
+                with open(os.path.join(STRUCTURE_FILES_DIR, struct_file)) as f:
+                    structure = json.load(f)
+                    table_name = next(iter(structure))
+                    if structure[table_name].get('root_key') == key:
+                        return table_name
+        return None
+
+    rounds = 20
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in root_keys:
+            scan(key)
+    scanned = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in root_keys:
+            registry.resolve_key(key)
+    looked_up = time.perf_counter() - start
+
+    print(f"{rounds * len(root_keys)} root_key remaps over {len(registry.table_names())} structure files")
+    print(f"  directory scan:  {scanned * 1000:.1f} ms")
+    print(f"  registry lookup: {looked_up * 1000:.2f} ms")
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+table_store.py
+
+Storage layouts for a project's table data (revenue, employees, ...).
+
+- FileTableStore ("files") keeps each table in its own <data>/<table>.json
+  object. This is the original layout.
+- BundleTableStore ("bundle") keeps every table in one compact
+  <data>/tables.bundle object. Each update is a small delta object under
+  <data>/table_log/. Loading a project reads the bundle plus any deltas not
+  yet compacted. Once TABLE_BUNDLE_COMPACT_AFTER deltas pile up, and at the
+  end of each extraction job, the deltas are folded back into the bundle and
+  deleted.
+
+TABLE_STORAGE_LAYOUT in config.py selects the layout; get_table_store() returns
+the process-wide instance. A project created under the file layout is imported
+into a bundle the first time it is read under the bundle layout.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+from config import TABLE_STORAGE_LAYOUT, TABLE_BUNDLE_COMPACT_AFTER
+from file_manager import (
+    read_json, write_json, put_object, object_cache, manifests, storage,
+    list_project_data_files, delete_objects
+)
+from storage_backend import ObjectNotFound, PreconditionFailed, StorageError
+
+BUNDLE_NAME = "tables.bundle"
+LOG_DIR = "table_log"
+
+
+class FileTableStore:
+    """One JSON object per table, written with indent=4 for readability."""
+
+    def list_tables(self, data_path):
+        """Names of the tables in a project's data directory."""
+        return [os.path.splitext(file_name)[0] for file_name in list_project_data_files(data_path)]
+
+    def load_tables(self, data_path, table_names):
+        """Return {table_name: data} for the requested tables. Missing tables map to None."""
+        tables = {}
+        for table_name in table_names:
+            try:
+                tables[table_name] = read_json(f"{data_path}/{table_name}.json")
+            except Exception as e:
+                logging.error(f"[FileTableStore] Error loading {table_name}: {e}")
+                tables[table_name] = None
+        return tables
+
+    def save_tables(self, data_path, tables):
+        """Write each table to its own object. Returns the names that failed."""
+        failed = []
+        with manifests.batched_updates():
+            for table_name, data in tables.items():
+                if not write_json(f"{data_path}/{table_name}.json", data):
+                    failed.append(table_name)
+        return failed
+
+    def initial_objects(self, data_path, tables):
+        """{key: bytes} holding tables in a new, empty project, for writing in one parallel batch."""
+        return {
+            f"{data_path}/{table_name}.json": json.dumps(data, indent=4).encode('utf-8')
+            for table_name, data in tables.items()
+        }
+
+    def compact(self, data_path):
+        """Nothing to compact in the file layout."""
+        return False
+
+
+class BundleTableStore:
+    """
+    All tables in one object plus an append-only log of delta objects.
+
+    The bundle is {"tables": {name: data}, "applied": [delta keys],
+    "high_water": delta key}. "applied" lists deltas already folded in that
+    still exist, so a delta whose delete failed after compaction is never
+    applied twice. "high_water" is the newest delta folded in: a delta ordered
+    before it that was never applied turned up late (e.g. a slow write from
+    another process) and is dropped, since replaying it would overwrite the
+    newer data already in the bundle.
+
+    Deltas are listed from storage itself, not the project manifest, so a
+    delta another process has just written is never missed.
+    """
+
+    def __init__(self, compact_after=TABLE_BUNDLE_COMPACT_AFTER):
+        self.compact_after = compact_after
+        self._compact_lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+
+    def _read_state(self, data_path):
+        """
+        Return (tables, bundle_etag, applied, high_water, pending, late) with
+        every pending delta applied to the bundle's tables. applied holds the
+        bundle's applied deltas that still exist, late the deltas ordered
+        before high_water that were never applied.
+        """
+        bundle_key = f"{data_path}/{BUNDLE_NAME}"
+        try:
+            body, etag = object_cache.get_with_etag(bundle_key)
+            bundle = json.loads(body.decode('utf-8'))
+        except ObjectNotFound:
+            # Compaction stays conditional on the bundle the import just wrote
+            bundle, etag = self._import_files(data_path)
+
+        tables = bundle.get("tables", {})
+        high_water = bundle.get("high_water")
+        delta_keys = self._delta_keys(data_path)
+        applied = set(bundle.get("applied", [])) & set(delta_keys)
+        unapplied = [key for key in delta_keys if key not in applied]
+        pending = [key for key in unapplied if high_water is None or key > high_water]
+        late = [key for key in unapplied if high_water is not None and key <= high_water]
+        for delta_key in pending:
+            try:
+                # Deltas are never rewritten, so the cached copy is always current
+                tables.update(json.loads(object_cache.get(delta_key).decode('utf-8'))["tables"])
+            except ObjectNotFound:
+                # Folded into the bundle and deleted by a concurrent compaction
+                continue
+        return tables, etag, applied, high_water, pending, late
+
+    def _delta_keys(self, data_path):
+        # Listed from storage: the manifest is cached and may not show another process's deltas yet
+        log_prefix = f"{data_path}/{LOG_DIR}/"
+        return sorted(
+            obj["key"] for obj in storage.list(log_prefix)["objects"]
+            if obj["key"].endswith(".delta")
+        )
+
+    def _import_files(self, data_path):
+        """
+        Build the first bundle of a project from its per-table files, if it has any.
+        Returns (bundle, etag), where etag is None if no bundle was written.
+        """
+        file_store = FileTableStore()
+        table_names = file_store.list_tables(data_path)
+        tables = {name: data for name, data in file_store.load_tables(data_path, table_names).items()
+                  if data is not None}
+        bundle = {"tables": tables, "applied": []}
+        etag = None
+        if tables:
+            etag = put_object(f"{data_path}/{BUNDLE_NAME}", self._serialize(bundle), content_type='application/json')
+            logging.info(f"[BundleTableStore] Imported {len(tables)} table files into {data_path}/{BUNDLE_NAME}")
+        return bundle, etag
+
+    def list_tables(self, data_path):
+        return sorted(self._read_state(data_path)[0])
+
+    def load_tables(self, data_path, table_names):
+        tables = self._read_state(data_path)[0]
+        return {table_name: tables.get(table_name) for table_name in table_names}
+
+    # -------------------------------------------------------------------------
+    # Writing
+    # -------------------------------------------------------------------------
+
+    def save_tables(self, data_path, tables):
+        """Append one delta holding every table in tables. Returns the names that failed."""
+        if not tables:
+            return []
+        # Time-ordered names, so deltas apply in the order they were written
+        delta_key = f"{data_path}/{LOG_DIR}/{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.delta"
+        try:
+            put_object(delta_key, self._serialize({"tables": tables}), content_type='application/json')
+        except StorageError as e:
+            logging.error(f"[BundleTableStore] Failed to write delta {delta_key}: {e}")
+            return list(tables)
+
+        if len(self._delta_keys(data_path)) >= self.compact_after:
+            self.compact(data_path)
+        return []
+
+    def initial_objects(self, data_path, tables):
+        """{key: bytes} holding tables in a new, empty project: a bundle with no deltas."""
+        return {f"{data_path}/{BUNDLE_NAME}": self._serialize({"tables": tables, "applied": []})}
+
+    def compact(self, data_path):
+        """
+        Fold pending deltas into the bundle and delete them, along with any late
+        deltas. Returns True if a new bundle was written. A concurrent
+        compaction wins silently.
+        """
+        bundle_key = f"{data_path}/{BUNDLE_NAME}"
+        with self._compact_lock:
+            # Compare against the stored bundle, not a cached copy that may be a few seconds old
+            object_cache.invalidate(bundle_key)
+            tables, etag, applied, high_water, pending, late = self._read_state(data_path)
+            if not pending and not late:
+                return False
+            if late:
+                logging.warning(f"[BundleTableStore] Dropping {len(late)} deltas of {data_path} that arrived after "
+                                f"newer ones were compacted: {late}")
+
+            body = self._serialize({
+                "tables": tables,
+                "applied": sorted(applied | set(pending)),
+                "high_water": max(pending + [high_water or ""]) or None
+            })
+            try:
+                etag = object_cache.put(bundle_key, body, content_type='application/json', if_match=etag)
+                manifests.record_put(bundle_key, etag, len(body))
+            except PreconditionFailed:
+                logging.info(f"[BundleTableStore] {bundle_key} was compacted concurrently")
+                return False
+            except StorageError as e:
+                logging.error(f"[BundleTableStore] Failed to compact {bundle_key}: {e}")
+                return False
+
+            summary = delete_objects(pending + late)
+            logging.info(
+                f"[BundleTableStore] Compacted {len(pending)} deltas into {bundle_key} "
+                f"({len(summary['errors'])} left for the next compaction)"
+            )
+            return True
+
+    @staticmethod
+    def _serialize(data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+TABLE_STORES = {
+    "files": FileTableStore,
+    "bundle": BundleTableStore
+}
+
+_table_store = None
+
+
+def get_table_store():
+    """Return the process-wide table store selected by TABLE_STORAGE_LAYOUT."""
+    global _table_store
+    if _table_store is None:
+        if TABLE_STORAGE_LAYOUT not in TABLE_STORES:
+            raise ValueError(f"Invalid table storage layout: {TABLE_STORAGE_LAYOUT}")
+        _table_store = TABLE_STORES[TABLE_STORAGE_LAYOUT]()
+    return _table_store
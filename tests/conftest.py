@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+conftest.py
+
+Shared fixtures. openai_stub is a local HTTP server standing in for the OpenAI
+chat completions endpoint, so the client can be tested over real sockets.
+Storage uses the local backend in a temporary directory.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Storage goes to a scratch directory, never to S3, for every module the tests import
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["LOCAL_STORAGE_ROOT"] = tempfile.mkdtemp(prefix="autofinmodel-tests-")
+
+import openai_client
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Records each request and answers with the next response queued on the server."""
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append({"client_port": self.client_address[1], "body": body, "headers": dict(self.headers)})
+        respond = self.server.responses.pop(0) if self.server.responses else json_response({"ok": True})
+        respond(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def json_response(body, status=200, headers=None, delay=0):
+    """Response that sleeps delay seconds, then sends body as JSON."""
+    def respond(handler):
+        time.sleep(delay)
+        data = json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+    return respond
+
+
+def stream_response(pieces, delay=0.02):
+    """Response that sends each piece of text as its own HTTP chunk, delay seconds apart."""
+    def respond(handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        for piece in pieces:
+            data = piece.encode("utf-8")
+            handler.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            handler.wfile.flush()
+            time.sleep(delay)
+        handler.wfile.write(b"0\r\n\r\n")
+    return respond
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubOpenAIHandler)
+        self.requests = []
+        self.responses = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+
+
+@pytest.fixture
+def openai_stub():
+    """A running stub server; queue responses on .responses, inspect .requests."""
+    server = StubOpenAIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    openai_client.close_openai_session()
+    yield server
+    openai_client.close_openai_session()
+    server.shutdown()
+    server.server_close()
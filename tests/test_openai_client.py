@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Pooled session, timeouts and stream parsing of openai_client against a local stub server."""
+
+import json
+
+import pytest
+import requests
+
+import openai_client
+from conftest import json_response, stream_response
+
+
+def delta(text):
+    return json.dumps({"choices": [{"index": 0, "delta": {"content": text}}]})
+
+
+def stream_events(server, pieces):
+    server.responses.append(stream_response(pieces))
+    response = openai_client.post_chat_completion({"stream": True}, api_url=server.url, stream=True)
+    return list(openai_client.iter_stream_events(response))
+
+
+#=============================================================
+# Pooled session
+#=============================================================
+def test_sequential_calls_reuse_one_connection(openai_stub):
+    for _ in range(3):
+        response = openai_client.post_chat_completion({"model": "test"}, api_url=openai_stub.url)
+        assert response.json() == {"ok": True}
+
+    assert len(openai_stub.requests) == 3
+    assert len({request["client_port"] for request in openai_stub.requests}) == 1
+
+
+def test_streamed_call_returns_its_connection_to_the_pool(openai_stub):
+    assert stream_events(openai_stub, [f"data: {delta('a')}\n\n", "data: [DONE]\n\n"])
+    openai_client.post_chat_completion({"model": "test"}, api_url=openai_stub.url)
+
+    assert openai_stub.requests[0]["client_port"] == openai_stub.requests[1]["client_port"]
+
+
+def test_closing_the_session_opens_a_new_connection(openai_stub):
+    openai_client.post_chat_completion({}, api_url=openai_stub.url)
+    first_session = openai_client.get_openai_session()
+    openai_client.close_openai_session()
+    openai_client.post_chat_completion({}, api_url=openai_stub.url)
+
+    assert openai_client.get_openai_session() is not first_session
+    assert openai_stub.requests[0]["client_port"] != openai_stub.requests[1]["client_port"]
+
+
+def test_requests_carry_payload_and_auth_header(openai_stub, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_API_KEY", "sk-test")
+    openai_client.post_chat_completion({"model": "test", "messages": []}, api_url=openai_stub.url)
+
+    request = openai_stub.requests[0]
+    assert request["body"] == {"model": "test", "messages": []}
+    assert request["headers"]["Authorization"] == "Bearer sk-test"
+
+
+#=============================================================
+# Timeouts
+#=============================================================
+def test_slow_response_raises_read_timeout(openai_stub):
+    openai_stub.responses.append(json_response({"ok": True}, delay=1.0))
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        openai_client.post_chat_completion({}, api_url=openai_stub.url, timeout=(1, 0.2))
+
+
+def test_stalled_stream_raises_instead_of_hanging(openai_stub):
+    openai_stub.responses.append(stream_response([f"data: {delta('a')}\n\n", f"data: {delta('b')}\n\n"], delay=1.0))
+    response = openai_client.post_chat_completion({}, api_url=openai_stub.url, timeout=(1, 0.2), stream=True)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        list(openai_client.iter_stream_events(response))
+
+
+def test_default_timeouts_come_from_config(openai_stub, monkeypatch):
+    sent = {}
+    real_post = requests.Session.post
+
+    def post(self, url, **kwargs):
+        sent.update(kwargs)
+        return real_post(self, url, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "post", post)
+    openai_client.post_chat_completion({}, api_url=openai_stub.url)
+
+    assert sent["timeout"] == (openai_client.OPENAI_CONNECT_TIMEOUT, openai_client.OPENAI_READ_TIMEOUT)
+
+
+#=============================================================
+# Stream parsing
+#=============================================================
+def test_events_are_decoded_until_done(openai_stub):
+    events = stream_events(openai_stub, [
+        f"data: {delta('Hello')}\n\n",
+        f"data: {delta(' world')}\n\n",
+        "data: [DONE]\n\n",
+        f"data: {delta('after done')}\n\n"
+    ])
+
+    assert [event["choices"][0]["delta"]["content"] for event in events] == ["Hello", " world"]
+
+
+def test_data_line_split_across_chunks(openai_stub):
+    line = f"data: {delta('split payload')}\n\n"
+    events = stream_events(openai_stub, [line[:15], line[15:30], line[30:], "data: [DONE]\n\n"])
+
+    assert [event["choices"][0]["delta"]["content"] for event in events] == ["split payload"]
+
+
+def test_field_name_and_line_ending_split_across_chunks(openai_stub):
+    events = stream_events(openai_stub, [
+        "da", f"ta: {delta('one')}\r", "\n\r\n",
+        f"data:{delta('two')}\r\n\r\n",
+        "data: [DO", "NE]\r\n\r\n"
+    ])
+
+    assert [event["choices"][0]["delta"]["content"] for event in events] == ["one", "two"]
+
+
+def test_several_events_in_one_chunk(openai_stub):
+    events = stream_events(openai_stub, [f"data: {delta('a')}\n\ndata: {delta('b')}\n\ndata: [DONE]\n\n"])
+
+    assert [event["choices"][0]["delta"]["content"] for event in events] == ["a", "b"]
+
+
+def test_comments_other_fields_and_bad_json_are_skipped(openai_stub):
+    events = stream_events(openai_stub, [
+        ": keep-alive\n\n",
+        "event: message\n",
+        f"data: {delta('kept')}\n\n",
+        "data: {not json\n\n",
+        "data: [DONE]\n\n"
+    ])
+
+    assert [event["choices"][0]["delta"]["content"] for event in events] == ["kept"]
+
+
+def test_stream_without_done_ends_with_last_event(openai_stub):
+    events = stream_events(openai_stub, [f"data: {delta('a')}\n\n", f"data: {delta('last')}"])
+
+    assert [event["choices"][0]["delta"]["content"] for event in events] == ["a", "last"]
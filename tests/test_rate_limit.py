@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""RateLimitScheduler retries, backoff and shared pauses, driven by fake 429s from the stub server."""
+
+import sys
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+import openai_client
+from conftest import json_response
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return openai_client.RateLimitScheduler(
+        tokens_per_minute=10000, db_path=str(tmp_path / "rate_limit.db"),
+        max_retries=3, backoff_base=0.05, backoff_max=0.2
+    )
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the backoff sleeps of RateLimitScheduler.send, sleeping for real so pauses still expire."""
+    recorded = []
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        # time is shared with the stub server and requests, so only count send()'s own sleeps
+        if sys._getframe(1).f_code is openai_client.RateLimitScheduler.send.__code__:
+            recorded.append(seconds)
+        real_sleep(seconds)
+
+    monkeypatch.setattr(openai_client.time, "sleep", sleep)
+    return recorded
+
+
+def too_many_requests(**headers):
+    return json_response({"error": {"message": "Rate limit reached"}}, status=429, headers=headers)
+
+
+#=============================================================
+# Retries
+#=============================================================
+def test_retry_after_is_honoured(openai_stub, scheduler, sleeps):
+    openai_stub.responses += [too_many_requests(**{"retry-after": "0.3"}), json_response({"ok": True})]
+
+    response = scheduler.send({}, 100, api_url=openai_stub.url)
+
+    assert response.status_code == 200
+    assert len(openai_stub.requests) == 2
+    assert sleeps[0] == pytest.approx(0.3)
+
+
+def test_retry_after_ms_takes_precedence(openai_stub, scheduler, sleeps):
+    openai_stub.responses += [
+        too_many_requests(**{"retry-after": "5", "retry-after-ms": "150"}),
+        json_response({"ok": True})
+    ]
+
+    assert scheduler.send({}, 100, api_url=openai_stub.url).status_code == 200
+    assert sleeps[0] == pytest.approx(0.15)
+
+
+def test_backoff_without_retry_after_is_jittered_and_capped(openai_stub, scheduler, sleeps, monkeypatch):
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return high / 2
+
+    monkeypatch.setattr(openai_client.random, "uniform", uniform)
+    openai_stub.responses += [json_response({}, status=503) for _ in range(3)] + [json_response({"ok": True})]
+
+    assert scheduler.send({}, 100, api_url=openai_stub.url).status_code == 200
+    # Full jitter over base * 2^attempt, capped at backoff_max
+    assert bounds == [(0, 0.05), (0, 0.1), (0, 0.2)]
+    assert sleeps == [pytest.approx(0.025), pytest.approx(0.05), pytest.approx(0.1)]
+
+
+def test_jitter_spreads_delays(scheduler):
+    delays = {scheduler.backoff_delay(2) for _ in range(20)}
+
+    assert len(delays) > 1
+    assert all(0 <= delay <= 0.2 for delay in delays)
+
+
+def test_last_429_is_returned_once_retries_are_exhausted(openai_stub, scheduler, sleeps):
+    openai_stub.responses += [too_many_requests(**{"retry-after": "0.01"}) for _ in range(4)]
+
+    response = scheduler.send({}, 100, api_url=openai_stub.url)
+
+    assert response.status_code == 429
+    assert len(openai_stub.requests) == scheduler.max_retries + 1
+
+
+def test_client_errors_are_not_retried(openai_stub, scheduler):
+    openai_stub.responses.append(json_response({"error": "bad request"}, status=400))
+
+    assert scheduler.send({}, 100, api_url=openai_stub.url).status_code == 400
+    assert len(openai_stub.requests) == 1
+
+
+#=============================================================
+# Pauses and the shared budget
+#=============================================================
+def test_429_pauses_other_schedulers_on_the_host(openai_stub, scheduler):
+    other_process = openai_client.RateLimitScheduler(tokens_per_minute=10000, db_path=scheduler.db_path)
+    openai_stub.responses += [too_many_requests(**{"retry-after": "0.5"}), json_response({"ok": True})]
+    sender = threading.Thread(target=scheduler.send, args=({}, 100), kwargs={"api_url": openai_stub.url})
+    sender.start()
+    while not openai_stub.requests:
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+    wait, _ = other_process.try_reserve(100)
+    assert 0 < wait <= 0.5
+    start = time.monotonic()
+    other_process.acquire(100)
+    assert time.monotonic() - start >= 0.2
+    sender.join()
+
+
+def test_low_remaining_tokens_header_pauses(scheduler):
+    scheduler.observe_headers({"x-ratelimit-remaining-tokens": "50", "x-ratelimit-reset-tokens": "250ms"}, 100)
+
+    assert 0 < scheduler.paused_for() <= 0.25
+
+
+def test_enough_remaining_tokens_does_not_pause(scheduler):
+    scheduler.observe_headers({"x-ratelimit-remaining-tokens": "5000", "x-ratelimit-reset-tokens": "6m0s"}, 100)
+
+    assert scheduler.paused_for() == 0
+
+
+def _reserve_in_process(db_path, tokens, results):
+    scheduler = openai_client.RateLimitScheduler(tokens_per_minute=1000, db_path=db_path)
+    results.put(scheduler.try_reserve(tokens)[0])
+
+
+def test_token_window_is_shared_between_processes(tmp_path):
+    db_path = str(tmp_path / "rate_limit.db")
+    openai_client.RateLimitScheduler(tokens_per_minute=1000, db_path=db_path).acquire(800)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_reserve_in_process, args=(db_path, 300, results))
+    process.start()
+    wait = results.get(timeout=30)
+    process.join()
+
+    # The other process sees the 800 tokens reserved here and must wait for them to leave the window
+    assert 59 < wait <= 60
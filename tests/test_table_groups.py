@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Table groups sent to OpenAI side by side from inside a request context."""
+
+import time
+
+from flask import Flask, session
+
+import api_processing
+
+
+class StubPromptBuilder:
+    def clone(self):
+        return self
+
+
+def run_groups(monkeypatch, table_groups, delays):
+    """
+    Send table_groups concurrently, each group's work taking its delay in seconds
+    and reading the session, as process_table_group does through the project paths.
+    """
+    started = []
+
+    def process_table_group(subset_names, *args, **kwargs):
+        started.append(subset_names[0])
+        time.sleep(delays[subset_names[0]])
+        return {"text": f"{session['current_project']['name']}:{subset_names[0]};", "json_data": {}, "errors": []}
+
+    monkeypatch.setattr(api_processing, "process_table_group", process_table_group)
+    plans = [{"tables": names, "chunks": [], "calls": 1} for names in table_groups]
+
+    flask_app = Flask(__name__)
+    flask_app.secret_key = "test"
+    with flask_app.test_request_context():
+        session["current_project"] = {"name": "acme", "type": "financial"}
+        result, status_code = api_processing.send_tables_and_chunks_to_openai(
+            plans, {}, {}, "", StubPromptBuilder(), None, max_concurrent_groups=len(table_groups)
+        )
+    return result, status_code, started
+
+
+def test_groups_finishing_out_of_order(monkeypatch):
+    # The first group to start is the last to finish
+    table_groups = [["revenue"], ["expenses"], ["capex"], ["employees"]]
+    delays = {"revenue": 0.4, "expenses": 0.1, "capex": 0.2, "employees": 0.05}
+
+    result, status_code, started = run_groups(monkeypatch, table_groups, delays)
+
+    assert status_code == 200
+    assert sorted(started) == sorted(delays)
+    # Every group read the session, and results are merged in group order
+    assert result["data"]["text"] == "acme:revenue;acme:expenses;acme:capex;acme:employees;"
+
+
+def test_groups_finishing_in_order(monkeypatch):
+    table_groups = [["revenue"], ["expenses"]]
+    delays = {"revenue": 0.05, "expenses": 0.2}
+
+    result, status_code, _ = run_groups(monkeypatch, table_groups, delays)
+
+    assert status_code == 200
+    assert result["data"]["text"] == "acme:revenue;acme:expenses;"
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""BundleTableStore deltas written by other processes and deltas that arrive late."""
+
+import json
+import time
+import uuid
+
+import pytest
+
+from file_manager import storage, write_json
+from table_store import BundleTableStore, BUNDLE_NAME, LOG_DIR
+
+
+@pytest.fixture
+def data_path():
+    return f"users/test/projects/{uuid.uuid4().hex}/data"
+
+
+def put_delta_directly(data_path, tables, time_ns=None):
+    """Write a delta the way another process would, without this process's manifest seeing it."""
+    key = f"{data_path}/{LOG_DIR}/{time_ns or time.time_ns():020d}-{uuid.uuid4().hex[:8]}.delta"
+    storage.put(key, json.dumps({"tables": tables}).encode('utf-8'), content_type='application/json')
+    return key
+
+
+def read_bundle(data_path):
+    return json.loads(storage.get(f"{data_path}/{BUNDLE_NAME}"))
+
+
+def test_delta_from_another_process_is_read_and_compacted(data_path):
+    store = BundleTableStore()
+    store.save_tables(data_path, {"revenue": {"v": 1}})
+    put_delta_directly(data_path, {"revenue": {"v": 2}})
+
+    assert store.load_tables(data_path, ["revenue"]) == {"revenue": {"v": 2}}
+    assert store.compact(data_path)
+    assert read_bundle(data_path)["tables"] == {"revenue": {"v": 2}}
+    assert storage.list(f"{data_path}/{LOG_DIR}/")["objects"] == []
+
+
+def test_compaction_records_the_newest_delta(data_path):
+    store = BundleTableStore()
+    store.save_tables(data_path, {"revenue": {"v": 1}})
+    newest = put_delta_directly(data_path, {"expenses": {"v": 1}})
+
+    store.compact(data_path)
+
+    assert read_bundle(data_path)["high_water"] == newest
+
+
+def test_late_delta_never_overwrites_newer_data(data_path):
+    store = BundleTableStore()
+    written_at = time.time_ns()
+    store.save_tables(data_path, {"revenue": {"v": "new"}})
+    store.compact(data_path)
+
+    # Named before the compacted delta, but only visible after the compaction
+    late = put_delta_directly(data_path, {"revenue": {"v": "old"}}, time_ns=written_at - 1)
+
+    assert store.load_tables(data_path, ["revenue"]) == {"revenue": {"v": "new"}}
+    assert store.compact(data_path)
+    assert read_bundle(data_path)["tables"] == {"revenue": {"v": "new"}}
+    assert late not in [obj["key"] for obj in storage.list(f"{data_path}/{LOG_DIR}/")["objects"]]
+
+
+def test_imported_files_are_compacted_conditionally(data_path):
+    write_json(f"{data_path}/revenue.json", {"v": 1})
+    store = BundleTableStore()
+    store.save_tables(data_path, {"revenue": {"v": 2}})
+
+    assert store.compact(data_path)
+    assert store.load_tables(data_path, ["revenue"]) == {"revenue": {"v": 2}}
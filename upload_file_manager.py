@@ -1,16 +1,152 @@
+import os
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import tiktoken
-from config import OPENAI_MODEL
+from config import OPENAI_MODEL, TOKEN_COUNT_MEMO_SIZE, TOKEN_COUNT_THREADS
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Recent (model, text hash) -> token count results, most recently used last
+_token_count_memo = OrderedDict()
+_token_count_memo_lock = threading.Lock()
+
+
+@lru_cache(maxsize=8)
+def get_encoder(model=OPENAI_MODEL):
+    """Return the tiktoken encoder for a model. Built once per model and reused."""
+    return tiktoken.encoding_for_model(model)
+
+
+def _memo_key(text, model):
+    return (model, hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest())
+
+
+def _memo_get(key):
+    with _token_count_memo_lock:
+        count = _token_count_memo.get(key)
+        if count is not None:
+            _token_count_memo.move_to_end(key)
+        return count
+
+
+def _memo_put(key, count):
+    with _token_count_memo_lock:
+        _token_count_memo[key] = count
+        _token_count_memo.move_to_end(key)
+        while len(_token_count_memo) > TOKEN_COUNT_MEMO_SIZE:
+            _token_count_memo.popitem(last=False)
+
+
 # Function to count tokens for a given text
 def count_tokens(text, model=OPENAI_MODEL):
     if text:
-        tokenizer = tiktoken.encoding_for_model(model)
-        tokens = tokenizer.encode(text)
-        return len(tokens)
+        key = _memo_key(text, model)
+        count = _memo_get(key)
+        if count is None:
+            count = len(get_encoder(model).encode_ordinary(text))
+            _memo_put(key, count)
+        return count
     else:
         logging.debug("Warning: No Text sent to count_tokens")
-        return 0
\ No newline at end of file
+        return 0
+
+
+def count_tokens_many(texts, model=OPENAI_MODEL, num_threads=TOKEN_COUNT_THREADS):
+    """
+    Count tokens for a list of texts, encoding every uncached text in one batch,
+    threaded over up to num_threads cores.
+
+    Returns
+    -------
+    list of int
+        Token counts in the same order as texts. Empty texts count as 0.
+    """
+    counts = [0] * len(texts)
+    missing = []  # (index, key, text)
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        key = _memo_key(text, model)
+        count = _memo_get(key)
+        if count is None:
+            missing.append((i, key, text))
+        else:
+            counts[i] = count
+
+    if missing:
+        encoder = get_encoder(model)
+        missing_texts = [text for _, _, text in missing]
+        # Threads only pay off with cores to run them; on one core the batch is slower than a plain loop
+        num_threads = min(num_threads, os.cpu_count() or 1)
+        if num_threads > 1 and len(missing) > 1:
+            encoded = encoder.encode_ordinary_batch(missing_texts, num_threads=num_threads)
+        else:
+            encoded = [encoder.encode_ordinary(text) for text in missing_texts]
+        for (i, key, _), tokens in zip(missing, encoded):
+            counts[i] = len(tokens)
+            _memo_put(key, counts[i])
+
+    return counts
+
+
+if __name__ == "__main__":
+    # Before/after benchmark of token counting, on a fixed corpus so runs are comparable:
+    # 1,000 PDF-sized pages and the 7 financial table structures as prompt JSON.
+    # "before" is count_tokens as it was (encoding_for_model + encode for every text);
+    # "after" is count_tokens_many with an empty memo, then again with every text memoised.
+    # Each timing is the best and median of `repeats` runs, after one warm-up that loads the encoder.
+    # Usage: python upload_file_manager.py [repeats]
+    import sys
+    import json
+    import time
+    import statistics
+    from config import STRUCTURE_FILES_DIR, FINANCIALS_TABLE
+
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    pages = [f"Page {i}: " + "Revenue grew {0}% on higher unit volume and pricing. ".format(i % 37) * 60 for i in range(1000)]
+    tables = []
+    for structure_file in FINANCIALS_TABLE:
+        with open(os.path.join(STRUCTURE_FILES_DIR, structure_file)) as f:
+            tables.append(json.dumps(json.load(f), indent=2))
+
+    def count_tokens_before(text, model=OPENAI_MODEL):
+        return len(tiktoken.encoding_for_model(model).encode(text)) if text else 0
+
+    def clear_memo():
+        with _token_count_memo_lock:
+            _token_count_memo.clear()
+
+    def timed(func, setup=None):
+        """Best and median seconds of func() over repeats runs, and its last result."""
+        seconds = []
+        for _ in range(repeats):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            result = func()
+            seconds.append(time.perf_counter() - start)
+        return min(seconds), statistics.median(seconds), result
+
+    get_encoder().encode_ordinary("warm-up")
+    print(f"{OPENAI_MODEL}, {min(TOKEN_COUNT_THREADS, os.cpu_count() or 1)} threads, memo of {TOKEN_COUNT_MEMO_SIZE}, best/median of {repeats} runs")
+    for label, texts in (("1,000 pages", pages), ("7-table prompt", tables)):
+        runs = [
+            ("before: count_tokens per text", lambda: [count_tokens_before(t) for t in texts], None),
+            ("after: count_tokens_many, cold", lambda: count_tokens_many(texts), clear_memo),
+            ("after: count_tokens_many, memo", lambda: count_tokens_many(texts), None),
+            ("after: count_tokens, memo", lambda: [count_tokens(t) for t in texts], None)
+        ]
+        print(f"--- {label}: {len(texts)} texts, {sum(len(t) for t in texts):,} characters ---")
+        before_best = None
+        counts = []
+        for run_label, func, setup in runs:
+            best, median, result = timed(func, setup)
+            counts.append(result)
+            before_best = before_best or best
+            print(f"{run_label:<34}{best * 1000:9.2f} ms {median * 1000:9.2f} ms {before_best / best:8.1f}x")
+        assert all(result == counts[0] for result in counts), "token counts differ"
+        print(f"{sum(counts[0]):,} tokens, identical in every run")
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+user_registry.py
+
+Which users exist and which projects each one has.
+
+Storage is prefix-native: there are no empty "directory" marker objects, so a
+user or project exists because the registry says so rather than because a
+marker can be found with a HEAD. Each user has one registry object at
+users/<username>/user_info/registry.json holding
+{"projects": {project_name: {"project_type", "created_at"}}}.
+
+Registries are read through the object cache, and users already seen by this
+process are remembered, so ensure_user_exists on /api/init and the project
+list in every context build cost no storage round-trips in the common case.
+A registry that is missing (a user created before registries existed) is
+rebuilt from a delimited listing of the user's projects.
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+from config import REGISTRY_UPDATE_RETRIES
+from storage_backend import ObjectNotFound, PreconditionFailed, StorageError
+
+
+class UserRegistry:
+    """
+    Reads and maintains the per-user project registries in a storage backend.
+
+    Parameters
+    ----------
+    storage : StorageBackend
+        Backend the users live in. Used for rebuilds.
+    object_cache : ObjectCache
+        Cache the registries are read and written through.
+    """
+
+    def __init__(self, storage, object_cache):
+        self.storage = storage
+        self.object_cache = object_cache
+        self._known_users = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def registry_key(username):
+        return f"users/{username}/user_info/registry.json"
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+
+    def _load(self, username):
+        """Return ({project_name: entry}, etag). Raises ObjectNotFound if the user has no registry."""
+        body, etag = self.object_cache.get_with_etag(self.registry_key(username))
+        return json.loads(body.decode('utf-8'))["projects"], etag
+
+    def user_exists(self, username):
+        """True if the user has a registry. Users seen before by this process are not re-checked."""
+        with self._lock:
+            if username in self._known_users:
+                return True
+        try:
+            self._load(username)
+        except ObjectNotFound:
+            return False
+        except (ValueError, KeyError) as e:
+            logging.warning(f"[UserRegistry] Unreadable registry for {username}: {e}")
+            return False
+        self._remember(username)
+        return True
+
+    def list_projects(self, username):
+        """Names of the user's projects, rebuilding the registry if it is missing or unreadable."""
+        try:
+            projects, _ = self._load(username)
+        except ObjectNotFound:
+            projects = self.rebuild(username)
+        except (ValueError, KeyError) as e:
+            logging.warning(f"[UserRegistry] Unreadable registry for {username}, rebuilding: {e}")
+            projects = self.rebuild(username)
+        return sorted(projects)
+
+    # -------------------------------------------------------------------------
+    # Creating and repairing
+    # -------------------------------------------------------------------------
+
+    def create_user(self, username):
+        """Write an empty registry for a brand-new user. Returns True on success."""
+        try:
+            self.object_cache.put(self.registry_key(username), self._serialize({}), content_type='application/json')
+        except StorageError as e:
+            logging.error(f"[UserRegistry] Failed to create registry for {username}: {e}")
+            return False
+        self._remember(username)
+        return True
+
+    def rebuild(self, username):
+        """Rebuild a user's registry from a delimited listing of their projects and return its entries."""
+        response = self.storage.list(f"users/{username}/projects/", delimiter="/")
+        projects = {prefix.split('/')[-2]: {} for prefix in response['prefixes'] if prefix.split('/')[-2]}
+        try:
+            self.object_cache.put(self.registry_key(username), self._serialize(projects), content_type='application/json')
+            self._remember(username)
+        except StorageError as e:
+            logging.error(f"[UserRegistry] Failed to write registry for {username}: {e}")
+        logging.info(f"[UserRegistry] Rebuilt registry for {username} with {len(projects)} projects")
+        return projects
+
+    # -------------------------------------------------------------------------
+    # Updates
+    # -------------------------------------------------------------------------
+
+    def add_project(self, username, project_name, project_type=None):
+        """Record that a project was created."""
+        entry = {"project_type": project_type, "created_at": datetime.now(timezone.utc).isoformat()}
+        self._update(username, lambda projects: projects.__setitem__(project_name, entry))
+
+    def remove_projects(self, username, project_names):
+        """Record that projects were deleted."""
+        def remove(projects):
+            for project_name in project_names:
+                projects.pop(project_name, None)
+        self._update(username, remove)
+
+    def _update(self, username, change):
+        """
+        Apply change(projects) to the registry with a conditional write,
+        re-reading and retrying when another process updated it first.
+        """
+        registry_key = self.registry_key(username)
+        for attempt in range(REGISTRY_UPDATE_RETRIES):
+            try:
+                projects, etag = self._load(username)
+            except ObjectNotFound:
+                # Storage already reflects the change, so a rebuild picks it up
+                self.rebuild(username)
+                return
+            except (ValueError, KeyError, StorageError) as e:
+                logging.warning(f"[UserRegistry] Could not read registry for {username}: {e}")
+                break
+
+            change(projects)
+            try:
+                self.object_cache.put(registry_key, self._serialize(projects),
+                                      content_type='application/json', if_match=etag)
+                return
+            except PreconditionFailed:
+                logging.debug(f"[UserRegistry] Registry for {username} changed, retry {attempt + 1}")
+                self.object_cache.invalidate(registry_key)
+            except StorageError as e:
+                logging.warning(f"[UserRegistry] Could not update registry for {username}: {e}")
+                break
+
+        logging.warning(f"[UserRegistry] Rebuilding registry for {username} after failed update")
+        self.object_cache.invalidate(registry_key)
+        try:
+            self.rebuild(username)
+        except StorageError as e:
+            logging.error(f"[UserRegistry] Failed to rebuild registry for {username}: {e}")
+
+    def _remember(self, username):
+        with self._lock:
+            self._known_users.add(username)
+
+    @staticmethod
+    def _serialize(projects):
+        return json.dumps({"projects": projects}, separators=(',', ':')).encode('utf-8')